@@ -5,7 +5,10 @@ Sử dụng thuật toán Expectimax với heuristic tối ưu
 
 import copy
 import random
-from config import SEARCH_DEPTH, DEBUG_MODE
+from config import SEARCH_DEPTH
+from log import get_logger
+
+logger = get_logger(__name__)
 
 
 class AISolver:
@@ -25,6 +28,7 @@ class AISolver:
         self.search_depth = search_depth
         self.initial_depth = search_depth
         self.spawn_value = spawn_value
+        self.nodes = 0  # Số node Expectimax đã duyệt trong lần get_best_move gần nhất
         self.directions = ['LEFT', 'DOWN', 'RIGHT', 'UP']
         
         # Ma trận trọng số vị trí - Ưu tiên góc DƯỚI TRÁI
@@ -53,9 +57,9 @@ class AISolver:
         """
         if 1 <= value <= 11:
             self.spawn_value = value
-            print(f"✅ Đã cập nhật spawn_value = {value}")
+            logger.info("✅ Đã cập nhật spawn_value = %d", value)
         else:
-            print(f"⚠️  Giá trị spawn phải từ 1-11")
+            logger.warning("⚠️  Giá trị spawn phải từ 1-11")
     
     def get_best_move(self, board):
         """
@@ -72,9 +76,9 @@ class AISolver:
         """
         best_move = None
         best_score = -float('inf')
+        self.nodes = 0
         
-        if DEBUG_MODE:
-            print("\n🤔 Đang tính toán nước đi tốt nhất...")
+        logger.debug("🤔 Đang tính toán nước đi tốt nhất...")
         
         # Thử từng hướng đi (Max node - người chơi)
         for direction in self.directions:
@@ -82,22 +86,19 @@ class AISolver:
             
             # Nếu board không thay đổi (nước đi không hợp lệ), bỏ qua
             if self.boards_equal(board, new_board):
-                if DEBUG_MODE:
-                    print(f"  {direction}: INVALID")
+                logger.debug("  %s: INVALID", direction)
                 continue
             
             # Gọi Expectimax với Chance node (máy spawn ô mới)
             score = self.expectimax(new_board, self.search_depth - 1, False)
             
-            if DEBUG_MODE:
-                print(f"  {direction}: {score:.0f}")
+            logger.debug("  %s: %.0f", direction, score)
             
             if score > best_score:
                 best_score = score
                 best_move = direction
         
-        if DEBUG_MODE:
-            print(f"✅ Chọn: {best_move} (điểm: {best_score:.0f})")
+        logger.debug("✅ Chọn: %s (điểm: %.0f)", best_move, best_score)
         
         return best_move
     
@@ -116,6 +117,8 @@ class AISolver:
         Returns:
             float: Điểm đánh giá
         """
+        self.nodes += 1
+        
         # Base case: Hết độ sâu hoặc game over
         if depth == 0 or self.is_terminal(board):
             return self.evaluate_board(board)
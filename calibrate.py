@@ -7,7 +7,8 @@ import cv2
 import sys
 from screen_capture import ScreenCapture
 from game_state import GameState
-from config import GRID_SIZE
+from grid_detector import GridTracker
+from config import GRID_SIZE, AUTO_GRID_DETECTION
 
 
 def calibrate():
@@ -36,18 +37,15 @@ def calibrate():
     # Khởi tạo
     screen_capture = ScreenCapture()
     game_state = GameState(GRID_SIZE)
+    grid_tracker = GridTracker(screen_capture) if AUTO_GRID_DETECTION else None
     
     print("\n📸 Đang chụp màn hình...")
     img = screen_capture.capture()
     
-    # Tiền xử lý
-    processed = screen_capture.preprocess_image(img)
-    
-    # Chia thành lưới
-    grid = screen_capture.split_into_grid(processed, GRID_SIZE)
-    
-    # Lưu ảnh gốc để hiển thị
-    grid_original = screen_capture.split_into_grid(img, GRID_SIZE)
+    # Cắt ô giống hệt lúc chạy auto (Auto2048.split_grid): template phải khớp với ô được nhận diện
+    grid_original = grid_tracker.cells(img) if grid_tracker is not None else None
+    if grid_original is None:
+        grid_original = screen_capture.split_into_grid(img, GRID_SIZE)
     
     print("\n🎓 Bắt đầu calibration...\n")
     
@@ -81,7 +79,7 @@ def calibrate():
             number = int(user_input)
             
             # Lưu template
-            game_state.recognizer.save_template(number, cell_img)
+            game_state.get_template_recognizer().save_template(number, cell_img)
             learned_count += 1
             print(f"   ✅ Đã học số {number}")
         
@@ -92,7 +90,7 @@ def calibrate():
     print(f"\n" + "="*50)
     print(f"🎉 Calibration hoàn tất!")
     print(f"📚 Đã học {learned_count} số")
-    print(f"💾 Templates đã lưu vào thư mục 'templates/'")
+    print(f"💾 Templates đã lưu vào 'templates/store_v1.npy'")
     print("="*50)
     print("\n💡 Tips:")
     print("- Chạy lại calibration để thêm số mới")
@@ -0,0 +1,411 @@
+"""
+Module chụp màn hình trong thread nền
+Chức năng: Liên tục chụp vùng game vào ring buffer cấp phát sẵn,
+vòng lặp chính lấy frame mới nhất ngay lập tức thay vì chờ chụp
+"""
+
+import threading
+import time
+from collections import deque
+import mss
+import numpy as np
+from config import (CAPTURE_BUFFER_SIZE, CAPTURE_INTERVAL, SETTLE_TIMEOUT, SETTLE_RESPONSE_TIMEOUT,
+                    SETTLE_STABLE_FRAMES, SETTLE_THRESHOLD, SETTLE_DOWNSAMPLE)
+from log import get_logger
+from screen_capture import ScreenCapture
+from frame import Frame
+
+logger = get_logger(__name__)
+
+
+class FrameRingBuffer:
+    """
+    Ring buffer các frame NumPy cấp phát sẵn
+    Mỗi slot có timestamp, số thứ tự (sequence) và cờ đã ổn định (settled).
+    Slot đang được vòng lặp chính xử lý được ghim (pinned) - producer bỏ qua slot đó
+    """
+    
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        """
+        Khởi tạo ring buffer
+        
+        Args:
+            capacity (int): Số frame giữ trong buffer
+            shape (tuple): Kích thước một frame (height, width, 4) - BGRA
+            dtype: Kiểu dữ liệu pixel
+        """
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.frames = np.empty((capacity,) + self.shape, dtype=dtype)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.sequences = np.full(capacity, -1, dtype=np.int64)
+        self.settled = np.zeros(capacity, dtype=bool)
+        self.latest_seq = -1
+        self.latest_settled_seq = -1
+        self.latest_change_seq = -1  # Frame gần nhất khác frame trước nó (màn hình đang đổi)
+        self.pinned = -1  # Index của slot đang được đọc (-1 = không có)
+    
+    def next_seq(self, seq):
+        """
+        Số thứ tự ghi tiếp theo từ seq, bỏ qua slot đang bị ghim
+        """
+        if self.capacity > 1 and seq % self.capacity == self.pinned:
+            seq += 1
+        return seq
+    
+    def pin(self, seq):
+        """
+        Ghim slot của frame seq: producer không ghi đè đến khi ghim frame khác
+        """
+        self.pinned = seq % self.capacity
+    
+    def slot(self, seq):
+        """
+        Lấy view của slot sẽ ghi frame có số thứ tự seq
+        Frame cũ trong slot bị đánh dấu không hợp lệ ngay trước khi ghi đè
+        
+        Returns:
+            numpy.ndarray: View (không copy) vào buffer
+        """
+        index = seq % self.capacity
+        self.sequences[index] = -1
+        return self.frames[index]
+    
+    def commit(self, seq, timestamp, settled, changed=False):
+        """
+        Đánh dấu frame seq đã ghi xong
+        """
+        index = seq % self.capacity
+        self.timestamps[index] = timestamp
+        self.sequences[index] = seq
+        self.settled[index] = settled
+        self.latest_seq = seq
+        if settled:
+            self.latest_settled_seq = seq
+        if changed:
+            self.latest_change_seq = seq
+    
+    def get(self, seq):
+        """
+        Lấy frame theo số thứ tự (view, không copy)
+        
+        Returns:
+            tuple: (frame, seq, timestamp), hoặc None nếu frame đã bị ghi đè
+        """
+        if seq < 0:
+            return None
+        index = seq % self.capacity
+        if self.sequences[index] != seq:
+            return None
+        return self.frames[index], seq, float(self.timestamps[index])
+    
+    def is_intact(self, seq):
+        """
+        Kiểm tra frame seq còn nguyên (chưa bị producer ghi đè) không
+        """
+        return seq >= 0 and self.sequences[seq % self.capacity] == seq
+
+
+class ThreadedCapture(ScreenCapture):
+    """
+    ScreenCapture chạy producer trong thread nền
+    Dùng thay thế trực tiếp cho ScreenCapture: capture() trả về frame mới nhất đã có sẵn
+    
+    Lưu ý: frame trả về từ capture_frame là VIEW vào ring buffer, slot của nó được ghim
+    (producer bỏ qua) đến lần capture_frame tiếp theo - nhận diện lâu bao nhiêu cũng không bị ghi đè.
+    """
+    
+    def __init__(self, region=None, capacity=CAPTURE_BUFFER_SIZE, interval=CAPTURE_INTERVAL):
+        """
+        Khởi tạo threaded capture
+        
+        Args:
+            region (dict): Vùng cần chụp (None = dùng config)
+            capacity (int): Số frame trong ring buffer
+            interval (float): Khoảng cách tối thiểu giữa 2 lần chụp (giây)
+        """
+        super().__init__(region)
+        self.capacity = capacity
+        self.interval = interval
+        self.buffer = None
+        
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._last_sample_seq = -1
+        self.last_sequence = -1
+        self.input_seq = -1  # Frame mới nhất lúc gửi phím gần nhất (frame đến số này là board cũ)
+        self._awaiting_response = False  # Chưa lấy frame nào kể từ lần gửi phím gần nhất
+        
+        # Thống kê
+        self.capture_latencies = deque(maxlen=1000)  # Thời gian grab + copy vào buffer mỗi frame (giây)
+        self.frame_ages = deque(maxlen=1000)         # Tuổi frame lúc vòng lặp chính lấy ra (giây)
+        self.frames_captured = 0
+    
+    def start(self):
+        """
+        Bắt đầu thread producer
+        """
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="capture-producer", daemon=True)
+        self._thread.start()
+        
+        logger.debug("🎥 Đã bắt đầu chụp nền (buffer %s frame, %.0fms/frame)", self.capacity, self.interval * 1000)
+    
+    def stop(self):
+        """
+        Dừng thread producer
+        """
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+    
+    def _run(self):
+        """
+        Vòng lặp producer: chụp liên tục vào ring buffer
+        """
+        # mss không an toàn giữa các thread - mỗi thread một instance riêng
+        sct = mss.mss()
+        seq = 0
+        previous_small = None
+        stable_count = 0
+        
+        try:
+            while self._running:
+                start = time.perf_counter()
+                region = self.region
+                screenshot = sct.grab(region)
+                raw = np.asarray(screenshot)
+                
+                shape = raw.shape
+                if self.buffer is None or self.buffer.shape != shape:
+                    # Vùng chụp thay đổi - cấp phát lại buffer
+                    with self._condition:
+                        self.buffer = FrameRingBuffer(self.capacity, shape)
+                    previous_small = None
+                    stable_count = 0
+                
+                # Copy BGRA thẳng vào slot (không cấp phát mới, không chuyển màu),
+                # bỏ qua slot vòng lặp chính đang đọc
+                with self._condition:
+                    seq = self.buffer.next_seq(seq)
+                    slot = self.buffer.slot(seq)
+                np.copyto(slot, raw)
+                
+                small = slot[::SETTLE_DOWNSAMPLE, ::SETTLE_DOWNSAMPLE, :3].astype(np.int16)
+                changed = self.frame_difference(small, previous_small) > SETTLE_THRESHOLD
+                stable_count = 0 if changed else stable_count + 1
+                previous_small = small
+                
+                timestamp = time.perf_counter()
+                with self._condition:
+                    self.buffer.commit(seq, timestamp, stable_count >= SETTLE_STABLE_FRAMES, changed)
+                    self._condition.notify_all()
+                
+                self.capture_latencies.append(timestamp - start)
+                self.frames_captured += 1
+                seq += 1
+                
+                remaining = self.interval - (time.perf_counter() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        
+        except Exception as e:
+            logger.error("❌ Lỗi thread chụp màn hình: %s", e)
+            self._running = False
+        
+        finally:
+            sct.close()
+    
+    def _wait_for_frame(self, after_seq, settled=False, timeout=1.0, pin=False, response_timeout=None):
+        """
+        Chờ đến khi có frame mới hơn after_seq
+        
+        Args:
+            after_seq (int): Số thứ tự frame cuối đã thấy
+            settled (bool): Chỉ nhận frame đã ổn định
+            timeout (float): Thời gian chờ tối đa (giây)
+            pin (bool): Ghim slot của frame lấy được (cùng lúc lấy, trong lock)
+            response_timeout (float): Nếu có, màn hình phải đổi sau after_seq rồi mới ổn định lại
+                (frame ổn định trước khi game phản hồi vẫn là board cũ); không đổi trong
+                khoảng này thì thôi chờ
+        
+        Returns:
+            tuple: (frame, seq, timestamp), hoặc None nếu hết thời gian
+        """
+        if not self._running:
+            self.start()
+        
+        start = time.perf_counter()
+        deadline = start + timeout
+        with self._condition:
+            while True:
+                if self.buffer is not None:
+                    seq = self.buffer.latest_settled_seq if settled else self.buffer.latest_seq
+                    if response_timeout is not None:
+                        change_seq = self.buffer.latest_change_seq
+                        if change_seq <= after_seq:
+                            if time.perf_counter() - start >= response_timeout:
+                                return None
+                            seq = -1  # Game chưa phản hồi
+                        elif seq < change_seq:
+                            seq = -1  # Chưa ổn định lại sau lần đổi gần nhất
+                    if seq > after_seq:
+                        entry = self.buffer.get(seq)
+                        if entry is not None:
+                            if pin:
+                                self.buffer.pin(seq)
+                            return entry
+                
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._running:
+                    return None
+                if response_timeout is not None:
+                    remaining = min(remaining, max(start + response_timeout - time.perf_counter(), 0.001))
+                self._condition.wait(remaining)
+    
+    def mark_input(self):
+        """
+        Ghi nhận frame mới nhất ngay trước khi gửi phím: capture_frame sau đó chỉ nhận frame
+        chụp sau lúc gửi (frame ổn định cũ hơn vẫn là board trước nước đi)
+        """
+        with self._condition:
+            if self.buffer is not None:
+                self.input_seq = self.buffer.latest_seq
+                self._awaiting_response = True
+    
+    def capture_frame(self):
+        """
+        Lấy frame ổn định mới nhất, sau lần gửi phím gần nhất thì chỉ nhận frame đã ổn định lại
+        sau khi màn hình đổi (có sẵn thì lấy ngay, chưa có thì chờ tối đa SETTLE_TIMEOUT).
+        Game không phản hồi hoặc chờ quá lâu -> lấy frame mới nhất, không lấy frame ổn định cũ hơn
+        
+        Returns:
+            Frame: Frame BGRA (view vào slot được ghim đến lần gọi tiếp theo)
+        """
+        after_seq = self.input_seq
+        if self._awaiting_response:
+            self._awaiting_response = False
+            entry = self._wait_for_frame(after_seq, settled=True, timeout=SETTLE_TIMEOUT, pin=True,
+                                         response_timeout=SETTLE_RESPONSE_TIMEOUT)
+        else:
+            entry = self._wait_for_frame(after_seq, settled=True, timeout=0.0, pin=True)
+        if entry is None:
+            # Chưa có frame ổn định nào sau lần gửi phím - lấy frame mới nhất
+            entry = self._wait_for_frame(after_seq, settled=False, pin=True)
+        if entry is None:
+            # Thread không chạy được - chụp đồng bộ như ScreenCapture
+            return super().capture_frame()
+        
+        raw, seq, timestamp = entry
+        self.last_sequence = seq
+        self.frame_ages.append(time.perf_counter() - timestamp)
+        
+        logger.debug("📸 Frame #%s từ buffer (tuổi %.1fms)", seq, self.frame_ages[-1] * 1000)
+        
+        return Frame(raw, timestamp=timestamp)
+    
+    def capture(self):
+        """
+        Lấy frame mới nhất dạng BGR (tương thích ScreenCapture.capture)
+        
+        Returns:
+            numpy.ndarray: Ảnh BGR (copy)
+        """
+        return self.capture_frame().bgr
+    
+    def snapshot(self, downsample=SETTLE_DOWNSAMPLE):
+        """
+        Ảnh thu nhỏ của frame mới nhất trong buffer
+        
+        Returns:
+            numpy.ndarray: Ảnh BGR thu nhỏ (int16)
+        """
+        entry = self._wait_for_frame(-1)
+        if entry is None:
+            return super().snapshot(downsample)
+        
+        frame, seq, _ = entry
+        self._last_sample_seq = seq
+        return frame[::downsample, ::downsample, :3].astype(np.int16)
+    
+    def _settle_sample(self):
+        """
+        Settle detection lấy lần lượt từng frame mới từ producer thay vì tự chụp
+        """
+        entry = self._wait_for_frame(self._last_sample_seq)
+        if entry is None:
+            return super().snapshot()
+        
+        frame, seq, _ = entry
+        self._last_sample_seq = seq
+        return frame[::SETTLE_DOWNSAMPLE, ::SETTLE_DOWNSAMPLE, :3].astype(np.int16)
+    
+    def wait_until_settled(self, reference=None, **kwargs):
+        """
+        Như ScreenCapture.wait_until_settled nhưng không sleep giữa các lần lấy mẫu
+        (đã chờ frame mới từ producer)
+        """
+        kwargs.setdefault('poll_interval', 0.0)
+        return super().wait_until_settled(reference, **kwargs)
+    
+    def wait_for_change(self, reference, **kwargs):
+        """
+        Như ScreenCapture.wait_for_change, lấy mẫu từ frame mới của producer
+        """
+        kwargs.setdefault('poll_interval', 0.0)
+        return super().wait_for_change(reference, **kwargs)
+    
+    def is_intact(self, seq=None):
+        """
+        Kiểm tra frame lấy gần nhất còn nguyên trong buffer không
+        
+        Args:
+            seq (int): Số thứ tự frame (None = frame lấy gần nhất)
+        """
+        if self.buffer is None:
+            return False
+        return self.buffer.is_intact(self.last_sequence if seq is None else seq)
+    
+    def get_stats(self):
+        """
+        Thống kê độ trễ chụp và tuổi frame
+        
+        Returns:
+            dict: avg/max latency và age (ms), số frame đã chụp
+        """
+        def summarize(values):
+            if not values:
+                return 0.0, 0.0
+            return sum(values) / len(values) * 1000, max(values) * 1000
+        
+        avg_latency, max_latency = summarize(self.capture_latencies)
+        avg_age, max_age = summarize(self.frame_ages)
+        return {
+            'frames_captured': self.frames_captured,
+            'avg_capture_ms': avg_latency,
+            'max_capture_ms': max_latency,
+            'avg_frame_age_ms': avg_age,
+            'max_frame_age_ms': max_age,
+        }
+
+
+# Hàm tiện ích để test module
+if __name__ == "__main__":
+    print("🧪 Testing ThreadedCapture module...")
+    
+    capture = ThreadedCapture()
+    capture.start()
+    time.sleep(1.0)
+    
+    img = capture.capture()
+    print(f"Frame: {img.shape}, còn nguyên: {capture.is_intact()}")
+    
+    capture.stop()
+    print(f"📊 Thống kê: {capture.get_stats()}")
+    print("✅ Test hoàn thành!")
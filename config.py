@@ -19,23 +19,178 @@ SCREEN_REGION = {
 # Kích thước lưới game
 GRID_SIZE = 4  # Lưới 4x4
 
+# Tự động tìm lưới trong ảnh chụp và chỉ nhận diện phần bên trong mỗi ô
+# (bỏ viền/khe hở). Templates có sẵn chụp cả ô - chạy lại calibrate.py sau khi bật
+AUTO_GRID_DETECTION = False
+GRID_INNER_MARGIN = 0.08        # Tỉ lệ cắt bỏ mỗi cạnh ô (góc bo tròn, viền)
+GRID_CHECK_INTERVAL = 10        # Kiểm tra lưới có bị di chuyển mỗi N frame
+GRID_CHECK_TOLERANCE = 30.0     # Sai khác màu tối đa (0-255) tại khe hở giữa các ô
+GRID_CAPTURE_MARGIN = 4         # Thu gọn vùng chụp quanh lưới, giữ lề N pixel (None = không thu gọn)
+GRID_CACHE_FILE = 'grid_layout.json'  # File lưu vị trí lưới giữa các lần chạy, None = không lưu
+
 # Độ sâu tìm kiếm cho thuật toán AI
 # Tăng lên 5 để AI dự đoán xa hơn và tránh bị kẹt
 SEARCH_DEPTH = 5  # Tìm kiếm sâu 5 bước (có thể giảm xuống 3-4 nếu chậm)
 
-# Thời gian chờ giữa các nước đi (giây)
+# Thời gian chờ giữa các nước đi (giây) - giá trị khởi đầu nếu bật ADAPTIVE_MOVE_DELAY
 # Template Matching: 0.2s (rất nhanh, offline)
 # Gemini: 1.0s (tránh rate limit 15 req/min)
 MOVE_DELAY = 0.2
 
+# MOVE_DELAY tự học (khi SETTLE_DETECTION = False): một số nước đi được đo thời gian game phản hồi phím
+# và thời gian animation từ sự thay đổi của frame, các nước còn lại chỉ sleep delay đã học
+# delay = p95(phản hồi + animation) x (1 + biên an toàn); frame chụp giữa animation -> tăng delay
+# và giữ mức đó làm sàn, sàn giảm dần sau mỗi lần đo (lần đo kế tiếp không xóa ngay mức đã tăng)
+ADAPTIVE_MOVE_DELAY = True
+MOVE_DELAY_MARGIN = 0.25        # Biên an toàn (+25%)
+MOVE_DELAY_MIN = 0.02           # Giới hạn dưới của delay tự học (giây)
+MOVE_DELAY_MAX = 1.5            # Giới hạn trên của delay tự học (giây)
+MOVE_DELAY_WINDOW = 50          # Số lần đo gần nhất để tính p95
+MOVE_DELAY_PROBE_EVERY = 10     # Đo lại mỗi N nước đi (MOVE_DELAY_WARMUP nước đầu luôn đo)
+MOVE_DELAY_WARMUP = 5
+MOVE_DELAY_BACKOFF_DECAY = 0.9  # Sàn do backoff giảm còn x0.9 sau mỗi lần đo
+
+# Settle detection - chờ đến khi animation kết thúc thay vì sleep cố định
+# Khi bật: bỏ MOVE_DELAY, pyautogui.PAUSE và sleep trong vòng lặp auto
+SETTLE_DETECTION = True
+SETTLE_TIMEOUT = 1.0            # Thời gian chờ tối đa (giây)
+SETTLE_RESPONSE_TIMEOUT = 0.3   # Chờ tối đa để game bắt đầu phản hồi phím (giây)
+SETTLE_POLL_INTERVAL = 0.01     # Khoảng cách giữa 2 lần chụp (giây)
+SETTLE_STABLE_FRAMES = 2        # Số frame liên tiếp không đổi để coi là đã ổn định
+SETTLE_THRESHOLD = 2.0          # Sai khác trung bình (0-255) tối đa giữa 2 frame ổn định
+SETTLE_DOWNSAMPLE = 8           # Lấy 1 pixel mỗi N pixel khi so sánh frame
+
+# Phát hiện phím bị rơi: sau khi gửi phím, so sánh từng ô của ảnh thu nhỏ với ảnh trước nước đi -
+# không ô nào đổi và board chắc chắn vẫn như cũ thì gửi lại phím ngay (không nhận diện/tìm kiếm lại)
+MISSED_MOVE_DETECTION = False   # Tắt mặc định cho đến khi được kiểm chứng trên game thật
+MISSED_MOVE_TIMEOUT = 0.15      # Chờ màn hình thay đổi tối đa (giây) trước khi coi là phím bị rơi
+MISSED_MOVE_THRESHOLD = 8.0     # Sai khác trung bình của một ô để coi là ô đó đã thay đổi (0-255)
+MISSED_MOVE_RETRIES = 2         # Số lần gửi lại tối đa (vẫn không đổi -> nhận diện lại toàn bộ)
+MISSED_MOVE_BACKOFF = 0.02      # Chờ trước lần gửi lại đầu tiên (giây), gấp đôi mỗi lần sau
+
+# Backend chụp màn hình và gửi phím (chọn lúc khởi động)
+# 'mss' + 'pyautogui': màn hình thật
+# 'xtest' (input): gửi phím qua XTest (X11, cần python-xlib) - không có pause cố định như pyautogui
+# 'synthetic': game giả lập vẽ từ templates, chạy headless (benchmark/CI - xem synthetic_game.py)
+CAPTURE_BACKEND = 'mss'
+INPUT_BACKEND = 'pyautogui'
+XTEST_DISPLAY = None            # Display X cho backend 'xtest' (None = biến môi trường DISPLAY)
+XTEST_KEY_HOLD = 0.0            # Thời gian giữ phím giữa key-down và key-up (giây)
+XTEST_FAILSAFE = True           # Chuột ở góc trên trái màn hình -> dừng khẩn cấp (như pyautogui.FAILSAFE)
+SYNTHETIC_DROP_RATE = 0.0       # Tỉ lệ phím bị rơi của input 'synthetic' (thử phát hiện phím bị rơi)
+SYNTHETIC_RESPONSE_TIME = 0.0   # Game giả lập: thời gian trước khi phản hồi phím (giây)
+SYNTHETIC_ANIMATION_TIME = 0.0  # Game giả lập: thời gian animation chuyển board (giây, 0 = không có)
+
+# Chụp màn hình trong thread nền (ring buffer) - vòng lặp lấy frame có sẵn thay vì chờ chụp
+THREADED_CAPTURE = False
+CAPTURE_BUFFER_SIZE = 16        # Số frame trong ring buffer
+CAPTURE_INTERVAL = 0.01         # Khoảng cách tối thiểu giữa 2 lần chụp (giây)
+
+# Vòng lặp auto dạng pipeline (asyncio - xem pipeline.py): chụp/nhận diện, tìm kiếm,
+# gửi phím và log chạy thành các stage nối bằng hàng đợi giới hạn
+PIPELINED_LOOP = False
+PIPELINE_QUEUE_SIZE = 1         # Số phần tử tối đa trong hàng đợi giữa 2 stage
+PIPELINE_LOG_QUEUE_SIZE = 256   # Hàng đợi log (đầy thì bỏ log, không chặn vòng lặp)
+PIPELINE_SPECULATIVE = True     # Tìm kiếm trước các board có thể xuất hiện trong lúc chờ animation
+
+# Ghi lại mỗi vòng lặp của chế độ auto (frame, board, nước đi, thời gian) để replay offline:
+#   python session_recorder.py replay recordings/session_....rec
+RECORD_SESSIONS = False
+RECORDING_DIR = 'recordings'
+
+# Metrics từng nước đi (metrics.py): thời gian capture/tiền xử lý/nhận diện/tìm kiếm/gửi phím/chờ,
+# số node và độ sâu tìm kiếm. Xuất JSON lines (mỗi nước 1 dòng) và file Prometheus (textfile collector)
+METRICS_ENABLED = False
+METRICS_JSONL_FILE = 'metrics/moves.jsonl'     # None = không ghi
+METRICS_PROM_FILE = 'metrics/auto2048.prom'    # None = không ghi
+METRICS_FLUSH_INTERVAL = 5.0    # Ghi lại file Prometheus (và flush JSON lines) mỗi N giây
+METRICS_WINDOW = 500            # Số nước đi gần nhất để tính p50/p95/p99
+METRICS_INSTANCE = None         # Nhãn instance của bot (None = tên máy)
+
 # Ngưỡng độ tin cậy khi nhận diện số
 OCR_CONFIDENCE_THRESHOLD = 0.5
 
-# Debug mode - hiển thị ảnh và thông tin chi tiết
-DEBUG_MODE = True
+# Template store - nhiều mẫu cho mỗi số, lưu trong 1 bundle (templates/store_v1.npy)
+TEMPLATE_MAX_PER_VALUE = 8      # Số mẫu tối đa cho mỗi số (loại mẫu dư thừa nhất khi vượt)
+TEMPLATE_DEDUP_THRESHOLD = 6.0  # Sai khác trung bình (0-255) dưới ngưỡng này coi là mẫu trùng
+TEMPLATE_FLUSH_INTERVAL = 2.0   # Gom các lần học mẫu và ghi file sau N giây (thread nền)
+
+# Classifier nhỏ (NumPy) train từ template store: python tiny_classifier.py train [corpus_dir]
+# Dùng làm backend 'classifier' (vd. AI_MODEL = 'classifier' hoặc đầu CASCADE_ORDER)
+CLASSIFIER_FILE = 'templates/classifier_v1.npz'
+CLASSIFIER_AUGMENT = 20         # Số biến thể (dịch, độ sáng, nhiễu) tạo thêm cho mỗi mẫu khi train
+CLASSIFIER_HOLDOUT = 0.2        # Tỉ lệ corpus giữ lại để đánh giá (không dùng khi train)
+
+# PaddleOCR: nhận diện 1 batch tất cả ô không trống (chỉ model recognition, không detection)
+PADDLE_BATCHED = True           # False = gọi OCR đầy đủ cho từng ô (cách cũ, chậm)
+PADDLE_WARMUP = True            # Chạy thử model lúc khởi động để lần nhận diện đầu không bị chậm
+
+# Chạy recognizer nặng trong tiến trình con (frame chuyển qua shared memory)
+# vd. ['paddle'] - PaddleOCR không chiếm GIL/bộ nhớ của vòng lặp chính, chết thì tự khởi động lại
+RECOGNIZER_WORKER_BACKENDS = []
+WORKER_REQUEST_TIMEOUT = 5.0    # Thời gian chờ kết quả tối đa (giây), quá thì khởi động lại worker
+WORKER_MAX_RESTARTS = 3         # Số lần khởi động lại tối đa trước khi tắt backend
+
+# Cấp độ log: 'DEBUG' (chi tiết từng bước + lưu ảnh debug), 'INFO' (mỗi nước đi), 'WARNING', 'ERROR'
+# Log được ghi bởi thread nền - cấp độ tắt gần như không tốn thời gian của vòng lặp chính
+LOG_LEVEL = 'INFO'
+LOG_FILE = None                 # vd. 'auto2048.log' - ghi thêm log ra file (có thời gian/cấp độ/module)
+
+# Frame debug: giữ các frame gần nhất trong RAM, thread nền chỉ ghi ra đĩa khi có bất thường
+# (nhận diện lỗi, tracking lệch, nước đi chậm) hoặc theo tỉ lệ lấy mẫu - luôn bật khi LOG_LEVEL = 'DEBUG'
+DEBUG_FRAMES = False
+DEBUG_FRAMES_DIR = 'debug_frames'
+DEBUG_FRAME_BUFFER = 16         # Số frame gần nhất giữ trong RAM (ghi ra cùng frame bất thường)
+DEBUG_FRAME_SAMPLE_EVERY = 100  # Ghi 1 frame mỗi N frame (0 = chỉ ghi khi bất thường)
+DEBUG_SLOW_MOVE = 1.0           # Nước đi (chụp -> gửi phím xong) lâu hơn (giây) bị coi là bất thường
+DEBUG_FRAME_QUOTA_MB = 200      # Dung lượng tối đa của thư mục - vượt thì xóa file cũ nhất
+DEBUG_PNG_COMPRESSION = None    # Mức nén PNG 0-9, None = mặc định của OpenCV (nén RLE - nhanh nhất khi đo)
 
 # AI Model cho nhận diện số
 # Có 2 options:
 # 'gemini' - Chính xác cao (95-98%), chậm ~2s/move, cần internet, quota limited
 # 'template' - Template Matching, nhanh, offline, phù hợp cho icon/hình ảnh (KHUYẾN NGHỊ!)
 AI_MODEL = 'template'  # Mặc định dùng Template Matching (tốt nhất cho icon game)
+
+# Chuỗi recognizer dự phòng: model chọn ở trên chạy trước, các backend dưới đây
+# được thử theo độ trễ đo được khi model chính lỗi (khởi tạo khi cần)
+RECOGNIZER_FALLBACKS = ['template', 'paddle']
+CIRCUIT_FAILURE_THRESHOLD = 3   # Số lần lỗi liên tiếp để ngắt backend
+CIRCUIT_RESET_TIMEOUT = 30.0    # Thời gian ngắt trước khi thử lại 1 lần (giây)
+
+# Chế độ nhận diện: 'chain' - chạy 1 backend cho cả board (dự phòng khi lỗi)
+#                   'cascade' - backend rẻ chạy trước, chỉ ô có độ tin cậy thấp mới
+#                               được chuyển lên backend chậm hơn (template -> paddle -> gemini)
+RECOGNITION_MODE = 'chain'
+CASCADE_ORDER = ['template', 'paddle', 'gemini']
+CASCADE_CONFIDENCE_THRESHOLD = 0.6  # Ô có độ tin cậy dưới ngưỡng được chuyển lên backend tiếp theo
+TEMPLATE_CONFIDENCE_MARGIN = 0.15   # Chênh lệch điểm với số tốt thứ 2 để template tin cậy hoàn toàn
+GEMINI_CONFIDENCE = 0.9             # Gemini không trả điểm số - độ tin cậy mặc định cho mỗi ô
+# Độ trễ tối đa của từng backend (giây) - chậm hơn coi như lỗi (vẫn dùng kết quả)
+RECOGNIZER_SLOW_THRESHOLD = {'gemini': 10.0, 'paddle': 3.0, 'template': 1.0}
+
+# Client Gemini bất đồng bộ: giới hạn tốc độ (token bucket), deadline, retry
+GEMINI_RATE_LIMIT = 15          # Số request tối đa mỗi phút (quota free tier)
+GEMINI_RATE_BURST = 2           # Số request được dồn liên tiếp
+GEMINI_REQUEST_DEADLINE = 8.0   # Thời gian tối đa cho mỗi lần gọi API (giây)
+GEMINI_MAX_RETRIES = 2          # Số lần thử lại khi lỗi/quá deadline
+GEMINI_BACKOFF_BASE = 0.5       # Thời gian chờ cơ sở cho backoff có jitter (giây)
+GEMINI_MAX_CONCURRENCY = 2      # Số request song song tối đa
+
+# Ảnh gửi Gemini: cắt lưới, thu nhỏ và nén (chạy 'python gemini_recognizer.py sweep corpus/'
+# để tìm cấu hình nhỏ nhất vẫn nhận diện đúng)
+GEMINI_PAYLOAD_SIZE = 384       # Cạnh dài nhất (pixel), None = giữ nguyên kích thước chụp
+GEMINI_PAYLOAD_FORMAT = 'jpeg'  # 'jpeg' hoặc 'png'
+GEMINI_PAYLOAD_QUALITY = 80     # Chất lượng JPEG (1-100)
+
+# Cache kết quả Gemini theo perceptual hash của ảnh lưới (frame không đổi = không gọi API)
+GEMINI_CACHE_ENABLED = True
+GEMINI_CACHE_TTL = 600                      # Thời gian sống của kết quả (giây), None = không hết hạn
+GEMINI_CACHE_MAX_ENTRIES = 512              # Số kết quả tối đa (LRU)
+GEMINI_CACHE_FILE = 'gemini_cache.json'     # File lưu cache giữa các lần chạy, None = chỉ trong RAM
+
+# Board tracking - dự đoán board sau mỗi nước đi (afterstate từ AISolver.move)
+# Chỉ nhận diện ô mới spawn, nhận diện lại toàn bộ 16 ô khi dự đoán sai (desync)
+BOARD_TRACKING = True
+# Sai khác trung bình tối đa (0-255) giữa chữ ký ô và chữ ký của giá trị dự đoán
+TRACKING_CELL_TOLERANCE = 18.0
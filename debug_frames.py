@@ -0,0 +1,157 @@
+"""
+Module ghi frame debug ở thread nền
+Giữ N frame gần nhất trong RAM (ring buffer) và chỉ ghi ra đĩa khi:
+    - có bất thường: không backend nào nhận diện được (misread), tracking lệch (desync),
+      nước đi chậm (slow), game không phản hồi phím (missed)
+      -> ghi cả ring buffer để xem được các frame dẫn đến lỗi
+    - theo tỉ lệ lấy mẫu (1 frame mỗi DEBUG_FRAME_SAMPLE_EVERY frame)
+Nén PNG nhanh và giới hạn dung lượng thư mục - vượt quota thì xóa file cũ nhất.
+Vòng lặp chính chỉ copy frame vào RAM, không bao giờ chờ encode PNG hay ghi đĩa.
+"""
+
+import atexit
+import queue
+import threading
+from collections import deque
+from pathlib import Path
+import cv2
+from config import (DEBUG_FRAMES_DIR, DEBUG_FRAME_BUFFER, DEBUG_FRAME_SAMPLE_EVERY,
+                    DEBUG_SLOW_MOVE, DEBUG_FRAME_QUOTA_MB, DEBUG_PNG_COMPRESSION)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class DebugFrameSink:
+    """
+    Bộ ghi frame debug: add() mỗi frame (chỉ copy vào ring buffer),
+    thread nền encode PNG và ghi ra đĩa
+    """
+    
+    def __init__(self, directory=DEBUG_FRAMES_DIR, buffer_size=DEBUG_FRAME_BUFFER,
+                 sample_every=DEBUG_FRAME_SAMPLE_EVERY, slow_move=DEBUG_SLOW_MOVE,
+                 quota_mb=DEBUG_FRAME_QUOTA_MB, compression=DEBUG_PNG_COMPRESSION):
+        """
+        Args:
+            directory (str): Thư mục ghi ảnh
+            buffer_size (int): Số frame gần nhất giữ trong RAM
+            sample_every (int): Ghi 1 frame mỗi N frame (0 = chỉ ghi khi bất thường)
+            slow_move (float): Nước đi lâu hơn (giây) bị coi là bất thường
+            quota_mb (float): Dung lượng tối đa của thư mục (MB)
+            compression (int): Mức nén PNG 0-9 (None = mặc định của OpenCV)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sample_every = sample_every
+        self.slow_move = slow_move
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.params = [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, compression]
+        
+        self.ring = deque(maxlen=buffer_size)  # (seq, nước đi, ảnh)
+        self.seq = 0
+        self._last_written = 0  # seq lớn nhất đã đưa vào hàng đợi ghi (không ghi trùng)
+        self.stats = {'frames': 0, 'sampled': 0, 'written': 0, 'dropped': 0, 'deleted': 0}
+        self.anomalies = {}     # {lý do: số lần}
+        
+        # File cũ (của các lần chạy trước) cũng tính vào quota, cũ nhất bị xóa trước
+        files = sorted(self.directory.glob('*.png'), key=lambda path: path.stat().st_mtime)
+        self._files = deque((path, path.stat().st_size) for path in files)
+        self.bytes_used = sum(size for _, size in self._files)
+        
+        self._queue = queue.Queue(maxsize=max(2 * buffer_size, 8))
+        self._thread = threading.Thread(target=self._writer, name="debug-frames", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def add(self, img, move, reason=None):
+        """
+        Đưa frame vào ring buffer (copy - frame có thể là view vào ring buffer của capture)
+        
+        Args:
+            img (numpy.ndarray): Ảnh vùng game
+            move (int): Số nước đi hiện tại
+            reason (str): Lý do bất thường của frame này (None = bình thường)
+        """
+        self.seq += 1
+        self.stats['frames'] += 1
+        self.ring.append((self.seq, move, img.copy()))
+        
+        if reason is not None:
+            self.flag(reason)
+        elif self.sample_every and self.seq % self.sample_every == 0:
+            self.stats['sampled'] += 1
+            self._enqueue(self.ring[-1], 'sample')
+    
+    def check_move(self, seconds):
+        """
+        Nước đi (từ lúc chụp đến khi gửi phím xong) quá chậm -> ghi ring buffer
+        
+        Args:
+            seconds (float): Tổng thời gian của nước đi
+        """
+        if self.slow_move and seconds > self.slow_move:
+            self.flag('slow')
+    
+    def flag(self, reason):
+        """
+        Ghi các frame trong ring buffer chưa được ghi (frame cuối mang lý do, các frame trước là ngữ cảnh)
+        
+        Args:
+            reason (str): 'misread', 'desync', 'slow', ...
+        """
+        self.anomalies[reason] = self.anomalies.get(reason, 0) + 1
+        logger.debug("🐞 Bất thường (%s) - ghi %d frame gần nhất", reason, len(self.ring))
+        for index, entry in enumerate(self.ring):
+            self._enqueue(entry, reason if index == len(self.ring) - 1 else f"pre-{reason}")
+    
+    def _enqueue(self, entry, tag):
+        seq = entry[0]
+        if seq <= self._last_written:
+            return
+        try:
+            self._queue.put_nowait((entry, tag))
+            self._last_written = seq
+        except queue.Full:
+            # Không bao giờ chặn vòng lặp chính - đĩa chậm thì bỏ frame
+            self.stats['dropped'] += 1
+    
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            (seq, move, img), tag = item
+            path = self.directory / f"{seq:06d}_move{move:05d}_{tag}.png"
+            try:
+                if not cv2.imwrite(str(path), img, self.params):
+                    raise OSError(f"cv2.imwrite thất bại: {path}")
+                size = path.stat().st_size
+            except OSError as e:
+                logger.warning("❌ Lỗi ghi frame debug: %s", e)
+                continue
+            
+            self.stats['written'] += 1
+            self._files.append((path, size))
+            self.bytes_used += size
+            while self.bytes_used > self.quota_bytes and len(self._files) > 1:
+                old_path, old_size = self._files.popleft()
+                old_path.unlink(missing_ok=True)
+                self.bytes_used -= old_size
+                self.stats['deleted'] += 1
+    
+    def get_stats(self):
+        """
+        Thống kê bộ ghi frame debug
+        
+        Returns:
+            dict: frames, sampled, written, dropped, deleted, anomalies, mb_used
+        """
+        return {**self.stats, 'anomalies': dict(self.anomalies), 'mb_used': self.bytes_used / (1024 * 1024)}
+    
+    def close(self, timeout=5.0):
+        """
+        Ghi nốt các frame đang chờ và dừng thread nền
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
@@ -0,0 +1,101 @@
+"""
+Module Frame - một lần chụp màn hình với bước chuyển màu lười (lazy)
+Chức năng: Bọc buffer BGRA của mss không copy; các recognizer nhận ô là view BGRA
+và tự xử lý, ảnh BGR chỉ được tạo khi cần, thời gian từng bước được ghi lại
+"""
+
+import time
+import numpy as np
+import cv2
+
+
+class Frame:
+    """
+    Một frame chụp màn hình dạng BGRA (view vào buffer của mss, không copy)
+    Bước chuyển sang BGR chỉ chạy khi được truy cập lần đầu
+    """
+    
+    def __init__(self, raw, timestamp=None, capture_time=0.0):
+        """
+        Khởi tạo Frame
+        
+        Args:
+            raw (numpy.ndarray): Ảnh BGRA (height, width, 4)
+            timestamp (float): Thời điểm chụp (time.perf_counter), None = bây giờ
+            capture_time (float): Thời gian chụp (giây)
+        """
+        self.raw = raw
+        self.timestamp = time.perf_counter() if timestamp is None else timestamp
+        self.timings = {'capture': capture_time}  # {tên bước: giây}
+        self._stages = {}
+    
+    @classmethod
+    def from_screenshot(cls, screenshot, capture_time=0.0):
+        """
+        Bọc ScreenShot của mss thành Frame mà không copy pixel
+        
+        Args:
+            screenshot: Kết quả của mss.grab()
+            capture_time (float): Thời gian chụp (giây)
+        
+        Returns:
+            Frame: Frame trỏ thẳng vào buffer BGRA của mss
+        """
+        raw = np.frombuffer(screenshot.raw, dtype=np.uint8)
+        raw = raw.reshape(screenshot.height, screenshot.width, 4)
+        return cls(raw, capture_time=capture_time)
+    
+    @property
+    def shape(self):
+        """
+        Kích thước ảnh (height, width, 4)
+        """
+        return self.raw.shape
+    
+    def _stage(self, name, compute):
+        """
+        Chạy một bước xử lý nếu chưa có, ghi lại thời gian
+        
+        Args:
+            name (str): Tên bước
+            compute (callable): Hàm tính kết quả
+        
+        Returns:
+            numpy.ndarray: Kết quả của bước
+        """
+        result = self._stages.get(name)
+        if result is None:
+            start = time.perf_counter()
+            result = compute()
+            self.timings[name] = time.perf_counter() - start
+            self._stages[name] = result
+        return result
+    
+    @property
+    def bgr(self):
+        """
+        Ảnh BGR (OpenCV format) - copy, chỉ tạo khi cần
+        """
+        return self._stage('bgr', lambda: cv2.cvtColor(self.raw, cv2.COLOR_BGRA2BGR))
+    
+    def cells(self, grid_size=4, source=None):
+        """
+        Chia frame thành lưới các ô - mỗi ô là VIEW, không copy
+        
+        Args:
+            grid_size (int): Kích thước lưới
+            source (numpy.ndarray): Ảnh để cắt (None = ảnh BGRA gốc)
+        
+        Returns:
+            list: Danh sách các ô ảnh [row][col]
+        """
+        img = self.raw if source is None else source
+        height, width = img.shape[:2]
+        cell_height = height // grid_size
+        cell_width = width // grid_size
+        
+        return [
+            [img[row * cell_height:(row + 1) * cell_height, col * cell_width:(col + 1) * cell_width]
+             for col in range(grid_size)]
+            for row in range(grid_size)
+        ]
@@ -0,0 +1,108 @@
+"""
+Module bộ ảnh có nhãn (labeled frame corpus)
+Mỗi mẫu gồm ảnh lưới game (PNG) và board đúng (JSON) cùng tên:
+    corpus/frame_0001.png + corpus/frame_0001.json ({"board": [[...], ...]})
+"""
+
+import json
+import zlib
+from pathlib import Path
+import cv2
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+def save_labeled_frame(directory, img, board, name=None):
+    """
+    Lưu một ảnh kèm board đúng vào corpus
+    
+    Args:
+        directory (str): Thư mục corpus
+        img (numpy.ndarray): Ảnh lưới BGR hoặc BGRA
+        board (list): Board 4x4 đúng
+        name (str): Tên mẫu (None = tự đánh số)
+    
+    Returns:
+        Path: Đường dẫn file ảnh đã lưu
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    if name is None:
+        name = f"frame_{len(list(directory.glob('frame_*.png'))) + 1:04d}"
+    
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    
+    image_file = directory / f"{name}.png"
+    cv2.imwrite(str(image_file), img)
+    with open(directory / f"{name}.json", 'w') as f:
+        json.dump({'board': board}, f)
+    
+    return image_file
+
+
+def load_corpus(directory):
+    """
+    Load toàn bộ corpus
+    
+    Args:
+        directory (str): Thư mục corpus
+    
+    Returns:
+        list: Danh sách (tên, ảnh BGR, board đúng)
+    """
+    samples = []
+    for image_file in sorted(Path(directory).glob("*.png")):
+        label_file = image_file.with_suffix(".json")
+        if not label_file.exists():
+            continue
+        
+        img = cv2.imread(str(image_file))
+        if img is None:
+            continue
+        
+        with open(label_file, 'r') as f:
+            board = json.load(f)['board']
+        samples.append((image_file.stem, img, board))
+    
+    logger.debug("📚 Đã load %s mẫu từ corpus %s", len(samples), directory)
+    
+    return samples
+
+
+def split_corpus(samples, holdout=0.2):
+    """
+    Chia corpus thành phần train và phần giữ lại để đánh giá (held-out)
+    Chia theo hash tên mẫu: ổn định giữa các lần chạy và khi corpus có thêm mẫu mới
+    
+    Args:
+        samples (list): Danh sách (tên, ảnh, board) từ load_corpus
+        holdout (float): Tỉ lệ mẫu giữ lại (0-1)
+    
+    Returns:
+        tuple: (mẫu train, mẫu held-out)
+    """
+    train, test = [], []
+    for sample in samples:
+        bucket = zlib.crc32(sample[0].encode('utf-8')) % 1000
+        (test if bucket < holdout * 1000 else train).append(sample)
+    return train, test
+
+
+def split_cells(img, grid_size=4):
+    """
+    Chia ảnh lưới thành danh sách ô 1D (view, không copy) theo thứ tự hàng
+    
+    Args:
+        img (numpy.ndarray): Ảnh lưới
+        grid_size (int): Kích thước lưới
+    
+    Returns:
+        list: grid_size * grid_size ảnh ô
+    """
+    cell_height = img.shape[0] // grid_size
+    cell_width = img.shape[1] // grid_size
+    return [img[row * cell_height:(row + 1) * cell_height, col * cell_width:(col + 1) * cell_width]
+            for row in range(grid_size) for col in range(grid_size)]
@@ -1,11 +1,287 @@
 """
 Module điều khiển game
 Chức năng: Gửi phím mũi tên để điều khiển game
+Input backend chọn lúc khởi động (INPUT_BACKEND): 'pyautogui', 'xtest' (X11, độ trễ thấp)
+hoặc 'synthetic' (game giả lập)
+Đo độ trễ gửi phím (chạy được trên Xvfb):
+    
+    xvfb-run python game_controller.py latency xtest 200
 """
 
-import pyautogui
+import sys
 import time
-from config import MOVE_DELAY, DEBUG_MODE
+from collections import deque
+from config import (MOVE_DELAY, INPUT_BACKEND, XTEST_DISPLAY, XTEST_KEY_HOLD, XTEST_FAILSAFE,
+                    MOVE_DELAY_MARGIN, MOVE_DELAY_MIN, MOVE_DELAY_MAX, MOVE_DELAY_WINDOW,
+                    MOVE_DELAY_PROBE_EVERY, MOVE_DELAY_WARMUP, MOVE_DELAY_BACKOFF_DECAY)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class InputAborted(Exception):
+    """
+    Người dùng dừng khẩn cấp (vd. FailSafe của pyautogui)
+    """
+
+
+class PyAutoGUIInput:
+    """
+    Input backend dùng pyautogui (cần màn hình thật)
+    """
+    
+    name = 'pyautogui'
+    failsafe = True  # Di chuột lên góc trên trái màn hình để dừng khẩn cấp
+    
+    def __init__(self, key_pause=0.1):
+        """
+        Args:
+            key_pause (float): pyautogui.PAUSE - thời gian chờ sau mỗi lệnh pyautogui
+        """
+        import pyautogui
+        self.pyautogui = pyautogui
+        
+        # Cấu hình pyautogui
+        pyautogui.PAUSE = key_pause  # Thời gian chờ giữa các lệnh pyautogui
+        pyautogui.FAILSAFE = True  # Di chuột lên góc màn hình để dừng khẩn cấp
+    
+    def press(self, key):
+        try:
+            self.pyautogui.press(key)
+        except self.pyautogui.FailSafeException as e:
+            raise InputAborted(str(e)) from e
+    
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+    
+    def size(self):
+        return self.pyautogui.size()
+    
+    def position(self):
+        return self.pyautogui.position()
+
+
+class XTestInput:
+    """
+    Input backend gửi phím qua extension XTest của X server
+    Giữ 1 kết nối X suốt phiên, không có pause cố định như pyautogui.PAUSE,
+    đo độ trễ gửi mỗi phím (từ lúc gửi key-down đến khi server xác nhận key-up)
+    """
+    
+    name = 'xtest'
+    
+    # Tên phím (pyautogui) -> keysym X11
+    KEYSYMS = {'up': 'Up', 'down': 'Down', 'left': 'Left', 'right': 'Right'}
+    
+    def __init__(self, display=XTEST_DISPLAY, key_hold=XTEST_KEY_HOLD, failsafe=XTEST_FAILSAFE, history=256):
+        """
+        Mở kết nối X
+        
+        Args:
+            display (str): Tên display X (None = biến môi trường DISPLAY)
+            key_hold (float): Thời gian giữ phím giữa key-down và key-up (giây)
+            failsafe (bool): Dừng khẩn cấp khi chuột ở góc trên trái màn hình
+            history (int): Số lần đo độ trễ gần nhất được giữ lại
+        """
+        from Xlib import X, XK, display as xdisplay
+        from Xlib.ext import xtest
+        self.X = X
+        self.xtest = xtest
+        
+        self.display = xdisplay.Display(display)
+        if not self.display.has_extension('XTEST'):
+            self.display.close()
+            raise RuntimeError(f"X server {self.display.get_display_name()} không hỗ trợ XTest")
+        
+        self.key_hold = key_hold
+        self.failsafe = failsafe
+        # Keycode tra sẵn - mỗi lần gửi phím chỉ còn 2 request XTest + 1 round-trip
+        self.keycodes = {key: self.display.keysym_to_keycode(XK.string_to_keysym(keysym))
+                         for key, keysym in self.KEYSYMS.items()}
+        self.latencies = deque(maxlen=history)
+        self.keys_sent = 0
+    
+    def _keycode(self, key):
+        keycode = self.keycodes.get(key)
+        if keycode is None:
+            from Xlib import XK
+            keycode = self.keycodes[key] = self.display.keysym_to_keycode(XK.string_to_keysym(key))
+        if not keycode:
+            raise ValueError(f"Không có keycode cho phím: {key}")
+        return keycode
+    
+    def press(self, key):
+        keycode = self._keycode(key)
+        if self.failsafe and self.position() == (0, 0):
+            raise InputAborted("Chuột ở góc trên trái màn hình (XTest failsafe)")
+        start = time.perf_counter()
+        self.xtest.fake_input(self.display, self.X.KeyPress, keycode)
+        if self.key_hold > 0:
+            self.display.sync()
+            time.sleep(self.key_hold)
+        self.xtest.fake_input(self.display, self.X.KeyRelease, keycode)
+        self.display.sync()  # Round-trip: server đã xử lý cả 2 sự kiện
+        self.latencies.append(time.perf_counter() - start - self.key_hold)
+        self.keys_sent += 1
+    
+    def click(self, x, y):
+        self.xtest.fake_input(self.display, self.X.MotionNotify, x=int(x), y=int(y))
+        self.xtest.fake_input(self.display, self.X.ButtonPress, 1)
+        self.xtest.fake_input(self.display, self.X.ButtonRelease, 1)
+        self.display.sync()
+    
+    def size(self):
+        screen = self.display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+    
+    def position(self):
+        pointer = self.display.screen().root.query_pointer()
+        return pointer.root_x, pointer.root_y
+    
+    def get_stats(self):
+        """
+        Thống kê độ trễ gửi phím (không tính key_hold)
+        
+        Returns:
+            dict: keys_sent, last/avg/max_latency_ms (trên các lần gần nhất)
+        """
+        latencies = list(self.latencies)
+        return {
+            'keys_sent': self.keys_sent,
+            'last_latency_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'avg_latency_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'max_latency_ms': max(latencies) * 1000 if latencies else 0.0,
+        }
+    
+    def close(self):
+        self.display.close()
+
+
+def create_input_backend(name=INPUT_BACKEND, key_pause=0.1, simulator=None):
+    """
+    Tạo input backend theo tên
+    
+    Args:
+        name (str): 'pyautogui', 'xtest' hoặc 'synthetic'
+        key_pause (float): Thời gian chờ sau mỗi phím (pyautogui)
+        simulator (GameSimulator): Game giả lập (backend 'synthetic')
+    
+    Returns:
+        object: Backend có press(key), click(x, y), size(), position()
+    """
+    if name == 'synthetic':
+        from synthetic_game import SyntheticInput
+        return SyntheticInput(simulator)
+    if name == 'xtest':
+        return XTestInput()
+    if name != 'pyautogui':
+        raise ValueError(f"Input backend không hợp lệ: {name}")
+    return PyAutoGUIInput(key_pause)
+
+
+class AdaptiveDelay:
+    """
+    MOVE_DELAY tự học từ thời gian phản hồi (gửi phím -> màn hình bắt đầu đổi)
+    và thời gian animation (bắt đầu đổi -> ổn định) đo được sau mỗi nước đi được đo
+    """
+    
+    def __init__(self, initial=MOVE_DELAY, margin=MOVE_DELAY_MARGIN, minimum=MOVE_DELAY_MIN,
+                 maximum=MOVE_DELAY_MAX, window=MOVE_DELAY_WINDOW, probe_every=MOVE_DELAY_PROBE_EVERY,
+                 warmup=MOVE_DELAY_WARMUP, backoff_decay=MOVE_DELAY_BACKOFF_DECAY):
+        """
+        Args:
+            initial (float): Delay trước khi có số đo (giây)
+            margin (float): Biên an toàn (0.25 = +25%)
+            minimum (float): Giới hạn dưới (giây)
+            maximum (float): Giới hạn trên (giây)
+            window (int): Số lần đo gần nhất để tính p95
+            probe_every (int): Đo lại mỗi N nước đi
+            warmup (int): Số nước đi đầu luôn đo
+            backoff_decay (float): Hệ số giảm sàn do backoff sau mỗi lần đo
+        """
+        self.delay = initial
+        self.margin = margin
+        self.minimum = minimum
+        self.maximum = maximum
+        self.probe_every = probe_every
+        self.warmup = warmup
+        self.backoff_decay = backoff_decay
+        self.floor = 0.0  # Sàn do backoff - delay không xuống dưới mức này, giảm dần sau mỗi lần đo
+        self.responses = deque(maxlen=window)
+        self.animations = deque(maxlen=window)
+        self.totals = deque(maxlen=window)
+        self.moves = 0
+        self.probes = 0
+        self.backoffs = 0
+        self._probe_next = False
+    
+    def should_probe(self):
+        """
+        Nước đi tiếp theo có cần đo không (gọi một lần mỗi nước đi)
+        
+        Returns:
+            bool: True nếu cần đo (không sleep delay, chờ màn hình ổn định)
+        """
+        self.moves += 1
+        probe = self._probe_next or self.probes < self.warmup or self.moves % self.probe_every == 0
+        self._probe_next = False
+        return probe
+    
+    def observe(self, response, animation):
+        """
+        Ghi nhận một lần đo và tính lại delay
+        
+        Args:
+            response (float): Gửi phím -> màn hình bắt đầu thay đổi (giây)
+            animation (float): Bắt đầu thay đổi -> ổn định (giây)
+        
+        Returns:
+            float: Delay mới (giây)
+        """
+        self.probes += 1
+        self.responses.append(response)
+        self.animations.append(animation)
+        self.totals.append(response + animation)
+        p95 = self._percentile(self.totals, 95)
+        self.delay = min(self.maximum, max(self.minimum, self.floor, p95 * (1 + self.margin)))
+        self.floor *= self.backoff_decay
+        return self.delay
+    
+    def backoff(self, factor=1.5):
+        """
+        Frame vừa chụp còn đang animation (delay quá ngắn) - tăng delay ngay, giữ làm sàn
+        (một lần đo may mắn không kéo delay xuống lại ngay) và đo lại ở nước sau
+        """
+        self.backoffs += 1
+        self.delay = min(self.maximum, self.delay * factor)
+        self.floor = max(self.floor, self.delay)
+        self._probe_next = True
+        logger.debug("⏫ Frame chụp giữa animation - tăng move_delay lên %.0fms", self.delay * 1000)
+    
+    @staticmethod
+    def _percentile(values, p):
+        ordered = sorted(values)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+    
+    def get_stats(self):
+        """
+        Giá trị đã học
+        
+        Returns:
+            dict: delay_ms, floor_ms, response/animation p50/p95 (ms), probes, backoffs
+        """
+        return {
+            'delay_ms': self.delay * 1000,
+            'floor_ms': self.floor * 1000,
+            'response_p50_ms': self._percentile(self.responses, 50) * 1000,
+            'response_p95_ms': self._percentile(self.responses, 95) * 1000,
+            'animation_p50_ms': self._percentile(self.animations, 50) * 1000,
+            'animation_p95_ms': self._percentile(self.animations, 95) * 1000,
+            'probes': self.probes,
+            'backoffs': self.backoffs,
+        }
 
 
 class GameController:
@@ -13,14 +289,21 @@ class GameController:
     Class để điều khiển game bằng cách gửi phím
     """
     
-    def __init__(self, move_delay=MOVE_DELAY):
+    def __init__(self, move_delay=MOVE_DELAY, key_pause=0.1, input_backend=None, adaptive_delay=None):
         """
         Khởi tạo GameController
         
         Args:
             move_delay (float): Thời gian chờ giữa các nước đi (giây)
+            key_pause (float): pyautogui.PAUSE - thời gian chờ sau mỗi lệnh pyautogui
+                               (backend 'xtest' không có pause)
+            input_backend: Backend gửi phím (None = tạo theo INPUT_BACKEND)
+            adaptive_delay (AdaptiveDelay): Tự học move_delay từ thời gian animation đo được (None = cố định)
         """
         self.move_delay = move_delay
+        self.adaptive_delay = adaptive_delay
+        self.backend = input_backend or create_input_backend(key_pause=key_pause)
+        self.last_press_time = 0.0  # Thời gian gửi phím của nước đi gần nhất (giây, không tính move_delay)
         
         # Mapping từ direction string sang key name của pyautogui
         self.key_mapping = {
@@ -30,48 +313,47 @@ class GameController:
             'RIGHT': 'right'
         }
         
-        # Cấu hình pyautogui
-        pyautogui.PAUSE = 0.1  # Thời gian chờ giữa các lệnh pyautogui
-        pyautogui.FAILSAFE = True  # Di chuột lên góc màn hình để dừng khẩn cấp
-        
-        if DEBUG_MODE:
-            print("🎮 GameController đã khởi tạo")
-            print("⚠️  Để dừng khẩn cấp, di chuột lên góc trên bên trái màn hình")
+        logger.debug("🎮 GameController đã khởi tạo (input: %s)", self.backend.name)
+        if getattr(self.backend, 'failsafe', False):
+            logger.debug("⚠️  Để dừng khẩn cấp, di chuột lên góc trên bên trái màn hình")
     
-    def send_move(self, direction):
+    def send_move(self, direction, wait=True):
         """
         Gửi một nước đi đến game
         
         Args:
             direction (str): Hướng di chuyển ('UP', 'DOWN', 'LEFT', 'RIGHT')
+            wait (bool): Sleep move_delay sau khi gửi (False khi nước đi được đo thời gian animation)
             
         Returns:
             bool: True nếu gửi thành công
         """
         if direction not in self.key_mapping:
-            print(f"❌ Hướng không hợp lệ: {direction}")
+            logger.error("❌ Hướng không hợp lệ: %s", direction)
             return False
         
         try:
             # Lấy key name tương ứng
             key = self.key_mapping[direction]
             
-            if DEBUG_MODE:
-                print(f"⌨️  Gửi phím: {direction} ({key})")
+            logger.debug("⌨️  Gửi phím: %s (%s)", direction, key)
             
             # Gửi phím
-            pyautogui.press(key)
+            press_start = time.perf_counter()
+            self.backend.press(key)
+            self.last_press_time = time.perf_counter() - press_start
             
-            # Chờ một chút để game xử lý
-            time.sleep(self.move_delay)
+            # Chờ một chút để game xử lý (0 khi dùng settle detection)
+            if wait and self.move_delay > 0:
+                time.sleep(self.move_delay)
             
             return True
             
-        except pyautogui.FailSafeException:
-            print("🛑 Đã dừng khẩn cấp (FailSafe)")
+        except InputAborted:
+            logger.warning("🛑 Đã dừng khẩn cấp (FailSafe)")
             return False
         except Exception as e:
-            print(f"❌ Lỗi khi gửi phím: {e}")
+            logger.error("❌ Lỗi khi gửi phím: %s", e)
             return False
     
     def send_moves(self, directions):
@@ -104,14 +386,13 @@ class GameController:
             y (int): Tọa độ Y
         """
         try:
-            if DEBUG_MODE:
-                print(f"🖱️  Click vào vị trí ({x}, {y})")
+            logger.debug("🖱️  Click vào vị trí (%s, %s)", x, y)
             
-            pyautogui.click(x, y)
+            self.backend.click(x, y)
             time.sleep(0.1)
             
         except Exception as e:
-            print(f"❌ Lỗi khi click: {e}")
+            logger.error("❌ Lỗi khi click: %s", e)
     
     def focus_game_window(self, window_x, window_y):
         """
@@ -121,8 +402,7 @@ class GameController:
             window_x (int): Tọa độ X của cửa sổ game
             window_y (int): Tọa độ Y của cửa sổ game
         """
-        if DEBUG_MODE:
-            print("🎯 Đang focus vào cửa sổ game...")
+        logger.debug("🎯 Đang focus vào cửa sổ game...")
         
         self.click_position(window_x, window_y)
     
@@ -133,8 +413,7 @@ class GameController:
         Args:
             seconds (float): Số giây cần chờ
         """
-        if DEBUG_MODE:
-            print(f"⏳ Chờ {seconds} giây...")
+        logger.debug("⏳ Chờ %s giây...", seconds)
         time.sleep(seconds)
     
     def set_move_delay(self, delay):
@@ -145,8 +424,35 @@ class GameController:
             delay (float): Thời gian chờ mới (giây)
         """
         self.move_delay = delay
-        if DEBUG_MODE:
-            print(f"⚙️  Đã cập nhật move_delay: {delay}s")
+        logger.debug("⚙️  Đã cập nhật move_delay: %ss", delay)
+    
+    def should_probe(self):
+        """
+        Nước đi tiếp theo có cần đo thời gian phản hồi/animation không (gọi một lần mỗi nước đi)
+        
+        Returns:
+            bool: True nếu cần đo, False nếu chỉ sleep move_delay (hoặc không tự học)
+        """
+        return self.adaptive_delay is not None and self.adaptive_delay.should_probe()
+    
+    def record_animation(self, response, animation):
+        """
+        Cập nhật move_delay từ thời gian phản hồi + animation đo được
+        
+        Args:
+            response (float): Gửi phím -> màn hình bắt đầu thay đổi (giây)
+            animation (float): Bắt đầu thay đổi -> ổn định (giây)
+        """
+        if self.adaptive_delay is not None:
+            self.move_delay = self.adaptive_delay.observe(response, animation)
+    
+    def report_early_frame(self):
+        """
+        Frame sau nước đi vẫn đang animation (board lệch dự đoán) - tăng move_delay
+        """
+        if self.adaptive_delay is not None:
+            self.adaptive_delay.backoff()
+            self.move_delay = self.adaptive_delay.delay
     
     def get_screen_size(self):
         """
@@ -155,9 +461,8 @@ class GameController:
         Returns:
             tuple: (width, height)
         """
-        size = pyautogui.size()
-        if DEBUG_MODE:
-            print(f"🖥️  Kích thước màn hình: {size}")
+        size = self.backend.size()
+        logger.debug("🖥️  Kích thước màn hình: %s", size)
         return size
     
     def get_mouse_position(self):
@@ -168,11 +473,45 @@ class GameController:
         Returns:
             tuple: (x, y)
         """
-        pos = pyautogui.position()
-        if DEBUG_MODE:
-            print(f"🖱️  Vị trí chuột: {pos}")
+        pos = self.backend.position()
+        logger.debug("🖱️  Vị trí chuột: %s", pos)
         return pos
     
+    def get_input_stats(self):
+        """
+        Thống kê độ trễ gửi phím của input backend
+        
+        Returns:
+            dict: Thống kê (xem XTestInput.get_stats), None nếu backend không đo
+        """
+        get_stats = getattr(self.backend, 'get_stats', None)
+        return get_stats() if get_stats else None
+    
+    def measure_latency(self, count=100, key='left'):
+        """
+        Gửi một phím nhiều lần và đo độ trễ gửi phím
+        (Không cần cửa sổ game - vd. chạy trên Xvfb)
+        
+        Args:
+            count (int): Số lần gửi
+            key (str): Phím gửi
+        
+        Returns:
+            dict: p50/p95/max (ms) của thời gian gọi backend.press
+        """
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            self.backend.press(key)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return {
+            'count': count,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            'max_ms': latencies[-1] * 1000,
+        }
+    
     def test_keys(self):
         """
         Test gửi tất cả các phím mũi tên
@@ -195,6 +534,16 @@ class GameController:
 
 # Hàm tiện ích để test module
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'latency':
+        # Đo độ trễ gửi phím: python game_controller.py latency [backend] [số lần]
+        backend = sys.argv[2] if len(sys.argv) > 2 else INPUT_BACKEND
+        count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        controller = GameController(move_delay=0.0, input_backend=create_input_backend(backend, key_pause=0.0))
+        result = controller.measure_latency(count)
+        print(f"⌨️  {backend}: {result['count']} phím | p50 {result['p50_ms']:.2f}ms | "
+              f"p95 {result['p95_ms']:.2f}ms | tối đa {result['max_ms']:.2f}ms")
+        sys.exit(0)
+    
     print("🧪 Testing GameController module...")
     print("\n⚠️  Cảnh báo: Module này sẽ gửi phím mũi tên đến ứng dụng đang focus!")
     print("Bạn có muốn tiếp tục test không? (y/n)")
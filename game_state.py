@@ -3,66 +3,117 @@ Module nhận diện trạng thái game
 Chức năng: Phân tích ảnh để xác định giá trị của từng ô trong lưới 4x4
 """
 
+import logging
+import threading
+from functools import partial
 import cv2
 import numpy as np
-from dotenv import load_dotenv
-from config import GRID_SIZE, OCR_CONFIDENCE_THRESHOLD, DEBUG_MODE, AI_MODEL
-from gemini_recognizer import GeminiRecognizer
-from template_recognizer import TemplateRecognizer
+from config import (GRID_SIZE, OCR_CONFIDENCE_THRESHOLD, AI_MODEL,
+                    BOARD_TRACKING, TRACKING_CELL_TOLERANCE, RECOGNIZER_FALLBACKS,
+                    RECOGNITION_MODE, CASCADE_ORDER, CASCADE_CONFIDENCE_THRESHOLD)
+from log import get_logger
+from recognizer_chain import RecognizerChain
+from recognizer_registry import RECOGNIZERS, create_recognizer
 
-# Load environment variables (cho Gemini API key)
-load_dotenv()
+logger = get_logger(__name__)
 
 
 class GameState:
     """
     Class quản lý và nhận diện trạng thái game
-    Hỗ trợ 2 AI model: Gemini (online) và Template Matching (local)
+    Hỗ trợ 3 AI model: Gemini (online), Template Matching và PaddleOCR (local)
+    Model lỗi liên tục bị ngắt (circuit breaker) và tự chuyển sang model dự phòng
     """
     
-    def __init__(self, grid_size=GRID_SIZE, ai_model=AI_MODEL):
+    def __init__(self, grid_size=GRID_SIZE, ai_model=AI_MODEL, tracking=BOARD_TRACKING,
+                 mode=RECOGNITION_MODE):
         """
         Khởi tạo GameState
         
         Args:
             grid_size (int): Kích thước lưới (mặc định 4x4)
             ai_model (str): AI model để nhận diện ('gemini' hoặc 'template')
+            tracking (bool): Bật chế độ tracking (chỉ nhận diện ô mới spawn)
+            mode (str): 'chain' (1 backend cho cả board) hoặc 'cascade' (ô mơ hồ lên backend chậm hơn)
         """
         self.grid_size = grid_size
         self.board = [[0] * grid_size for _ in range(grid_size)]
+        self.cell_confidences = [[0.0] * grid_size for _ in range(grid_size)]
         self.ai_model = ai_model.lower()
+        self.mode = mode
+        self.cascade_stats = {name: 0 for name in CASCADE_ORDER}  # Số ô mỗi backend phải xử lý
         
-        # Khởi tạo các recognizer
-        self.gemini_recognizer = None
-        self.template_recognizer = None
+        # Board tracking: board dự đoán sau nước đi + chữ ký màu của từng giá trị
+        self.tracking = tracking
+        self.predicted_board = None
+        self.last_prediction = None  # Board dự đoán mà lần nhận diện gần nhất đã đối chiếu
+        self.cell_signatures = {}  # {value: chữ ký trung bình (numpy array)}
+        self.tracking_stats = {'tracked': 0, 'full': 0, 'desync': 0}
         
-        # Khởi tạo AI model được chọn
+        # Chuỗi recognizer: model được chọn chạy trước, backend dự phòng khởi tạo khi cần
+        # (registry chỉ import thư viện của backend khi nó được dùng lần đầu)
+        names = [self.ai_model] + [name for name in RECOGNIZER_FALLBACKS if name != self.ai_model]
+        if self.mode == 'cascade':
+            names += [name for name in CASCADE_ORDER if name not in names]
+        if 'template' not in names:
+            names.append('template')  # Luôn cần cho auto-learn/calibration
+        self.chain = RecognizerChain({name: partial(create_recognizer, name, grid_size)
+                                      for name in names if name in RECOGNIZERS},
+                                     preferred=self.ai_model)
+        
+        if self.ai_model not in RECOGNIZERS:
+            # Mặc định dùng Template Matching
+            logger.debug("🤖 Mặc định sử dụng: Template Matching")
+            self.ai_model = 'template'
+            self.chain.preferred = 'template'
+        
+        self.warm_up_thread = None
+    
+    def warm_up(self):
+        """
+        Import và khởi tạo AI model được chọn (nếu không gọi, model được tạo ở lần nhận diện đầu)
+        """
         if self.ai_model == 'gemini':
-            self.gemini_recognizer = GeminiRecognizer()
-            if self.gemini_recognizer.is_available():
-                if DEBUG_MODE:
-                    print("🤖 Đang sử dụng: Gemini AI (online, chính xác cao)")
+            if self.chain.get('gemini') is not None:
+                logger.debug("🤖 Đang sử dụng: Gemini AI (online, chính xác cao)")
             else:
-                print("⚠️  Gemini không khả dụng, chuyển sang Template Matching")
+                logger.warning("⚠️  Gemini không khả dụng, chuyển sang Template Matching")
                 self.ai_model = 'template'
-                self.template_recognizer = TemplateRecognizer()
+                self.chain.preferred = 'template'
+                self.chain.get('template')
         
-        elif self.ai_model == 'template':
-            self.template_recognizer = TemplateRecognizer()
-            if self.template_recognizer.enabled:
-                if DEBUG_MODE:
-                    print("🤖 Đang sử dụng: Template Matching (local, nhanh)")
+        elif self.ai_model is not None:
+            if self.chain.get(self.ai_model) is not None:
+                logger.debug("🤖 Đang sử dụng: %s", self.ai_model)
             else:
-                print("⚠️  Template Matching không khả dụng!")
+                logger.warning("⚠️  %s không khả dụng!", self.ai_model)
                 self.ai_model = None
+    
+    def start_warm_up(self):
+        """
+        Chạy warm_up() trong thread nền (vd. trong lúc người dùng còn ở menu)
         
-        else:
-            # Mặc định dùng Template Matching
-            if DEBUG_MODE:
-                print("🤖 Mặc định sử dụng: Template Matching")
-            self.ai_model = 'template'
-            self.template_recognizer = TemplateRecognizer()
-        
+        Returns:
+            threading.Thread: Thread warm-up
+        """
+        if self.warm_up_thread is None:
+            self.warm_up_thread = threading.Thread(target=self.warm_up, name="recognizer-warm-up",
+                                                   daemon=True)
+            self.warm_up_thread.start()
+        return self.warm_up_thread
+    
+    @property
+    def gemini_recognizer(self):
+        return self.chain.instances.get('gemini')
+    
+    @property
+    def template_recognizer(self):
+        return self.chain.instances.get('template')
+    
+    @property
+    def paddle_recognizer(self):
+        return self.chain.instances.get('paddle')
+    
     def recognize_number_from_cell(self, cell_img):
         """
         Nhận diện số từ một ô ảnh sử dụng OCR
@@ -94,8 +145,7 @@ class GameState:
                 return 0
                 
         except Exception as e:
-            if DEBUG_MODE:
-                print(f"⚠️  Lỗi khi nhận diện số: {e}")
+            logger.debug("⚠️  Lỗi khi nhận diện số: %s", e)
             return 0
     
     def recognize_number_by_color(self, cell_img):
@@ -123,76 +173,320 @@ class GameState:
     def update_from_grid(self, grid_images, full_image=None):
         """
         Cập nhật trạng thái board từ lưới ảnh
-        Hỗ trợ 2 AI model: Gemini (online) và PaddleOCR (local)
+        Chạy chuỗi recognizer: model được chọn trước, tự chuyển sang backend dự phòng khỏe
         
         Args:
             grid_images (list): Danh sách 2D các ảnh ô [row][col]
             full_image (numpy.ndarray): Ảnh đầy đủ của lưới game (cho Gemini)
             
         Returns:
-            list: Board 2D với các giá trị số
+            list: Board 2D với các giá trị số, None nếu không backend nào nhận diện được
+                (self.board giữ nguyên board cũ)
         """
-        board = None
-        
-        # Thử dùng AI model được chọn
-        if self.ai_model == 'gemini' and self.gemini_recognizer and full_image is not None:
-            board = self.gemini_recognizer.recognize_board(full_image)
-            if board is not None:
-                self.board = board
-                if DEBUG_MODE:
-                    print("🤖 Đã nhận diện bằng Gemini AI")
-                return self.board
-            else:
-                if DEBUG_MODE:
-                    print("⚠️  Gemini thất bại, fallback sang PaddleOCR")
-                self.ai_model = 'paddle'
-                if not self.paddle_recognizer:
-                    self.paddle_recognizer = PaddleRecognizer()
-        
-        # Dùng Template Matching
-        if self.ai_model == 'template' and self.template_recognizer:
-            # Chuyển grid_images 2D thành list 1D (16 ô)
-            grid_cells = []
-            for row in range(self.grid_size):
-                for col in range(self.grid_size):
-                    grid_cells.append(grid_images[row][col])
+        # Tracking: xác minh board dự đoán, chỉ nhận diện ô mới spawn
+        self.last_prediction = None
+        if self.tracking and self.predicted_board is not None:
+            predicted = self.last_prediction = self.predicted_board
+            self.predicted_board = None
             
-            board = self.template_recognizer.recognize_board(grid_cells)
-            if board is not None:
-                self.board = board
-                if DEBUG_MODE:
-                    print("🤖 Đã nhận diện bằng Template Matching")
-                    print("🎮 Trạng thái game hiện tại:")
-                    self.print_board()
+            tracked = self._track_from_prediction(grid_images, predicted)
+            if tracked is not None:
+                self.board = tracked
+                self.tracking_stats['tracked'] += 1
+                logger.debug("🎯 Tracking: chỉ nhận diện ô mới spawn")
                 return self.board
-            else:
-                if DEBUG_MODE:
-                    print("❌ Template Matching thất bại")
+            
+            self.tracking_stats['desync'] += 1
+            logger.debug("⚠️  Tracking lệch (desync), nhận diện lại toàn bộ 16 ô")
         
-        # Nếu không có AI nào hoạt động, trả về board trống
-        if DEBUG_MODE:
-            print("❌ Không có AI model nào khả dụng!")
-            print("🎮 Trạng thái game hiện tại:")
-            self.print_board()
+        self.tracking_stats['full'] += 1
         
-        return self.board
+        # Chuyển grid_images 2D thành list 1D (16 ô) cho recognizer theo từng ô
+        grid_cells = [grid_images[row][col]
+                      for row in range(self.grid_size) for col in range(self.grid_size)]
+        
+        if self.mode == 'cascade':
+            name = 'cascade'
+            board = self._recognize_cascade(grid_cells, full_image)
+        else:
+            def recognize(name, recognizer):
+                if name == 'gemini':
+                    # Gemini cần ảnh đầy đủ; trả về None khi lỗi/hết quota
+                    if full_image is None:
+                        return None
+                    board, confidences = recognizer.recognize_board_with_confidence(full_image)
+                elif name == 'template' and not recognizer.templates:
+                    return None  # Chưa calibration - board toàn 0 không có nghĩa
+                else:
+                    board, confidences = recognizer.recognize_board_with_confidence(grid_cells)
+                return (board, confidences) if board is not None else None
+            
+            name, result = self.chain.run(recognize)
+            board = None
+            if result is not None:
+                board, self.cell_confidences = result
+        
+        if board is not None:
+            self.board = board
+            self._learn_signatures(grid_images, board)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🤖 Đã nhận diện bằng %s\n🎮 Trạng thái game hiện tại:\n%s", name, self.format_board())
+            return self.board
+        
+        # Không có AI nào trả lời: giữ board cũ nhưng báo lỗi (không đưa board cũ cho solver như board mới)
+        logger.debug("❌ Không có AI model nào nhận diện được!")
+        return None
     
-    def print_board(self):
+    def _recognize_cascade(self, grid_cells, full_image):
         """
-        In ra board dưới dạng text để dễ nhìn
+        Nhận diện kiểu cascade: backend rẻ nhất chạy trên cả 16 ô, chỉ các ô
+        có độ tin cậy dưới ngưỡng được chuyển lên backend tiếp theo (chậm hơn)
+        
+        Args:
+            grid_cells (list): 16 ô (list 1D)
+            full_image (numpy.ndarray): Ảnh đầy đủ (cho Gemini)
+        
+        Returns:
+            list: Board 2D, None nếu không backend nào chạy được
         """
-        print("┌" + "─────┬" * (self.grid_size - 1) + "─────┐")
-        for i, row in enumerate(self.board):
-            print("│", end="")
-            for cell in row:
-                if cell == 0:
-                    print("     │", end="")
+        values = [0] * len(grid_cells)
+        confidences = [0.0] * len(grid_cells)
+        pending = list(range(len(grid_cells)))
+        answered = False
+        
+        for name in CASCADE_ORDER:
+            if not pending:
+                break
+            
+            def recognize(name, recognizer):
+                if name == 'gemini':
+                    # Cả board trong 1 request (Gemini tính quota theo request, không theo ô)
+                    if full_image is None:
+                        return None
+                    board, board_confidences = recognizer.recognize_board_with_confidence(full_image)
+                    if board is None:
+                        return None
+                    return [(board[i // self.grid_size][i % self.grid_size],
+                             board_confidences[i // self.grid_size][i % self.grid_size]) for i in pending]
+                if name == 'template' and not recognizer.templates:
+                    return None
+                return recognizer.recognize_cells_with_confidence([grid_cells[i] for i in pending])
+            
+            results = self.chain.call(name, recognize)
+            if results is None:
+                continue
+            
+            answered = True
+            self.cascade_stats[name] += len(pending)
+            for i, (value, confidence) in zip(pending, results):
+                if confidence > confidences[i]:
+                    values[i], confidences[i] = value, confidence
+            pending = [i for i in pending if confidences[i] < CASCADE_CONFIDENCE_THRESHOLD]
+        
+        if not answered:
+            return None
+        
+        if pending:
+            logger.debug("⚠️  Cascade: %d ô vẫn có độ tin cậy thấp", len(pending))
+        
+        size = self.grid_size
+        self.cell_confidences = [confidences[row * size:(row + 1) * size] for row in range(size)]
+        return [values[row * size:(row + 1) * size] for row in range(size)]
+    
+    def get_template_recognizer(self):
+        """
+        Lấy TemplateRecognizer (tạo khi cần, vd. để auto-learn khi đang dùng Gemini)
+        
+        Returns:
+            TemplateRecognizer: Recognizer template
+        """
+        return self.chain.get('template')
+    
+    def set_predicted_board(self, board):
+        """
+        Lưu board dự đoán sau nước đi (afterstate, chưa có ô spawn)
+        Lần update_from_grid tiếp theo sẽ xác minh board này thay vì nhận diện lại
+        
+        Args:
+            board (list): Board 2D sau khi di chuyển (từ AISolver.move), None để bỏ
+        """
+        if board is None:
+            self.predicted_board = None
+        else:
+            self.predicted_board = [row[:] for row in board]
+    
+    def follows_prediction(self, board):
+        """
+        Board (nhận diện toàn bộ) có đúng là board dự đoán + một ô spawn không -
+        không khớp thì frame có thể đã chụp khi animation chưa xong
+        
+        Args:
+            board (list): Board nhận diện được
+        
+        Returns:
+            bool: True nếu khớp (hoặc lần nhận diện không có board dự đoán)
+        """
+        predicted = self.last_prediction
+        if predicted is None:
+            return True
+        changed = [(row, col) for row in range(self.grid_size) for col in range(self.grid_size)
+                   if board[row][col] != predicted[row][col]]
+        return len(changed) == 1 and predicted[changed[0][0]][changed[0][1]] == 0
+    
+    def _cell_signature(self, cell_img):
+        """
+        Tính chữ ký rẻ của một ô: ảnh màu thu nhỏ 8x8
+        
+        Args:
+            cell_img (numpy.ndarray): Ảnh ô
+            
+        Returns:
+            numpy.ndarray: Vector float32, hoặc None nếu ảnh không hợp lệ
+        """
+        if cell_img is None or cell_img.size == 0:
+            return None
+        small = cv2.resize(cell_img, (8, 8), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = small[:, :, :3]  # Bỏ alpha (ô BGRA)
+        return small.astype(np.float32).ravel()
+    
+    def _learn_signatures(self, grid_images, board):
+        """
+        Cập nhật chữ ký màu của từng giá trị từ một lần nhận diện đầy đủ
+        
+        Args:
+            grid_images (list): Lưới ảnh [row][col]
+            board (list): Board đã nhận diện
+        """
+        if not self.tracking:
+            return
+        
+        for row in range(self.grid_size):
+            for col in range(self.grid_size):
+                signature = self._cell_signature(grid_images[row][col])
+                if signature is None:
+                    continue
+                
+                value = board[row][col]
+                known = self.cell_signatures.get(value)
+                if known is None or known.shape != signature.shape:
+                    self.cell_signatures[value] = signature
                 else:
-                    print(f" {cell:3d} │", end="")
-            print()
+                    # Trung bình trượt để thích nghi dần với ánh sáng/hiệu ứng
+                    known += 0.2 * (signature - known)
+    
+    def _matches_signature(self, signature, value):
+        """
+        Kiểm tra chữ ký ô có khớp với giá trị dự đoán không
+        
+        Returns:
+            bool: True nếu khớp, False nếu lệch hoặc chưa biết chữ ký của giá trị
+        """
+        known = self.cell_signatures.get(value)
+        if known is None or signature is None or known.shape != signature.shape:
+            return False
+        return float(np.mean(np.abs(signature - known))) <= TRACKING_CELL_TOLERANCE
+    
+    def matches_board(self, grid_images, board):
+        """
+        Kiểm tra mọi ô trong ảnh vẫn khớp chữ ký của board (board chắc chắn chưa đổi)
+        
+        Args:
+            grid_images (list): Lưới ảnh [row][col]
+            board (list): Board cần so
+            
+        Returns:
+            bool: True nếu tất cả các ô khớp, False nếu có ô lệch hoặc chưa đủ chữ ký để biết
+        """
+        if board is None:
+            return False
+        return all(self._matches_signature(self._cell_signature(grid_images[row][col]), board[row][col])
+                   for row in range(self.grid_size) for col in range(self.grid_size))
+    
+    def _recognize_single_cell(self, cell_img):
+        """
+        Nhận diện đúng một ô (ô mới spawn) bằng backend khỏe đầu tiên trong chuỗi
+        
+        Returns:
+            tuple: (giá trị ô, độ tin cậy), (0, 0.0) nếu không nhận diện được
+        """
+        def recognize(name, recognizer):
+            number, confidence = recognizer.recognize_cell_with_confidence(cell_img)
+            return (number, confidence) if number and number > 0 else None
+        
+        _, result = self.chain.run(recognize)
+        return result or (0, 0.0)
+    
+    def _track_from_prediction(self, grid_images, predicted):
+        """
+        Xác minh board dự đoán bằng chữ ký từng ô và tìm ô mới spawn
+        Thành công thì cập nhật cell_confidences: ô khớp chữ ký = 1.0, ô spawn = độ tin cậy
+        của backend đã nhận diện nó
+        
+        Args:
+            grid_images (list): Lưới ảnh [row][col]
+            predicted (list): Board dự đoán sau nước đi
+            
+        Returns:
+            list: Board mới nếu dự đoán đúng, None nếu cần nhận diện lại toàn bộ
+        """
+        spawned = None
+        spawned_signature = None
+        
+        for row in range(self.grid_size):
+            for col in range(self.grid_size):
+                signature = self._cell_signature(grid_images[row][col])
+                value = predicted[row][col]
+                
+                if self._matches_signature(signature, value):
+                    continue
+                
+                # Chỉ chấp nhận đúng MỘT ô trống trong dự đoán bị thay đổi (ô spawn)
+                if value != 0 or spawned is not None:
+                    return None
+                spawned = (row, col)
+                spawned_signature = signature
+        
+        if spawned is None:
+            # Không thấy ô mới - phím có thể bị bỏ lỡ hoặc animation chưa xong
+            return None
+        
+        row, col = spawned
+        number, confidence = self._recognize_single_cell(grid_images[row][col])
+        if number <= 0:
+            return None
+        
+        board = [r[:] for r in predicted]
+        board[row][col] = number
+        self.cell_confidences = [[1.0] * self.grid_size for _ in range(self.grid_size)]
+        self.cell_confidences[row][col] = confidence
+        
+        # Ô spawn có thể là giá trị chưa có chữ ký - học luôn
+        if number not in self.cell_signatures and spawned_signature is not None:
+            self.cell_signatures[number] = spawned_signature
+        
+        return board
+    
+    def format_board(self):
+        """
+        Board dưới dạng text để dễ nhìn
+        
+        Returns:
+            str: Bảng nhiều dòng
+        """
+        lines = ["┌" + "─────┬" * (self.grid_size - 1) + "─────┐"]
+        for i, row in enumerate(self.board):
+            lines.append("│" + "".join("     │" if cell == 0 else f" {cell:3d} │" for cell in row))
             if i < self.grid_size - 1:
-                print("├" + "─────┼" * (self.grid_size - 1) + "─────┤")
-        print("└" + "─────┴" * (self.grid_size - 1) + "─────┘")
+                lines.append("├" + "─────┼" * (self.grid_size - 1) + "─────┤")
+        lines.append("└" + "─────┴" * (self.grid_size - 1) + "─────┘")
+        return "\n".join(lines)
+    
+    def print_board(self):
+        """
+        In ra board dưới dạng text để dễ nhìn
+        """
+        print(self.format_board())
     
     def get_board(self):
         """
@@ -0,0 +1,224 @@
+"""
+Module client Gemini bất đồng bộ (asyncio)
+Token bucket giới hạn tốc độ, deadline cho từng request, retry với backoff
+ngẫu nhiên (jitter) và gửi nhiều request song song (pipelining) khi an toàn
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from config import (GEMINI_RATE_LIMIT, GEMINI_RATE_BURST, GEMINI_REQUEST_DEADLINE,
+                    GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_MAX_CONCURRENCY)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket: tối đa `rate` request mỗi phút, cho phép dồn `burst` request
+    """
+    
+    def __init__(self, rate_per_minute=GEMINI_RATE_LIMIT, burst=GEMINI_RATE_BURST):
+        """
+        Khởi tạo token bucket
+        
+        Args:
+            rate_per_minute (float): Số request cho phép mỗi phút
+            burst (int): Số token tối đa tích lũy được
+        """
+        self.rate = rate_per_minute / 60.0  # token mỗi giây
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = None
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """
+        Chờ đến khi có token rồi lấy một token
+        
+        Returns:
+            float: Thời gian đã phải chờ (giây)
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class AsyncGeminiClient:
+    """
+    Client bất đồng bộ bọc một GenerativeModel (hoặc model giả lập)
+    """
+    
+    def __init__(self, model, rate_per_minute=GEMINI_RATE_LIMIT, burst=GEMINI_RATE_BURST,
+                 deadline=GEMINI_REQUEST_DEADLINE, max_retries=GEMINI_MAX_RETRIES,
+                 backoff_base=GEMINI_BACKOFF_BASE, max_concurrency=GEMINI_MAX_CONCURRENCY):
+        """
+        Khởi tạo client
+        
+        Args:
+            model: Đối tượng có generate_content_async() hoặc generate_content()
+            rate_per_minute (float): Giới hạn request mỗi phút (quota free tier: 15)
+            burst (int): Số request được dồn liên tiếp
+            deadline (float): Thời gian tối đa cho mỗi lần gọi (giây)
+            max_retries (int): Số lần thử lại khi lỗi/hết giờ
+            backoff_base (float): Thời gian chờ cơ sở cho backoff (giây)
+            max_concurrency (int): Số request chạy song song tối đa
+        """
+        self.model = model
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        
+        # Event loop riêng trong thread nền cho code đồng bộ (generate_sync)
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        
+        # Thống kê
+        self.latencies = deque(maxlen=1000)  # Thời gian end-to-end các request thành công gần nhất (giây)
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+    
+    async def _call_once(self, contents):
+        """
+        Gọi model một lần, có deadline
+        """
+        if hasattr(self.model, 'generate_content_async'):
+            call = self.model.generate_content_async(contents)
+        else:
+            # Model chỉ có API đồng bộ - chạy trong thread pool
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(None, self.model.generate_content, contents)
+        return await asyncio.wait_for(call, timeout=self.deadline)
+    
+    async def generate(self, contents):
+        """
+        Gửi một request: chờ token, gọi với deadline, retry với backoff jitter
+        
+        Args:
+            contents (list): Nội dung request (prompt, ảnh)
+        
+        Returns:
+            Response của model
+        
+        Raises:
+            Exception: Lỗi cuối cùng sau khi đã hết số lần thử
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        start = time.perf_counter()
+        last_error = None
+        
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire()
+                try:
+                    response = await self._call_once(contents)
+                    self.requests += 1
+                    self.latencies.append(time.perf_counter() - start)
+                    return response
+                
+                except asyncio.TimeoutError as e:
+                    self.timeouts += 1
+                    last_error = e
+                    logger.debug("⏱️  Gemini quá deadline %ss (lần %s)", self.deadline, attempt + 1)
+                
+                except Exception as e:
+                    last_error = e
+                    logger.debug("⚠️  Gemini lỗi (lần %s): %s", attempt + 1, e)
+                
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    # Full jitter: chờ ngẫu nhiên trong [0, base * 2^attempt]
+                    await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+        
+        self.failures += 1
+        raise last_error
+    
+    async def generate_many(self, contents_list):
+        """
+        Gửi nhiều request độc lập song song (pipelining), giữ nguyên thứ tự kết quả
+        
+        Args:
+            contents_list (list): Danh sách nội dung request
+        
+        Returns:
+            list: Response hoặc Exception cho từng request
+        """
+        tasks = [self.generate(contents) for contents in contents_list]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _ensure_loop(self):
+        """
+        Tạo event loop chạy nền (một lần) cho các lời gọi đồng bộ
+        (có lock - nhiều thread gọi generate_sync cùng lúc vẫn chỉ tạo một loop)
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever,
+                                                     name="gemini-async-loop", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+    
+    def generate_sync(self, contents):
+        """
+        Gọi generate() từ code đồng bộ (vòng lặp chính của bot)
+        """
+        future = asyncio.run_coroutine_threadsafe(self.generate(contents), self._ensure_loop())
+        return future.result()
+    
+    def generate_many_sync(self, contents_list):
+        """
+        Gọi generate_many() từ code đồng bộ
+        """
+        future = asyncio.run_coroutine_threadsafe(self.generate_many(contents_list), self._ensure_loop())
+        return future.result()
+    
+    def get_stats(self):
+        """
+        Thống kê request
+        
+        Returns:
+            dict: số request, p50/p95/p99 (ms, trên các request gần nhất), retries, timeouts, failures
+        """
+        ordered = sorted(self.latencies)
+        
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+        
+        return {
+            'requests': self.requests,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'retries': self.retries,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+        }
@@ -0,0 +1,178 @@
+"""
+Module cache kết quả Gemini
+Khóa cache là perceptual hash của ảnh lưới đã chuẩn hóa: frame giống hệt
+(hoặc chỉ khác nhiễu nhỏ) không bao giờ phải gọi lại API
+"""
+
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import cv2
+from config import GEMINI_CACHE_TTL, GEMINI_CACHE_MAX_ENTRIES, GEMINI_CACHE_FILE
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+def board_hash(img, grid_size=4):
+    """
+    Perceptual hash của ảnh lưới game
+    
+    Mỗi ô: dHash 8x8 (dấu gradient ngang trên ảnh xám, 64 bit)
+    + màu trung bình lượng tử hóa (3 bit/kênh) để phân biệt ô chỉ khác màu
+    
+    Args:
+        img (numpy.ndarray): Ảnh lưới BGR hoặc BGRA
+        grid_size (int): Kích thước lưới
+    
+    Returns:
+        str: Chuỗi hex làm khóa cache
+    """
+    if img.ndim == 3 and img.shape[2] == 4:
+        bgr = img[:, :, :3]
+    else:
+        bgr = img
+    
+    # Chuẩn hóa: thu nhỏ về lưới cố định (9x8 pixel mỗi ô cho dHash)
+    small = cv2.resize(np.ascontiguousarray(bgr), (grid_size * 9, grid_size * 8),
+                       interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    
+    parts = []
+    for row in range(grid_size):
+        for col in range(grid_size):
+            cell = gray[row * 8:(row + 1) * 8, col * 9:(col + 1) * 9].astype(np.int16)
+            bits = (cell[:, 1:] > cell[:, :-1]).ravel()
+            parts.append(np.packbits(bits).tobytes())
+            
+            if small.ndim == 3:
+                color = small[row * 8:(row + 1) * 8, col * 9:(col + 1) * 9].reshape(-1, 3).mean(axis=0)
+                parts.append((color.astype(np.uint8) >> 5).tobytes())
+    
+    return b"".join(parts).hex()
+
+
+class GeminiCache:
+    """
+    Cache LRU + TTL cho kết quả nhận diện board của Gemini
+    Có thể lưu ra file JSON để dùng lại giữa các lần chạy
+    """
+    
+    def __init__(self, ttl=GEMINI_CACHE_TTL, max_entries=GEMINI_CACHE_MAX_ENTRIES,
+                 persist_file=GEMINI_CACHE_FILE):
+        """
+        Khởi tạo cache
+        
+        Args:
+            ttl (float): Thời gian sống của một kết quả (giây), None = không hết hạn
+            max_entries (int): Số kết quả tối đa (LRU)
+            persist_file (str): File JSON lưu cache, None = chỉ trong bộ nhớ
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist_file = Path(persist_file) if persist_file else None
+        self.entries = OrderedDict()  # {key: (board, stored_at)}
+        
+        # Thống kê
+        self.hits = 0
+        self.misses = 0
+        self.api_seconds = 0.0  # Tổng thời gian gọi API thật
+        self.api_calls = 0
+        
+        self.load()
+    
+    def get(self, key):
+        """
+        Lấy board đã cache
+        
+        Returns:
+            list: Board 4x4, hoặc None nếu không có/hết hạn
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            board, stored_at = entry
+            if self.ttl is None or time.time() - stored_at <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return [row[:] for row in board]
+            del self.entries[key]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, key, board):
+        """
+        Lưu board vào cache (loại kết quả ít dùng nhất nếu đầy)
+        """
+        self.entries[key] = ([row[:] for row in board], time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def record_api_call(self, seconds):
+        """
+        Ghi lại thời gian một lần gọi API thật (để ước tính thời gian tiết kiệm)
+        """
+        self.api_calls += 1
+        self.api_seconds += seconds
+    
+    def get_stats(self):
+        """
+        Thống kê cache
+        
+        Returns:
+            dict: hits, misses, hit_rate, saved_seconds
+        """
+        lookups = self.hits + self.misses
+        avg_call = self.api_seconds / self.api_calls if self.api_calls else 0.0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': self.hits * avg_call,
+            'entries': len(self.entries),
+        }
+    
+    def load(self):
+        """
+        Load cache từ file (bỏ qua kết quả đã hết hạn)
+        """
+        if not self.persist_file or not self.persist_file.exists():
+            return
+        
+        try:
+            with open(self.persist_file, 'r') as f:
+                data = json.load(f)
+            
+            now = time.time()
+            for key, entry in data.items():
+                if self.ttl is None or now - entry['stored_at'] <= self.ttl:
+                    self.entries[key] = (entry['board'], entry['stored_at'])
+            
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            
+            logger.debug("📚 Đã load %s kết quả Gemini từ cache", len(self.entries))
+        
+        except Exception as e:
+            logger.debug("⚠️  Lỗi load Gemini cache: %s", e)
+    
+    def save(self):
+        """
+        Lưu cache ra file (nếu có cấu hình persist_file)
+        """
+        if not self.persist_file:
+            return
+        
+        try:
+            data = {key: {'board': board, 'stored_at': stored_at}
+                    for key, (board, stored_at) in self.entries.items()}
+            tmp_file = self.persist_file.with_suffix(self.persist_file.suffix + ".tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            tmp_file.replace(self.persist_file)
+        
+        except Exception as e:
+            logger.error("❌ Lỗi lưu Gemini cache: %s", e)
@@ -0,0 +1,209 @@
+"""
+Module giả lập Gemini API (chạy local, không cần internet/API key)
+Mô phỏng độ trễ, lỗi quota (429), lỗi server và response sai format
+để đo throughput và độ trễ đuôi (tail latency) của đường Gemini offline
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from config import GEMINI_RATE_LIMIT
+
+
+class MockResponse:
+    """
+    Response giả - giống google.generativeai (có thuộc tính .text)
+    """
+    
+    def __init__(self, text):
+        self.text = text
+
+
+class MockQuotaError(Exception):
+    """
+    Lỗi vượt quota (tương đương HTTP 429 ResourceExhausted)
+    """
+
+
+class MockServerError(Exception):
+    """
+    Lỗi phía server (tương đương HTTP 500/503)
+    """
+
+
+class MockGeminiServer:
+    """
+    Server Gemini giả lập trong tiến trình
+    
+    Dùng như một GenerativeModel: có generate_content() và generate_content_async()
+    """
+    
+    def __init__(self, board_provider=None, latency_median=1.5, latency_sigma=0.35,
+                 failure_rate=0.05, malformed_rate=0.02, quota_per_minute=GEMINI_RATE_LIMIT,
+                 seed=None):
+        """
+        Khởi tạo server giả lập
+        
+        Args:
+            board_provider (callable): Hàm (contents) -> board 4x4 trả về cho request
+                                       None = board ngẫu nhiên
+            latency_median (float): Độ trễ trung vị (giây), phân phối log-normal
+            latency_sigma (float): Độ phân tán log-normal (càng lớn đuôi càng dài)
+            failure_rate (float): Tỉ lệ lỗi server
+            malformed_rate (float): Tỉ lệ response không phải JSON
+            quota_per_minute (int): Quota phía server, vượt quá trả về lỗi 429 (None = không giới hạn)
+            seed (int): Seed cho random (để tái lập)
+        """
+        self.board_provider = board_provider
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.quota_per_minute = quota_per_minute
+        self.random = random.Random(seed)
+        
+        self._lock = threading.Lock()
+        self._request_times = deque()  # Thời điểm các request trong 60s gần nhất
+        
+        # Thống kê phía server
+        self.requests = 0
+        self.quota_rejections = 0
+        self.server_errors = 0
+    
+    def _admit(self):
+        """
+        Kiểm tra quota và chọn kết quả cho một request
+        
+        Returns:
+            tuple: (độ trễ, lỗi hoặc None, response sai format hay không)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.requests += 1
+            
+            while self._request_times and now - self._request_times[0] > 60.0:
+                self._request_times.popleft()
+            
+            if self.quota_per_minute is not None and len(self._request_times) >= self.quota_per_minute:
+                self.quota_rejections += 1
+                return 0.05, MockQuotaError("429 Resource has been exhausted (mock quota)"), False
+            self._request_times.append(now)
+            
+            latency = self.random.lognormvariate(0, self.latency_sigma) * self.latency_median
+            roll = self.random.random()
+        
+        if roll < self.failure_rate:
+            self.server_errors += 1
+            return latency, MockServerError("503 Service unavailable (mock)"), False
+        
+        return latency, None, roll < self.failure_rate + self.malformed_rate
+    
+    def _respond(self, contents, malformed):
+        """
+        Tạo response: JSON board (từ board_provider hoặc ngẫu nhiên) hoặc text sai format
+        """
+        if malformed:
+            return MockResponse("Xin lỗi, tôi không chắc về bảng này.")
+        
+        if self.board_provider is not None:
+            board = self.board_provider(contents)
+        else:
+            board = [[self.random.choice([0, 0, 1, 2, 3]) for _ in range(4)] for _ in range(4)]
+        return MockResponse(json.dumps({'board': board}))
+    
+    def generate_content(self, contents):
+        """
+        Gọi đồng bộ (giống GenerativeModel.generate_content)
+        """
+        latency, error, malformed = self._admit()
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return self._respond(contents, malformed)
+    
+    async def generate_content_async(self, contents):
+        """
+        Gọi bất đồng bộ (giống GenerativeModel.generate_content_async)
+        """
+        latency, error, malformed = self._admit()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return self._respond(contents, malformed)
+
+
+def benchmark_gemini_path(requests=30, concurrency=2, rate_per_minute=None, **server_kwargs):
+    """
+    So sánh gọi tuần tự (blocking, không retry) với AsyncGeminiClient trên server giả lập
+    
+    Args:
+        requests (int): Số request mỗi bên
+        concurrency (int): Số request song song của client async
+        rate_per_minute (float): Giới hạn của client (None = bằng quota server)
+        **server_kwargs: Tham số cho MockGeminiServer
+    
+    Returns:
+        dict: Kết quả của từng bên (throughput, độ trễ, lỗi)
+    """
+    from gemini_async import AsyncGeminiClient
+    
+    quota = server_kwargs.get('quota_per_minute', GEMINI_RATE_LIMIT)
+    rate = rate_per_minute or quota or 600
+    
+    def percentiles(latencies):
+        ordered = sorted(latencies)
+        if not ordered:
+            return 0.0, 0.0
+        pick = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+        return pick(50), pick(95)
+    
+    # 1. Tuần tự, blocking như GeminiRecognizer ban đầu
+    server = MockGeminiServer(seed=1, **server_kwargs)
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        call_start = time.perf_counter()
+        try:
+            server.generate_content(["prompt"])
+            latencies.append(time.perf_counter() - call_start)
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    p50, p95 = percentiles(latencies)
+    blocking = {'ok': len(latencies), 'errors': errors, 'seconds': elapsed,
+                'throughput_per_min': len(latencies) / elapsed * 60, 'p50_ms': p50, 'p95_ms': p95}
+    
+    # 2. Client async: rate limit + deadline + retry + pipelining
+    server = MockGeminiServer(seed=1, **server_kwargs)
+    client = AsyncGeminiClient(server, rate_per_minute=rate, burst=concurrency,
+                               max_concurrency=concurrency)
+    start = time.perf_counter()
+    results = asyncio.run(client.generate_many([["prompt"]] * requests))
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results if not isinstance(r, Exception))
+    stats = client.get_stats()
+    pipelined = {'ok': ok, 'errors': requests - ok, 'seconds': elapsed,
+                 'throughput_per_min': ok / elapsed * 60, 'p50_ms': stats['p50_ms'],
+                 'p95_ms': stats['p95_ms'], 'retries': stats['retries'],
+                 'timeouts': stats['timeouts'], 'quota_rejections': server.quota_rejections}
+    
+    return {'blocking': blocking, 'async': pipelined}
+
+
+# Chạy benchmark offline
+if __name__ == "__main__":
+    print("🧪 Benchmark đường Gemini trên server giả lập...")
+    print("   (độ trễ ~1.5s, 5% lỗi server, 2% response sai format, quota không giới hạn)")
+    
+    results = benchmark_gemini_path(requests=30, concurrency=4, rate_per_minute=600,
+                                    quota_per_minute=None)
+    for name, result in results.items():
+        detail = " | ".join(f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+                            for key, value in result.items())
+        print(f"   {name}: {detail}")
+    
+    print("✅ Benchmark hoàn thành!")
@@ -3,17 +3,72 @@ Module nhận diện số sử dụng Google Gemini AI
 Sử dụng Gemini Vision để nhận diện ma trận 4x4 từ ảnh game
 """
 
-import google.generativeai as genai
-from PIL import Image
+import atexit
 import numpy as np
 import cv2
 import json
 import os
-from dotenv import load_dotenv
-from config import DEBUG_MODE
+import time
+from collections import deque
+from config import (GEMINI_CACHE_ENABLED, GEMINI_PAYLOAD_SIZE, GEMINI_PAYLOAD_FORMAT,
+                    GEMINI_PAYLOAD_QUALITY, GEMINI_CONFIDENCE)
+from log import get_logger
+from gemini_cache import GeminiCache, board_hash
+from gemini_async import AsyncGeminiClient
 
-# Load environment variables
-load_dotenv()
+logger = get_logger(__name__)
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    # Vẫn dùng được với model giả lập (MockGeminiServer) khi chưa cài thư viện
+    genai = None
+
+
+# Prompt nhận diện một ô
+CELL_PROMPT = "Ảnh là MỘT ô của game 2048. Trả về CHỈ một số nguyên trong ô (0 nếu trống), không thêm text."
+
+# Prompt nhận diện cả board
+BOARD_PROMPT = """
+Bạn là một AI chuyên phân tích game 2048. Hãy phân tích ảnh này và trả về ma trận 4x4 các số trong game.
+
+QUAN TRỌNG:
+- Ảnh chứa một lưới 4x4 của game 2048
+- Mỗi ô có thể chứa số (1, 2, 3, 4, 5, 6, 7, 8, 9, ...) hoặc trống
+- Nếu ô trống, trả về 0
+- Trả về CHÍNH XÁC dưới dạng JSON với format:
+{
+  "board": [
+    [a, b, c, d],
+    [e, f, g, h],
+    [i, j, k, l],
+    [m, n, o, p]
+  ]
+}
+
+Trong đó a, b, c, ... là các số trong ô tương ứng (0 nếu trống).
+
+CHỈ trả về JSON, không thêm text nào khác.
+"""
+
+
+def crop_to_grid(img, threshold=4.0):
+    """
+    Cắt bỏ viền đồng màu quanh lưới game (hàng/cột gần như không có chi tiết)
+    
+    Args:
+        img (numpy.ndarray): Ảnh BGR
+        threshold (float): Độ lệch chuẩn tối thiểu của một hàng/cột để coi là thuộc lưới
+        
+    Returns:
+        numpy.ndarray: View đã cắt (giữ nguyên ảnh nếu không tìm thấy viền)
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    rows = np.where(gray.std(axis=1) > threshold)[0]
+    cols = np.where(gray.std(axis=0) > threshold)[0]
+    if len(rows) == 0 or len(cols) == 0:
+        return img
+    return img[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
 
 
 class GeminiRecognizer:
@@ -21,13 +76,36 @@ class GeminiRecognizer:
     Class nhận diện số bằng Gemini AI
     """
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, use_cache=GEMINI_CACHE_ENABLED, model=None):
         """
         Khởi tạo Gemini recognizer
         
         Args:
             api_key (str): Google API key. Nếu None, đọc từ biến môi trường GEMINI_API_KEY
+            use_cache (bool): Cache kết quả theo perceptual hash của ảnh
+            model: Model dùng thay Gemini thật (vd. MockGeminiServer để chạy offline)
         """
+        # Cache kết quả: frame giống nhau không gọi lại API
+        self.cache = GeminiCache() if use_cache else None
+        if self.cache is not None:
+            atexit.register(self.close)
+        
+        # Kích thước ảnh gửi đi và độ trễ của từng lần gọi
+        self.call_log = deque(maxlen=200)
+        
+        if model is not None:
+            # Model được truyền vào - không cần API key
+            self.model = model
+            self.model_name = type(model).__name__
+            self.client = AsyncGeminiClient(self.model)
+            self.enabled = True
+            return
+        
+        if genai is None:
+            print("⚠️  Chưa cài google-generativeai! Chạy: pip install google-generativeai")
+            self.enabled = False
+            return
+        
         # Lấy API key
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         
@@ -59,21 +137,21 @@ class GeminiRecognizer:
                 try:
                     self.model = genai.GenerativeModel(model_name)
                     self.model_name = model_name
-                    if DEBUG_MODE:
-                        print(f"✅ Gemini AI đã được khởi tạo (model: {model_name})")
+                    logger.debug("✅ Gemini AI đã được khởi tạo (model: %s)", model_name)
                     break
                 except Exception as e:
-                    if DEBUG_MODE:
-                        print(f"⚠️  Model {model_name} không khả dụng: {e}")
+                    logger.debug("⚠️  Model %s không khả dụng: %s", model_name, e)
                     continue
             
             if self.model is None:
                 raise Exception("Không tìm thấy model Gemini khả dụng")
             
+            # Client bất đồng bộ: rate limit, deadline, retry với backoff
+            self.client = AsyncGeminiClient(self.model)
             self.enabled = True
         
         except Exception as e:
-            print(f"❌ Lỗi khởi tạo Gemini: {e}")
+            logger.error("❌ Lỗi khởi tạo Gemini: %s", e)
             self.enabled = False
     
     def recognize_board(self, img):
@@ -89,52 +167,94 @@ class GeminiRecognizer:
         if not self.enabled:
             return None
         
-        try:
-            # Chuyển numpy array sang PIL Image
-            if isinstance(img, np.ndarray):
-                # Chuyển từ BGR (OpenCV) sang RGB (PIL)
-                if len(img.shape) == 3 and img.shape[2] == 3:
-                    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                else:
-                    img_rgb = img
-                pil_img = Image.fromarray(img_rgb)
-            else:
-                pil_img = img
+        # Tra cache trước - frame không đổi thì không cần gọi API
+        cache_key = None
+        if self.cache is not None and isinstance(img, np.ndarray):
+            cache_key = board_hash(img)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug("⚡ Gemini cache hit - bỏ qua gọi API")
+                return cached
+        
+        if isinstance(img, np.ndarray):
+            # Cắt lưới, thu nhỏ và nén trước khi upload
+            image_part = self._prepare_payload(img)
+        else:
+            image_part = img
+        
+        board = self._request_board(image_part)
+        if board is not None and cache_key is not None:
+            self.cache.put(cache_key, board)
+        return board
+    
+    def _prepare_payload(self, img, size=GEMINI_PAYLOAD_SIZE, image_format=GEMINI_PAYLOAD_FORMAT,
+                         quality=GEMINI_PAYLOAD_QUALITY, crop=True):
+        """
+        Tối ưu ảnh gửi lên Gemini: cắt viền quanh lưới, thu nhỏ, nén JPEG/PNG
+        
+        Args:
+            img (numpy.ndarray): Ảnh BGR/BGRA
+            size (int): Cạnh dài nhất sau khi thu nhỏ (pixel), None = giữ nguyên
+            image_format (str): 'jpeg' hoặc 'png'
+            quality (int): Chất lượng JPEG (1-100)
+            crop (bool): Cắt viền quanh lưới (False cho ảnh một ô - không có lưới để cắt)
             
-            # Tạo prompt cho Gemini
-            prompt = """
-Bạn là một AI chuyên phân tích game 2048. Hãy phân tích ảnh này và trả về ma trận 4x4 các số trong game.
-
-QUAN TRỌNG:
-- Ảnh chứa một lưới 4x4 của game 2048
-- Mỗi ô có thể chứa số (1, 2, 3, 4, 5, 6, 7, 8, 9, ...) hoặc trống
-- Nếu ô trống, trả về 0
-- Trả về CHÍNH XÁC dưới dạng JSON với format:
-{
-  "board": [
-    [a, b, c, d],
-    [e, f, g, h],
-    [i, j, k, l],
-    [m, n, o, p]
-  ]
-}
-
-Trong đó a, b, c, ... là các số trong ô tương ứng (0 nếu trống).
-
-CHỈ trả về JSON, không thêm text nào khác.
-"""
+        Returns:
+            dict: Blob {'mime_type', 'data'} dùng trực tiếp trong generate_content
+        """
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        
+        if crop:
+            img = crop_to_grid(img)
+        
+        height, width = img.shape[:2]
+        if size and max(height, width) > size:
+            scale = size / max(height, width)
+            img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        
+        if image_format == 'png':
+            ok, encoded = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+            mime_type = 'image/png'
+        else:
+            ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            mime_type = 'image/jpeg'
+        
+        if not ok:
+            raise ValueError("Không nén được ảnh gửi Gemini")
+        
+        return {'mime_type': mime_type, 'data': encoded.tobytes()}
+    
+    def _request_board(self, image_part):
+        """
+        Gọi Gemini với một ảnh và parse board (không qua cache)
+        
+        Args:
+            image_part: Blob ảnh đã nén hoặc PIL Image
             
-            if DEBUG_MODE:
-                print("🤖 Đang gọi Gemini AI để nhận diện...")
+        Returns:
+            list: Ma trận 4x4 các số, hoặc None nếu thất bại
+        """
+        response_text = ""
+        try:
+            logger.debug("🤖 Đang gọi Gemini AI để nhận diện...")
             
             # Gọi Gemini API
-            response = self.model.generate_content([prompt, pil_img])
+            call_start = time.perf_counter()
+            response = self.client.generate_sync([BOARD_PROMPT, image_part])
+            latency = time.perf_counter() - call_start
+            if self.cache is not None:
+                self.cache.record_api_call(latency)
+            
+            payload_bytes = len(image_part['data']) if isinstance(image_part, dict) else None
+            self.call_log.append({'bytes': payload_bytes, 'latency': latency})
             
             # Parse response
             response_text = response.text.strip()
             
-            if DEBUG_MODE:
-                print(f"📝 Gemini response: {response_text}")
+            logger.debug("📝 Gemini response (%.1fKB, %.0fms): %s",
+                         (payload_bytes or 0) / 1024, latency * 1000, response_text)
             
             # Xử lý response - loại bỏ markdown code block nếu có
             if response_text.startswith('```'):
@@ -147,23 +267,150 @@ CHỈ trả về JSON, không thêm text nào khác.
             board = result.get('board')
             
             if board and len(board) == 4 and all(len(row) == 4 for row in board):
-                if DEBUG_MODE:
-                    print("✅ Gemini nhận diện thành công!")
+                logger.debug("✅ Gemini nhận diện thành công!")
                 return board
             else:
-                print("⚠️  Format response không đúng")
+                logger.warning("⚠️  Format response không đúng")
                 return None
         
         except json.JSONDecodeError as e:
-            print(f"❌ Lỗi parse JSON: {e}")
-            if DEBUG_MODE:
-                print(f"Response text: {response_text}")
+            logger.warning("❌ Lỗi parse JSON: %s", e)
+            logger.debug("Response text: %s", response_text)
+            return None
+        
+        except Exception as e:
+            logger.error("❌ Lỗi khi gọi Gemini: %s", e)
+            return None
+    
+    def get_payload_stats(self):
+        """
+        Thống kê kích thước ảnh gửi đi và độ trễ các lần gọi gần đây
+        
+        Returns:
+            dict: Số lần gọi, KB trung bình, độ trễ trung bình (ms)
+        """
+        sizes = [call['bytes'] for call in self.call_log if call['bytes']]
+        latencies = [call['latency'] for call in self.call_log]
+        return {
+            'calls': len(self.call_log),
+            'avg_kb': sum(sizes) / len(sizes) / 1024 if sizes else 0.0,
+            'avg_latency_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        }
+    
+    def recognize_cell(self, cell_img):
+        """
+        Nhận diện MỘT ô (dùng cho board tracking - chỉ ô mới spawn)
+        
+        Args:
+            cell_img (numpy.ndarray): Ảnh một ô
+            
+        Returns:
+            int: Số trong ô (0 nếu trống), hoặc None nếu thất bại
+        """
+        if not self.enabled:
             return None
         
+        try:
+            response = self.client.generate_sync([CELL_PROMPT, self._prepare_payload(cell_img, crop=False)])
+            return self._parse_cell(response)
+        
         except Exception as e:
-            print(f"❌ Lỗi khi gọi Gemini: {e}")
+            logger.error("❌ Lỗi khi gọi Gemini (1 ô): %s", e)
             return None
     
+    def _parse_cell(self, response):
+        """
+        Đọc số trong response của request một ô
+        
+        Returns:
+            int: Số trong ô, hoặc None nếu response không phải một số
+        """
+        text = response.text.strip().strip('`').strip()
+        logger.debug("📝 Gemini (1 ô): %s", text)
+        return int(text) if text.isdigit() else None
+    
+    def recognize_board_with_confidence(self, img):
+        """
+        Nhận diện board kèm độ tin cậy từng ô
+        Gemini không trả về điểm số - dùng độ tin cậy cố định GEMINI_CONFIDENCE cho mọi ô
+        
+        Returns:
+            tuple: (ma trận 4x4 các số, ma trận 4x4 độ tin cậy), hoặc (None, None) nếu thất bại
+        """
+        board = self.recognize_board(img)
+        if board is None:
+            return None, None
+        return board, [[GEMINI_CONFIDENCE] * len(row) for row in board]
+    
+    def recognize_cell_with_confidence(self, cell_img):
+        """
+        Nhận diện MỘT ô kèm độ tin cậy
+        
+        Returns:
+            tuple: (số trong ô, độ tin cậy); (0, 0.0) nếu thất bại
+        """
+        number = self.recognize_cell(cell_img)
+        if number is None:
+            return 0, 0.0
+        return number, GEMINI_CONFIDENCE
+    
+    def recognize_cells_with_confidence(self, cells):
+        """
+        Nhận diện danh sách ô: mỗi ô một request, các request được gửi song song
+        (AsyncGeminiClient.generate_many - vẫn theo rate limit) - chỉ nên dùng cho ít ô
+        
+        Returns:
+            list: [(số, độ tin cậy), ...] theo thứ tự cells ((0, 0.0) cho ô lỗi),
+                None nếu tắt hoặc mọi request đều lỗi
+        """
+        if not self.enabled:
+            return None
+        
+        try:
+            responses = self.client.generate_many_sync(
+                [[CELL_PROMPT, self._prepare_payload(cell_img, crop=False)] for cell_img in cells])
+        except Exception as e:
+            logger.error("❌ Lỗi khi gọi Gemini (%d ô): %s", len(cells), e)
+            return None
+        
+        results = []
+        for response in responses:
+            number = None
+            if isinstance(response, Exception):
+                logger.debug("⚠️  Gemini lỗi (1 ô): %s", response)
+            else:
+                try:
+                    number = self._parse_cell(response)
+                except Exception as e:
+                    logger.debug("⚠️  Response Gemini (1 ô) lỗi: %s", e)
+            results.append((0, 0.0) if number is None else (number, GEMINI_CONFIDENCE))
+        
+        if results and all(confidence == 0.0 for _, confidence in results):
+            return None
+        return results
+    
+    def get_cache_stats(self):
+        """
+        Thống kê cache (None nếu tắt cache)
+        
+        Returns:
+            dict: hits, misses, hit_rate, saved_seconds, entries
+        """
+        return self.cache.get_stats() if self.cache is not None else None
+    
+    def save_cache(self):
+        """
+        Lưu cache ra file để dùng lại lần chạy sau
+        """
+        if self.cache is not None:
+            self.cache.save()
+    
+    def close(self):
+        """
+        Kết thúc phiên: lưu cache (gọi khi dừng chạy và lúc thoát chương trình)
+        """
+        self.save_cache()
+    
     def is_available(self):
         """
         Kiểm tra Gemini có sẵn sử dụng không
@@ -174,14 +421,91 @@ CHỈ trả về JSON, không thêm text nào khác.
         return self.enabled
 
 
+def sweep_payload_settings(recognizer, samples, sizes=(800, 512, 384, 256, 192, 128),
+                           settings=(('png', None), ('jpeg', 90), ('jpeg', 75), ('jpeg', 60)),
+                           target_accuracy=1.0):
+    """
+    Quét độ chính xác theo kích thước ảnh gửi đi trên corpus có nhãn
+    
+    Args:
+        recognizer (GeminiRecognizer): Recognizer (Gemini thật hoặc model giả lập)
+        samples (list): Danh sách (tên, ảnh, board đúng) từ frame_corpus.load_corpus
+        sizes (tuple): Các cạnh dài nhất cần thử (pixel)
+        settings (tuple): Các cặp (format, quality JPEG)
+        target_accuracy (float): Tỉ lệ board đúng hoàn toàn cần đạt
+        
+    Returns:
+        tuple: (danh sách kết quả từng cấu hình, cấu hình nhỏ nhất đạt target hoặc None)
+    """
+    results = []
+    
+    for size in sizes:
+        for image_format, quality in settings:
+            correct_boards = 0
+            correct_cells = 0
+            total_bytes = 0
+            total_latency = 0.0
+            
+            for _, img, truth in samples:
+                image_part = recognizer._prepare_payload(img, size=size, image_format=image_format,
+                                                         quality=quality or 90)
+                start = time.perf_counter()
+                board = recognizer._request_board(image_part)
+                total_latency += time.perf_counter() - start
+                total_bytes += len(image_part['data'])
+                
+                if board == truth:
+                    correct_boards += 1
+                if board:
+                    correct_cells += sum(1 for r in range(4) for c in range(4) if board[r][c] == truth[r][c])
+            
+            count = max(len(samples), 1)
+            results.append({
+                'size': size,
+                'format': image_format,
+                'quality': quality,
+                'board_accuracy': correct_boards / count,
+                'cell_accuracy': correct_cells / (count * 16),
+                'avg_kb': total_bytes / count / 1024,
+                'avg_latency_ms': total_latency / count * 1000,
+            })
+            
+            r = results[-1]
+            logger.debug("   %spx %s q=%s: %.0f%% board, %.1fKB, %.0fms", size, image_format, quality,
+                         r['board_accuracy'] * 100, r['avg_kb'], r['avg_latency_ms'])
+    
+    passing = [r for r in results if r['board_accuracy'] >= target_accuracy]
+    best = min(passing, key=lambda r: r['avg_kb']) if passing else None
+    return results, best
+
+
 # Test module
 if __name__ == "__main__":
+    import sys
+    
     print("🧪 Testing GeminiRecognizer...")
     
-    recognizer = GeminiRecognizer()
+    recognizer = GeminiRecognizer(use_cache=False)
     
     if recognizer.is_available():
         print("✅ Gemini sẵn sàng sử dụng")
     else:
         print("❌ Gemini chưa sẵn sàng")
         print("Cần setup GEMINI_API_KEY")
+    
+    # python gemini_recognizer.py sweep <thư mục corpus>
+    if len(sys.argv) >= 3 and sys.argv[1] == 'sweep' and recognizer.is_available():
+        from frame_corpus import load_corpus
+        
+        print("\n📐 Quét kích thước ảnh gửi Gemini (chú ý quota API!)...")
+        results, best = sweep_payload_settings(recognizer, load_corpus(sys.argv[2]))
+        for r in results:
+            print(f"   {r['size']:4d}px {r['format']:4s} q={r['quality']}: "
+                  f"board {r['board_accuracy'] * 100:5.1f}% | ô {r['cell_accuracy'] * 100:5.1f}% | "
+                  f"{r['avg_kb']:6.1f}KB | {r['avg_latency_ms']:5.0f}ms")
+        if best:
+            print(f"\n✅ Nhỏ nhất vẫn đúng: {best['size']}px {best['format']} q={best['quality']} "
+                  f"({best['avg_kb']:.1f}KB)")
+            print("💡 Cập nhật GEMINI_PAYLOAD_SIZE/FORMAT/QUALITY trong config.py")
+        else:
+            print("⚠️  Không cấu hình nào đạt độ chính xác yêu cầu")
@@ -0,0 +1,373 @@
+"""
+Module tự động tìm lưới game
+Tìm 16 ô của lưới 4x4 trong ảnh chụp (không cần chỉ chuột vào 2 góc),
+tính vùng bên trong mỗi ô (bỏ viền, khe hở, góc bo tròn), lưu cache và
+kiểm tra rẻ mỗi N frame để đi theo cửa sổ game khi bị di chuyển
+"""
+
+import json
+from pathlib import Path
+import numpy as np
+import cv2
+from config import (GRID_SIZE, GRID_INNER_MARGIN, GRID_CHECK_INTERVAL,
+                    GRID_CHECK_TOLERANCE, GRID_CAPTURE_MARGIN, GRID_CACHE_FILE)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class GridLayout:
+    """
+    Vị trí lưới trong ảnh chụp: khung ngoài của từng ô, vùng bên trong (ROI)
+    và các điểm khe hở giữa các ô (dùng để kiểm tra lưới có bị dịch chuyển không)
+    """
+    
+    def __init__(self, cell_boxes, grid_size, inner_margin=GRID_INNER_MARGIN, gap_color=None):
+        """
+        Khởi tạo layout
+        
+        Args:
+            cell_boxes (list): Khung ngoài (x, y, w, h) của từng ô, theo thứ tự hàng
+            grid_size (int): Kích thước lưới
+            inner_margin (float): Tỉ lệ cắt bỏ mỗi cạnh để lấy vùng bên trong ô
+            gap_color (list): Màu BGR của khe hở giữa các ô (None = chưa đo)
+        """
+        self.cell_boxes = [tuple(int(v) for v in box) for box in cell_boxes]
+        self.grid_size = grid_size
+        self.inner_margin = inner_margin
+        self.gap_color = gap_color
+    
+    @property
+    def bounds(self):
+        """
+        Khung bao toàn bộ lưới (x1, y1, x2, y2)
+        """
+        x1 = min(x for x, _, _, _ in self.cell_boxes)
+        y1 = min(y for _, y, _, _ in self.cell_boxes)
+        x2 = max(x + w for x, _, w, _ in self.cell_boxes)
+        y2 = max(y + h for _, y, _, h in self.cell_boxes)
+        return x1, y1, x2, y2
+    
+    def inner_boxes(self):
+        """
+        Vùng bên trong từng ô (x, y, w, h)
+        """
+        boxes = []
+        for x, y, w, h in self.cell_boxes:
+            dx, dy = int(w * self.inner_margin), int(h * self.inner_margin)
+            boxes.append((x + dx, y + dy, w - 2 * dx, h - 2 * dy))
+        return boxes
+    
+    def gap_points(self):
+        """
+        Các điểm giao của khe hở giữa các ô (luôn là màu nền lưới)
+        
+        Returns:
+            list: [(x, y), ...]
+        """
+        size = self.grid_size
+        boxes = self.cell_boxes
+        points = []
+        for row in range(size - 1):
+            for col in range(size - 1):
+                left = boxes[row * size + col]
+                below_right = boxes[(row + 1) * size + col + 1]
+                points.append(((left[0] + left[2] + below_right[0]) // 2,
+                               (left[1] + left[3] + below_right[1]) // 2))
+        return points
+    
+    def split(self, img):
+        """
+        Cắt vùng bên trong của từng ô (view, không copy)
+        
+        Returns:
+            list: Danh sách các ô ảnh [row][col]
+        """
+        boxes = self.inner_boxes()
+        return [[img[y:y + h, x:x + w] for x, y, w, h in boxes[row * self.grid_size:(row + 1) * self.grid_size]]
+                for row in range(self.grid_size)]
+    
+    def translate(self, dx, dy):
+        """
+        Layout mới sau khi dịch gốc tọa độ (vd. khi thu nhỏ vùng chụp quanh lưới)
+        """
+        boxes = [(x + dx, y + dy, w, h) for x, y, w, h in self.cell_boxes]
+        return GridLayout(boxes, self.grid_size, self.inner_margin, self.gap_color)
+    
+    def measure_gap_color(self, img):
+        """
+        Đo màu khe hở từ ảnh (lúc vừa tìm thấy lưới)
+        """
+        colors = [img[y, x, :3].astype(float) for x, y in self.gap_points()
+                  if 0 <= y < img.shape[0] and 0 <= x < img.shape[1]]
+        self.gap_color = np.median(colors, axis=0).tolist() if colors else None
+    
+    def matches(self, img, tolerance=GRID_CHECK_TOLERANCE):
+        """
+        Kiểm tra rẻ: lưới vẫn ở đúng chỗ (các điểm khe hở vẫn có màu nền lưới)
+        
+        Args:
+            img (numpy.ndarray): Ảnh chụp hiện tại
+            tolerance (float): Sai khác màu tối đa (0-255)
+        
+        Returns:
+            bool: True nếu lưới không bị dịch chuyển
+        """
+        x1, y1, x2, y2 = self.bounds
+        if x2 > img.shape[1] or y2 > img.shape[0]:
+            return False
+        if self.gap_color is None:
+            return True
+        
+        gap_color = np.array(self.gap_color)
+        for x, y in self.gap_points():
+            if np.abs(img[y, x, :3].astype(float) - gap_color).max() > tolerance:
+                return False
+        return True
+    
+    def to_dict(self):
+        return {'cell_boxes': self.cell_boxes, 'grid_size': self.grid_size,
+                'inner_margin': self.inner_margin, 'gap_color': self.gap_color}
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['cell_boxes'], data['grid_size'], data['inner_margin'], data.get('gap_color'))
+
+
+def _group_positions(values, tolerance):
+    """
+    Gom các tọa độ gần nhau thành cụm
+    
+    Returns:
+        list: Tâm của từng cụm (tăng dần)
+    """
+    groups = []
+    for value in sorted(values):
+        if groups and value - groups[-1][-1] <= tolerance:
+            groups[-1].append(value)
+        else:
+            groups.append([value])
+    return [float(np.mean(group)) for group in groups]
+
+
+def detect_grid(img, grid_size=GRID_SIZE, inner_margin=GRID_INNER_MARGIN):
+    """
+    Tìm lưới game trong ảnh
+    
+    Các ô của game là những hình vuông cùng kích thước, khác màu với khe hở:
+    tìm contour gần vuông, lấy kích thước phổ biến nhất, gom tâm thành
+    grid_size hàng x grid_size cột (ô có số cũng được, chỉ cần mỗi hàng/cột có ít nhất 1 ô)
+    
+    Args:
+        img (numpy.ndarray): Ảnh chụp BGR/BGRA
+        grid_size (int): Kích thước lưới
+        inner_margin (float): Tỉ lệ cắt bỏ mỗi cạnh ô
+    
+    Returns:
+        GridLayout: Layout tìm được, hoặc None nếu không thấy lưới
+    """
+    bgr = img[:, :, :3] if img.ndim == 3 else img
+    gray = cv2.cvtColor(np.ascontiguousarray(bgr), cv2.COLOR_BGR2GRAY) if bgr.ndim == 3 else bgr
+    
+    edges = cv2.Canny(gray, 10, 40)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    
+    # Ô nhỏ nhất: lưới chiếm ít nhất 1/4 cạnh ngắn của ảnh
+    min_side = min(gray.shape) / (grid_size * 4)
+    max_side = min(gray.shape) / grid_size
+    candidates = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if min_side <= w <= max_side and 0.85 <= w / h <= 1.18:
+            candidates.append((x, y, w, h))
+    
+    if len(candidates) < grid_size:
+        return None
+    
+    # Kích thước ô = kích thước phổ biến nhất (contour viền trong/ngoài, số trong ô bị loại)
+    sides = np.array([w for _, _, w, _ in candidates], dtype=float)
+    side = float(np.median(sides))
+    best = 0
+    for candidate_side in sides:
+        count = np.sum(np.abs(sides - candidate_side) <= candidate_side * 0.08)
+        if count > best:
+            best, side = count, candidate_side
+    cells = [c for c in candidates if abs(c[2] - side) <= side * 0.08 and abs(c[3] - side) <= side * 0.08]
+    
+    columns = _group_positions([x + w / 2 for x, _, w, _ in cells], side / 2)
+    rows = _group_positions([y + h / 2 for _, y, _, h in cells], side / 2)
+    if len(columns) != grid_size or len(rows) != grid_size:
+        logger.debug("⚠️  Không tìm thấy lưới %sx%s (%s hàng x %s cột ứng viên)",
+                     grid_size, grid_size, len(rows), len(columns))
+        return None
+    
+    # Khoảng cách giữa các ô phải đều nhau
+    pitches = np.diff(columns).tolist() + np.diff(rows).tolist()
+    if max(pitches) - min(pitches) > side * 0.15 or min(pitches) < side:
+        return None
+    
+    boxes = [(int(round(cx - side / 2)), int(round(cy - side / 2)), int(round(side)), int(round(side)))
+             for cy in rows for cx in columns]
+    layout = GridLayout(boxes, grid_size, inner_margin)
+    layout.measure_gap_color(bgr)
+    return layout
+
+
+class GridTracker:
+    """
+    Giữ layout lưới cho vòng lặp chính: tìm lưới một lần, cache ra file,
+    kiểm tra rẻ mỗi N frame và tìm lại (cả màn hình nếu cần) khi cửa sổ bị di chuyển
+    """
+    
+    def __init__(self, screen_capture, grid_size=GRID_SIZE, check_interval=GRID_CHECK_INTERVAL,
+                 capture_margin=GRID_CAPTURE_MARGIN, cache_file=GRID_CACHE_FILE, search_screen=True):
+        """
+        Khởi tạo tracker
+        
+        Args:
+            screen_capture (ScreenCapture): Đối tượng chụp (vùng chụp được thu gọn quanh lưới)
+            grid_size (int): Kích thước lưới
+            check_interval (int): Kiểm tra vị trí lưới mỗi N frame
+            capture_margin (int): Lề (pixel) giữ lại quanh lưới khi thu gọn vùng chụp,
+                                  None = không thu gọn vùng chụp
+            cache_file (str): File cache layout, None = không lưu
+            search_screen (bool): Tìm trên toàn màn hình khi mất lưới (False khi replay)
+        """
+        self.screen_capture = screen_capture
+        self.grid_size = grid_size
+        self.check_interval = check_interval
+        self.capture_margin = capture_margin
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.search_screen = search_screen
+        
+        self.layout = None
+        self.frame_shape = None  # Kích thước ảnh chụp mà layout áp dụng
+        self.frames = 0
+        self.relocations = 0
+        self.verified = False  # Layout đã được kiểm tra trên ảnh chụp thật chưa
+        
+        self._load_cache()
+    
+    def _load_cache(self):
+        """
+        Load layout và vùng chụp đã lưu (kiểm tra lại ở frame đầu tiên)
+        """
+        if not self.cache_file or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            self.layout = GridLayout.from_dict(data['layout'])
+            self.frame_shape = tuple(data['frame_shape'])
+            if data['region'] != self.screen_capture.region:
+                self.screen_capture.update_region(data['region'])
+            logger.debug("📚 Đã load vị trí lưới từ %s", self.cache_file)
+        except Exception as e:
+            logger.debug("⚠️  Lỗi load cache lưới: %s", e)
+    
+    def _save_cache(self):
+        if not self.cache_file or self.layout is None:
+            return
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump({'region': self.screen_capture.region, 'frame_shape': list(self.frame_shape),
+                           'layout': self.layout.to_dict()}, f)
+        except Exception as e:
+            logger.error("❌ Lỗi lưu cache lưới: %s", e)
+    
+    def _adopt(self, layout, region, img_shape):
+        """
+        Dùng layout vừa tìm được (ảnh chụp của `region`), thu gọn vùng chụp quanh lưới
+        """
+        if self.capture_margin is not None:
+            x1, y1, x2, y2 = layout.bounds
+            left = max(0, x1 - self.capture_margin)
+            top = max(0, y1 - self.capture_margin)
+            right = min(img_shape[1], x2 + self.capture_margin)
+            bottom = min(img_shape[0], y2 + self.capture_margin)
+            new_region = {'top': region['top'] + top, 'left': region['left'] + left,
+                          'width': right - left, 'height': bottom - top}
+            layout = layout.translate(-left, -top)
+            img_shape = (bottom - top, right - left) + tuple(img_shape[2:])
+            if new_region != self.screen_capture.region:
+                self.screen_capture.update_region(new_region)
+        
+        self.layout = layout
+        self.frame_shape = tuple(img_shape[:2])
+        self._save_cache()
+    
+    def locate(self, img=None, search_screen=True):
+        """
+        Tìm lưới trong ảnh chụp hiện tại, nếu không thấy thì tìm trên toàn màn hình
+        
+        Args:
+            img (numpy.ndarray): Ảnh chụp vùng hiện tại (None = chụp mới)
+            search_screen (bool): Cho phép tìm trên toàn màn hình
+        
+        Returns:
+            GridLayout: Layout, hoặc None nếu không tìm thấy
+        """
+        region = dict(self.screen_capture.region)
+        if img is None:
+            img = np.asarray(self.screen_capture.sct.grab(region))
+        
+        layout = detect_grid(img, self.grid_size)
+        if layout is None and search_screen:
+            monitor = self.screen_capture.sct.monitors[1]
+            region = {key: monitor[key] for key in ('top', 'left', 'width', 'height')}
+            img = np.asarray(self.screen_capture.sct.grab(region))
+            layout = detect_grid(img, self.grid_size)
+        
+        if layout is None:
+            return None
+        
+        self.relocations += 1
+        self._adopt(layout, region, img.shape)
+        logger.debug("🔲 Đã tìm thấy lưới: vùng chụp %s", self.screen_capture.region)
+        return self.layout
+    
+    def cells(self, frame_img):
+        """
+        Lấy các ô (vùng bên trong) từ ảnh chụp - kiểm tra vị trí lưới mỗi N frame
+        
+        Args:
+            frame_img (numpy.ndarray): Ảnh chụp vùng game
+        
+        Returns:
+            list: Các ô ảnh [row][col], None nếu chưa có lưới hợp lệ cho frame này
+        """
+        self.frames += 1
+        layout = self.layout
+        
+        if layout is None or self.frame_shape != tuple(frame_img.shape[:2]):
+            layout = self._relocate(frame_img)
+        
+        elif (not self.verified or self.frames % self.check_interval == 0) and not layout.matches(frame_img):
+            logger.debug("🔲 Lưới bị dịch chuyển - tìm lại")
+            layout = self._relocate(frame_img)
+        
+        if layout is None:
+            return None
+        self.verified = True
+        return layout.split(frame_img)
+    
+    def _relocate(self, frame_img):
+        """
+        Tìm lại lưới cho frame hiện tại
+        
+        Returns:
+            GridLayout: Layout theo tọa độ của frame này (trước khi vùng chụp được thu gọn),
+                        None nếu frame này không chứa lưới (đã tìm trên toàn màn hình nếu được phép)
+        """
+        region = dict(self.screen_capture.region)
+        layout = detect_grid(frame_img, self.grid_size)
+        if layout is None:
+            if self.search_screen:
+                self.locate(search_screen=True)
+            return None
+        
+        self.relocations += 1
+        self._adopt(layout, region, frame_img.shape)
+        logger.debug("🔲 Đã tìm thấy lưới: vùng chụp %s", self.screen_capture.region)
+        return layout
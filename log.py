@@ -0,0 +1,302 @@
+"""
+Module logging - cơ chế log có cấp độ dùng chung cho mọi module
+Mỗi module lấy logger riêng:
+    
+    from log import get_logger
+    logger = get_logger(__name__)
+    logger.debug("Frame #%d (%.1fms)", seq, ms)    # định dạng lười - cấp độ tắt gần như không tốn gì
+
+Bản ghi log được đưa thẳng vào hàng đợi (không định dạng, không copy) và được định dạng,
+ghi ra console/file bởi một thread nền (QueueListener) - vòng lặp chính không bao giờ chờ
+I/O của terminal hay file. Log tốn công chuẩn bị (vd. in cả board) thì kiểm tra
+logger.isEnabledFor(logging.DEBUG) trước.
+
+Đo chi phí log trên vòng lặp auto thật (game giả lập, INFO so với WARNING):
+    
+    python log.py [số nước đi]
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import subprocess
+import sys
+import time
+from config import LOG_LEVEL, LOG_FILE
+
+ROOT_LOGGER = 'auto2048'
+
+# Tham số giữ nguyên kiểu khi định dạng trễ ở thread nền (kiểu khác được định dạng ngay)
+_IMMUTABLE_ARGS = (int, float, str, bool, type(None))
+
+_queue = None
+_queue_handler = None
+_handlers = []
+_listener = None
+
+
+class _RecordQueueHandler(logging.Handler):
+    """
+    Đưa bản ghi thẳng vào hàng đợi: không định dạng và copy bản ghi như QueueHandler.prepare,
+    không lấy lock của handler - thread nền định dạng khi ghi
+    """
+    
+    def __init__(self, log_queue):
+        super().__init__()
+        self.queue = log_queue
+        self.records = 0
+    
+    def handle(self, record):
+        args = record.args
+        if args and not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args):
+            # Tham số có thể bị sửa trước khi thread nền định dạng (vd. list board) - định dạng ngay
+            record.msg = record.getMessage()
+            record.args = None
+        self.records += 1
+        self.queue.put_nowait(record)
+        return True
+    
+    def emit(self, record):
+        self.handle(record)
+
+
+def _skip_record_extras():
+    """
+    Định dạng log không dùng tên file/dòng, thread, process - bỏ thu thập các trường này
+    cho mỗi bản ghi (phần đắt nhất của logger.info phía gọi)
+    """
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """
+    Cấu hình logger gốc (gọi lại chỉ đổi cấp độ)
+    
+    Args:
+        level (str): 'DEBUG', 'INFO', 'WARNING' hoặc 'ERROR'
+        log_file (str): Ghi thêm log ra file (None = chỉ console)
+    
+    Returns:
+        logging.Logger: Logger gốc 'auto2048'
+    """
+    global _queue, _queue_handler, _handlers, _listener
+    
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    if _listener is not None:
+        return root
+    
+    _skip_record_extras()
+    
+    # Console giữ nguyên định dạng print cũ, file có thêm thời gian/cấp độ/module
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    _handlers = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        _handlers.append(file_handler)
+    
+    _queue = queue.SimpleQueue()
+    _queue_handler = _RecordQueueHandler(_queue)
+    root.addHandler(_queue_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(_queue, *_handlers)
+    _listener.start()
+    return root
+
+
+def get_logger(name):
+    """
+    Logger của một module (con của 'auto2048')
+    
+    Args:
+        name (str): Thường là __name__
+    
+    Returns:
+        logging.Logger
+    """
+    if _listener is None:
+        setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def set_level(level):
+    """
+    Đổi cấp độ log lúc chạy (vd. 'DEBUG' khi cần soi một lỗi)
+    """
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
+
+
+def flush_logs(timeout=1.0):
+    """
+    Chờ thread nền ghi hết log đang chờ - gọi trước khi in trực tiếp ra console
+    (menu, bảng thống kê) để thứ tự hiển thị không bị lẫn
+    
+    Args:
+        timeout (float): Thời gian chờ tối đa (giây)
+    """
+    if _queue is None:
+        return
+    deadline = time.perf_counter() + timeout
+    while not _queue.empty() and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    # Chờ bản ghi cuối (đã lấy khỏi hàng đợi) ghi xong
+    for handler in _handlers:
+        handler.acquire()
+        handler.release()
+    sys.stdout.flush()
+
+
+def stop_logging():
+    """
+    Ghi nốt log trong hàng đợi và dừng thread nền
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+        _queue_handler = None
+        for handler in _handlers:
+            handler.close()
+
+
+def benchmark_logging(calls=100000):
+    """
+    Đo chi phí một lần gọi log (ns/lần gọi) trên logger riêng, ghi ra os.devnull:
+    log ở cấp độ tắt, log qua hàng đợi (phía gọi) và print() trực tiếp để so sánh
+    
+    Args:
+        calls (int): Số lần gọi mỗi kiểu
+    
+    Returns:
+        dict: disabled_ns, queued_ns, drain_ns (thread nền ghi hết), print_ns
+    """
+    _skip_record_extras()
+    with open(os.devnull, 'w') as devnull:
+        logger = logging.getLogger(f"{ROOT_LOGGER}-benchmark")
+        logger.propagate = False
+        log_queue = queue.SimpleQueue()
+        handler = _RecordQueueHandler(log_queue)
+        console = logging.StreamHandler(devnull)
+        console.setFormatter(logging.Formatter('%(message)s'))
+        listener = logging.handlers.QueueListener(log_queue, console)
+        logger.addHandler(handler)
+        listener.start()
+        
+        try:
+            results = {}
+            
+            logger.setLevel(logging.INFO)
+            start = time.perf_counter()
+            for i in range(calls):
+                logger.debug("Frame #%d (%.1fms)", i, 1.5)
+            results['disabled_ns'] = (time.perf_counter() - start) / calls * 1e9
+            
+            start = time.perf_counter()
+            for i in range(calls):
+                logger.info("Frame #%d (%.1fms)", i, 1.5)
+            results['queued_ns'] = (time.perf_counter() - start) / calls * 1e9
+            while not log_queue.empty():
+                time.sleep(0.001)
+            results['drain_ns'] = (time.perf_counter() - start) / calls * 1e9
+            
+            start = time.perf_counter()
+            for i in range(calls):
+                print(f"Frame #{i} ({1.5:.1f}ms)", file=devnull)
+            results['print_ns'] = (time.perf_counter() - start) / calls * 1e9
+        
+        finally:
+            listener.stop()
+            logger.removeHandler(handler)
+    
+    return results
+
+
+# Chạy run_auto trên game giả lập trong tiến trình Python mới với cấp độ log cho trước
+# (cùng seed cho mọi cấp độ; bỏ đếm ngược trước khi chạy)
+_LOOP_PROBE = """
+import json, time
+import config
+config.LOG_LEVEL = %(level)r
+config.CAPTURE_BACKEND = config.INPUT_BACKEND = 'synthetic'
+config.AUTO_GRID_DETECTION = True
+config.PIPELINED_LOOP = False
+config.RECORD_SESSIONS = config.METRICS_ENABLED = config.DEBUG_FRAMES = False
+sleep = time.sleep
+time.sleep = lambda seconds: None if seconds >= 1 else sleep(seconds)
+
+import log
+import main
+auto = main.Auto2048()
+auto.simulator.random.seed(0)
+auto.screen_capture.renderer.random.seed(0)
+auto.run_auto(max_moves=%(moves)d)
+print("LOOP_RESULT " + json.dumps({'moves': auto.move_count, 'seconds': auto.run_seconds,
+                                   'solve': auto.stage_times.get('solve', [0.0])[0],
+                                   'records': log._queue_handler.records}))
+"""
+
+
+def benchmark_loop(moves=200, levels=('WARNING', 'INFO')):
+    """
+    Đo chi phí log trên vòng lặp auto thật: run_auto trên game giả lập với từng cấp độ log
+    (mỗi cấp độ một tiến trình mới, console là pipe)
+    
+    Args:
+        moves (int): Số nước đi mỗi lần chạy
+        levels (tuple): Các cấp độ log cần đo
+    
+    Returns:
+        dict: {cấp độ: {'moves', 'seconds', 'solve' (tổng thời gian tìm kiếm), 'records'}}
+    
+    Raises:
+        RuntimeError: Một lần chạy lỗi
+    """
+    results = {}
+    for level in levels:
+        probe = _LOOP_PROBE % {'level': level, 'moves': moves}
+        output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        for line in output.stdout.splitlines():
+            if line.startswith("LOOP_RESULT "):
+                results[level] = json.loads(line[len("LOOP_RESULT "):])
+                break
+        else:
+            error = output.stderr.strip().splitlines()[-1:] or ["không có kết quả"]
+            raise RuntimeError(f"Lần chạy với LOG_LEVEL={level} lỗi: {error[0]}")
+    return results
+
+
+atexit.register(stop_logging)
+
+
+# Đo chi phí log
+if __name__ == "__main__":
+    moves = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("🧪 Benchmark logging (100000 lần gọi, ghi ra os.devnull)...")
+    result = benchmark_logging()
+    print(f"   logger.debug (cấp độ tắt): {result['disabled_ns']:.0f}ns/lần")
+    print(f"   logger.info (qua hàng đợi, phía gọi): {result['queued_ns']:.0f}ns/lần")
+    print(f"   logger.info (đến khi thread nền ghi xong): {result['drain_ns']:.0f}ns/lần")
+    print(f"   print() trực tiếp: {result['print_ns']:.0f}ns/lần (os.devnull - terminal thật chậm hơn và chặn vòng lặp)")
+    
+    print(f"\n🧪 Vòng lặp auto trên game giả lập ({moves} nước đi)...")
+    loops = benchmark_loop(moves)
+    for level, loop in loops.items():
+        count = max(loop['moves'], 1)
+        per_move = loop['seconds'] / count
+        # Thời gian tìm kiếm thay đổi theo board - phần còn lại mới là chi phí vòng lặp
+        overhead = (loop['seconds'] - loop['solve']) / count
+        records = loop['records'] / count
+        logging_cost = records * result['queued_ns'] / 1e9
+        print(f"   LOG_LEVEL={level}: {per_move * 1000:.2f}ms/nước (ngoài tìm kiếm {overhead * 1000:.2f}ms) | "
+              f"{records:.1f} bản ghi/nước | log phía gọi ≈ {logging_cost * 1e6:.1f}µs/nước "
+              f"({logging_cost / per_move * 100:.3f}%)")
@@ -3,17 +3,28 @@ Main - File chính để chạy tool Auto 2048
 Kết hợp tất cả các module để tạo thành tool hoàn chỉnh
 """
 
+import logging
 import time
 import sys
-from dotenv import load_dotenv
-from screen_capture import ScreenCapture
+from screen_capture import create_capture_backend
+from capture_thread import ThreadedCapture
 from game_state import GameState
 from ai_solver import AISolver
-from game_controller import GameController
-from config import SCREEN_REGION, GRID_SIZE, SEARCH_DEPTH, MOVE_DELAY, DEBUG_MODE
+from game_controller import GameController, AdaptiveDelay, create_input_backend
+from grid_detector import GridTracker
+from session_recorder import SessionRecorder
+from pipeline import PipelinedRunner
+from metrics import MoveMetrics
+from debug_frames import DebugFrameSink
+from log import get_logger, flush_logs
+from config import (SCREEN_REGION, GRID_SIZE, SEARCH_DEPTH, MOVE_DELAY,
+                    SETTLE_DETECTION, AUTO_GRID_DETECTION, RECORD_SESSIONS,
+                    CAPTURE_BACKEND, INPUT_BACKEND, PIPELINED_LOOP, METRICS_ENABLED, DEBUG_FRAMES,
+                    MISSED_MOVE_DETECTION, MISSED_MOVE_TIMEOUT, MISSED_MOVE_RETRIES, MISSED_MOVE_BACKOFF,
+                    SETTLE_DOWNSAMPLE,
+                    ADAPTIVE_MOVE_DELAY)
 
-# Load environment variables (cho Gemini API key)
-load_dotenv()
+logger = get_logger(__name__)
 
 
 class Auto2048:
@@ -28,15 +39,45 @@ class Auto2048:
         print("🚀 Đang khởi tạo Auto 2048 Tool...")
         
         # Khởi tạo các component
-        self.screen_capture = ScreenCapture()
+        # Game giả lập dùng chung cho capture/input 'synthetic' (chạy không cần màn hình)
+        self.simulator = None
+        if 'synthetic' in (CAPTURE_BACKEND, INPUT_BACKEND):
+            from synthetic_game import GameSimulator
+            self.simulator = GameSimulator(GRID_SIZE)
+        self.screen_capture = create_capture_backend(CAPTURE_BACKEND, self.simulator)
+        self.threaded = isinstance(self.screen_capture, ThreadedCapture)
+        # Tìm lưới tự động, chỉ nhận diện phần bên trong mỗi ô
+        self.grid_tracker = GridTracker(self.screen_capture) if AUTO_GRID_DETECTION else None
         self.game_state = GameState(GRID_SIZE)
+        self.game_state.start_warm_up()  # Load AI model nền trong lúc người dùng chọn menu
         self.ai_solver = AISolver(SEARCH_DEPTH)
-        self.game_controller = GameController(MOVE_DELAY)
+        # Đo thời gian phản hồi + animation để tự học move_delay (settle detection: đo mọi nước đi)
+        adaptive_delay = AdaptiveDelay(MOVE_DELAY) if ADAPTIVE_MOVE_DELAY else None
+        if SETTLE_DETECTION:
+            # Không sleep cố định - chờ màn hình ổn định sau mỗi nước đi
+            input_backend = create_input_backend(INPUT_BACKEND, key_pause=0.0, simulator=self.simulator)
+            self.game_controller = GameController(move_delay=0.0, input_backend=input_backend,
+                                                  adaptive_delay=adaptive_delay)
+        else:
+            input_backend = create_input_backend(INPUT_BACKEND, simulator=self.simulator)
+            self.game_controller = GameController(MOVE_DELAY, input_backend=input_backend,
+                                                  adaptive_delay=adaptive_delay)
         
         # Biến trạng thái
         self.is_running = False
         self.move_count = 0
         self.best_score = 0
+        self.settle_times = []  # Thời gian chờ animation thực tế mỗi nước đi (giây)
+        self.stage_times = {}   # {tên bước: [tổng thời gian (giây), số lần]}
+        self.run_seconds = 0.0  # Thời gian chạy của lần auto gần nhất
+        self.pipeline_stats = None
+        # Phím bị rơi (màn hình không đổi sau khi gửi) và thời gian từ lần gửi đầu đến khi game phản hồi
+        self.missed_moves = {'missed': 0, 'resent': 0, 'recovered': 0, 'unrecovered': 0, 'unconfirmed': 0}
+        self.recovery_times = []
+        # Thời gian từng bước của mỗi nước đi -> JSON lines + file Prometheus
+        self.metrics = MoveMetrics() if METRICS_ENABLED else None
+        # Frame debug ghi ở thread nền (chỉ khi bất thường hoặc lấy mẫu)
+        self.debug_frames = DebugFrameSink() if DEBUG_FRAMES or logger.isEnabledFor(logging.DEBUG) else None
         
         print("✅ Khởi tạo thành công!")
     
@@ -47,6 +88,21 @@ class Auto2048:
         print("\n" + "="*60)
         print("📍 SETUP VÙ NƠM GAME")
         print("="*60)
+        
+        if self.grid_tracker is not None:
+            print("\nMở game và hiển thị mini game 2048")
+            choice = input("Nhấn Enter để tự động tìm lưới (hoặc 'm' để chọn thủ công): ").strip().lower()
+            if choice != 'm':
+                layout = self.grid_tracker.locate()
+                if layout is not None:
+                    region = self.screen_capture.region
+                    print(f"✅ Đã tìm thấy lưới {GRID_SIZE}x{GRID_SIZE}: {region}")
+                    img = self.screen_capture.capture()
+                    self.screen_capture.save_debug_image(img, "setup_test.png")
+                    print("✅ Đã lưu ảnh test: setup_test.png")
+                    return region
+                print("❌ Không tìm thấy lưới - chuyển sang chọn thủ công")
+        
         print("\nBước 1: Mở game và hiển thị mini game 2048")
         print("Bước 2: Di chuyển chuột đến góc TRÊN TRÁI của lưới game")
         print("Bước 3: Nhấn Enter...")
@@ -98,65 +154,303 @@ class Auto2048:
             list: Board hiện tại, hoặc None nếu thất bại
         """
         try:
-            # Chụp màn hình
-            img = self.screen_capture.capture()
-            
-            # Tiền xử lý ảnh
-            processed = self.screen_capture.preprocess_image(img)
+            # Chụp màn hình (zero-copy)
+            frame = self.screen_capture.capture_frame()
             
-            # Chia thành lưới
-            grid = self.screen_capture.split_into_grid(processed, GRID_SIZE)
+            # Chia thành lưới (view, không copy)
+            grid = self.split_grid(frame.raw, frame)
             
             # Nhận diện trạng thái (truyền cả ảnh đầy đủ cho Gemini)
-            board = self.game_state.update_from_grid(grid, full_image=img)
-            
-            # Lưu ảnh debug nếu cần
-            if DEBUG_MODE:
-                self.screen_capture.save_debug_image(img, f"capture_{self.move_count}.png")
+            desyncs = self.game_state.tracking_stats['desync']
+            board = self.game_state.update_from_grid(grid, full_image=frame.raw)
+            self.check_frame(frame, board, desyncs)
             
             return board
             
         except Exception as e:
-            print(f"❌ Lỗi khi phân tích game: {e}")
+            logger.error("❌ Lỗi khi phân tích game: %s", e)
             return None
     
-    def make_move(self, direction):
+    def split_grid(self, img, frame=None):
+        """
+        Chia ảnh chụp thành các ô: vùng bên trong ô nếu tìm được lưới,
+        nếu không thì chia đều vùng chụp
+        
+        Args:
+            img (numpy.ndarray): Ảnh chụp vùng game
+            frame (Frame): Frame chứa ảnh (chia đều bằng frame.cells nếu không có lưới)
+        
+        Returns:
+            list: Danh sách các ô ảnh [row][col] (view, không copy)
+        """
+        if self.grid_tracker is not None:
+            cells = self.grid_tracker.cells(img)
+            if cells is not None:
+                return cells
+        if frame is not None:
+            return frame.cells(GRID_SIZE)
+        return self.screen_capture.split_into_grid(img, GRID_SIZE)
+    
+    def check_frame(self, frame, board, desyncs):
+        """
+        Kiểm tra kết quả nhận diện của frame:
+        tracking lệch và board không phải board dự đoán + 1 ô spawn khi không chờ màn hình ổn định
+        -> frame có thể chụp giữa animation, tăng move_delay;
+        đưa frame vào bộ ghi debug - nhận diện lỗi hoặc tracking lệch thì ghi cả ring buffer
+        
+        Args:
+            frame (Frame): Frame vừa nhận diện
+            board (list): Kết quả nhận diện (None = không backend nào nhận diện được -> 'misread')
+            desyncs (int): tracking_stats['desync'] trước khi nhận diện
+        """
+        desynced = self.game_state.tracking_stats['desync'] > desyncs
+        if desynced and not SETTLE_DETECTION and board is not None and not self.game_state.follows_prediction(board):
+            self.game_controller.report_early_frame()
+        if self.debug_frames is None:
+            return
+        reason = None
+        if board is None:
+            reason = 'misread'
+        elif desynced:
+            reason = 'desync'
+        self.debug_frames.add(frame.raw, self.move_count, reason)
+    
+    def record_stage_times(self, timings):
+        """
+        Cộng dồn thời gian từng bước xử lý của một frame
+        
+        Args:
+            timings (dict): {tên bước: giây} từ Frame.timings
+        """
+        for stage, seconds in timings.items():
+            total = self.stage_times.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+    
+    def select_search_depth(self, board):
+        """
+        Chọn độ sâu tìm kiếm theo số ô trống (càng ít ô trống càng tìm sâu)
+        
+        Args:
+            board (list): Board hiện tại
+        
+        Returns:
+            int: 5 khi còn từ 5 ô trống, tăng 1 cho mỗi ô ít hơn (tối đa 10)
+        """
+        count_empty = sum(1 for row in board for cell in row if cell == 0)
+        return max(5, 10 - count_empty)
+    
+    def start_recorder(self):
+        """
+        Mở file ghi phiên cho lần chạy auto
+        
+        Returns:
+            SessionRecorder: Recorder đã ghi thông tin phiên
+        """
+        recorder = SessionRecorder(session_info={
+            'region': self.screen_capture.region,
+            'ai_model': self.game_state.ai_model,
+            'mode': self.game_state.mode,
+            'spawn_value': self.ai_solver.spawn_value,
+        })
+        print(f"📼 Đang ghi phiên: {recorder.path}")
+        return recorder
+    
+    def change_boxes(self):
+        """
+        Khung từng ô trên ảnh thu nhỏ (snapshot) theo lưới đã tìm được
+        
+        Returns:
+            list: Khung (x, y, w, h) của từng ô, None nếu chưa có lưới (chia đều vùng chụp)
+        """
+        layout = self.grid_tracker.layout if self.grid_tracker is not None else None
+        if layout is None:
+            return None
+        step = SETTLE_DOWNSAMPLE
+        return [(x // step, y // step, max(1, w // step), max(1, h // step)) for x, y, w, h in layout.cell_boxes]
+    
+    def board_unchanged(self, board):
+        """
+        Chụp lại và kiểm tra mọi ô vẫn khớp board trước nước đi (chữ ký từng ô)
+        
+        Args:
+            board (list): Board trước nước đi
+            
+        Returns:
+            bool: True nếu chắc chắn board chưa đổi, False nếu đã đổi hoặc không biết
+        """
+        if board is None:
+            return False
+        frame = self.screen_capture.capture_frame()
+        return self.game_state.matches_board(self.split_grid(frame.raw, frame), board)
+    
+    def send_move_confirmed(self, direction, reference, timings=None, wait=True, board=None):
+        """
+        Gửi phím và kiểm tra game có phản hồi (có ô trên ảnh thu nhỏ khác ảnh trước nước đi).
+        Không ô nào đổi -> phím có thể bị rơi: chỉ gửi lại khi chụp lại thấy board chắc chắn
+        vẫn như cũ, nếu không thì để lần nhận diện sau xử lý (gửi nhầm là thêm một nước đi)
+        
+        Args:
+            direction (str): Hướng di chuyển
+            reference (numpy.ndarray): Ảnh thu nhỏ trước nước đi (None = không kiểm tra)
+            timings (dict): Nếu có, ghi thời gian 'confirm' (chờ phản hồi + gửi lại)
+            wait (bool): Sleep move_delay sau mỗi lần gửi
+            board (list): Board trước nước đi - để xác nhận board chưa đổi trước khi gửi lại
+        
+        Returns:
+            tuple: (gửi thành công, màn hình đã thay đổi)
+        """
+        first_press = time.perf_counter()
+        self.screen_capture.mark_input()
+        if not self.game_controller.send_move(direction, wait):
+            return False, False
+        if reference is None:
+            return True, True
+        
+        confirm_start = time.perf_counter()
+        boxes = self.change_boxes()
+        changed, _ = self.screen_capture.wait_for_change(reference, timeout=MISSED_MOVE_TIMEOUT, boxes=boxes)
+        if not changed:
+            self.missed_moves['missed'] += 1
+            for attempt in range(MISSED_MOVE_RETRIES):
+                time.sleep(MISSED_MOVE_BACKOFF * 2 ** attempt)
+                if not self.board_unchanged(board):
+                    # Không chắc phím bị rơi - không gửi lại, nhận diện lại toàn bộ
+                    logger.warning("⚠️  Không xác nhận được board chưa đổi - không gửi lại phím %s", direction)
+                    self.missed_moves['unconfirmed'] += 1
+                    break
+                logger.warning("🔁 Game không phản hồi phím %s - gửi lại (lần %d)", direction, attempt + 1)
+                self.missed_moves['resent'] += 1
+                self.screen_capture.mark_input()
+                if not self.game_controller.send_move(direction, wait):
+                    return False, False
+                changed, _ = self.screen_capture.wait_for_change(reference, timeout=MISSED_MOVE_TIMEOUT,
+                                                                 boxes=boxes)
+                if changed:
+                    self.missed_moves['recovered'] += 1
+                    self.recovery_times.append(time.perf_counter() - first_press)
+                    break
+            else:
+                self.missed_moves['unrecovered'] += 1
+                if self.debug_frames is not None:
+                    self.debug_frames.flag('missed')
+        
+        if timings is not None:
+            timings['confirm'] = time.perf_counter() - confirm_start
+        return True, changed
+    
+    def send_and_settle(self, direction, board=None):
+        """
+        Gửi phím (gửi lại nếu game không phản hồi) rồi chờ animation:
+        settle detection hoặc nước đi được đo để tự học move_delay -> chờ màn hình ổn định
+        (đo thời gian phản hồi + animation), còn lại -> sleep move_delay
+        
+        Args:
+            direction (str): Hướng di chuyển
+            board (list): Board trước nước đi (xác nhận board chưa đổi trước khi gửi lại phím)
+        
+        Returns:
+            tuple: (gửi thành công, game đã phản hồi, {'input', 'wait', 'confirm', 'settle'} - giây)
+        """
+        controller = self.game_controller
+        measure = SETTLE_DETECTION or controller.should_probe()
+        
+        # Ảnh tham chiếu trước nước đi để biết khi nào game bắt đầu phản hồi
+        reference = self.screen_capture.snapshot() if measure or MISSED_MOVE_DETECTION else None
+        
+        send_start = time.perf_counter()
+        timings = {}
+        success, changed = self.send_move_confirmed(direction, reference if MISSED_MOVE_DETECTION else None,
+                                                    timings, wait=not measure, board=board)
+        if not success:
+            return False, False, {}
+        timings['input'] = controller.last_press_time
+        timings['wait'] = (time.perf_counter() - send_start - controller.last_press_time
+                           - timings.get('confirm', 0.0))
+        if not changed:
+            return True, False, timings
+        
+        if measure:
+            # Chờ đến khi animation kết thúc thay vì sleep cố định
+            # (đã thấy màn hình thay đổi thì không cần chờ phản hồi nữa)
+            if MISSED_MOVE_DETECTION:
+                response = self.screen_capture.last_response_time
+                settled, elapsed = self.screen_capture.wait_until_settled(None)
+                animation = elapsed
+            else:
+                settled, elapsed = self.screen_capture.wait_until_settled(reference)
+                response = self.screen_capture.last_response_time
+                animation = elapsed - (response or 0.0)
+            if settled and response is not None:
+                controller.record_animation(response, animation)
+            self.settle_times.append(elapsed)
+            timings['settle'] = elapsed
+        elif controller.adaptive_delay is None:
+            # Chờ thêm một chút để game xử lý (delay tự học đã tính cả animation)
+            wait_start = time.perf_counter()
+            time.sleep(0.05)
+            timings['wait'] += time.perf_counter() - wait_start
+        return True, True, timings
+    
+    def make_move(self, direction, board=None, timings=None):
         """
         Thực hiện một nước đi
         
         Args:
             direction (str): Hướng di chuyển
+            board (list): Board trước nước đi - dùng để dự đoán board tiếp theo (tracking)
+            timings (dict): Nếu có, ghi thời gian 'input' (gửi phím), 'wait' (move_delay),
+                'confirm' (chờ game phản hồi), 'settle'
             
         Returns:
-            bool: True nếu thành công
+            bool: True nếu gửi được phím (kể cả khi game không phản hồi - lần sau nhận diện lại toàn bộ)
         """
         if direction is None:
-            print("⚠️  Không tìm thấy nước đi hợp lệ!")
+            logger.warning("⚠️  Không tìm thấy nước đi hợp lệ!")
             return False
         
-        # Gửi phím
-        success = self.game_controller.send_move(direction)
+        # Gửi phím và chờ animation
+        success, changed, move_timings = self.send_and_settle(direction, board)
+        if timings is not None:
+            timings.update(move_timings)
+        
+        if success and not changed:
+            # Vẫn không đổi sau khi gửi lại: nước đi không hợp lệ với board thật (nhận diện sai?)
+            logger.warning("⚠️  Game không phản hồi nước đi %s - nhận diện lại toàn bộ", direction)
+            self.game_state.set_predicted_board(None)
+            return True
         
         if success:
             self.move_count += 1
-            print(f"✅ Nước đi #{self.move_count}: {direction}")
+            logger.info("✅ Nước đi #%d: %s", self.move_count, direction)
+            
+            # Dự đoán board sau nước đi - lần nhận diện sau chỉ cần tìm ô spawn
+            if board is not None:
+                self.game_state.set_predicted_board(self.ai_solver.move(board, direction))
+        else:
+            self.game_state.set_predicted_board(None)
         
         return success
     
-    def run_auto(self, max_moves=None, auto_learn=False):
+    def run_auto(self, max_moves=None, auto_learn=False, record=RECORD_SESSIONS):
         """
         Chạy auto với số lượng nước đi giới hạn hoặc không giới hạn
         
         Args:
             max_moves (int): Số nước đi tối đa (None = không giới hạn)
             auto_learn (bool): Tự động train Tesseract từ kết quả Gemini
+            record (bool): Ghi lại phiên để replay offline (session_recorder.py)
         """
         print("\n" + "="*60)
         print("🤖 BẮT ĐẦU CHẠY AUTO")
         print("="*60)
         print(f"AI Model: {self.game_state.ai_model.upper()}")
         print(f"Độ sâu tìm kiếm: {SEARCH_DEPTH}")
-        print(f"Thời gian chờ giữa nước đi: {MOVE_DELAY}s")
+        if SETTLE_DETECTION:
+            print("Thời gian chờ giữa nước đi: tự động (settle detection)")
+        else:
+            delay_mode = " (tự học từ thời gian animation)" if ADAPTIVE_MOVE_DELAY else ""
+            print(f"Thời gian chờ giữa nước đi: {self.game_controller.move_delay:.2f}s{delay_mode}")
         if auto_learn:
             print("🎓 Chế độ: AUTO + LEARN (Gemini train Tesseract)")
         if max_moves:
@@ -164,7 +458,8 @@ class Auto2048:
         else:
             print("Số nước đi: Không giới hạn")
         print("\n⚠️  Nhấn Ctrl+C để dừng")
-        print("⚠️  Di chuột lên góc trên trái màn hình để dừng khẩn cấp")
+        if getattr(self.game_controller.backend, 'failsafe', False):
+            print("⚠️  Di chuột lên góc trên trái màn hình để dừng khẩn cấp")
         
         # Đếm ngược
         for i in range(3, 0, -1):
@@ -173,9 +468,24 @@ class Auto2048:
         
         print("\n🎮 Đang chạy...\n")
         
+        if PIPELINED_LOOP and not auto_learn:
+            self.run_pipelined(max_moves, record)
+            return
+        
         self.is_running = True
         self.move_count = 0
+        self.settle_times = []
+        self.stage_times = {}
+        self.missed_moves = dict.fromkeys(self.missed_moves, 0)
+        self.recovery_times = []
+        self.pipeline_stats = None
         learned_count = 0  # Đếm số template đã học
+        run_start = time.perf_counter()
+        
+        recorder = self.start_recorder() if record else None
+        
+        if self.threaded:
+            self.screen_capture.start()
         
         try:
             while self.is_running:
@@ -184,33 +494,47 @@ class Auto2048:
                     print(f"\n✅ Đã đạt số nước đi tối đa: {max_moves}")
                     break
                 
-                # Chụp màn hình
-                img = self.screen_capture.capture()
-                processed = self.screen_capture.preprocess_image(img)
-                grid = self.screen_capture.split_into_grid(img, GRID_SIZE)
+                # Chụp màn hình (zero-copy) - recognizer nhận ô BGRA (view) và tự xử lý
+                frame = self.screen_capture.capture_frame()
+                grid = self.split_grid(frame.raw, frame)
+                # Ảnh ghi phiên được copy trước khi nhận diện (frame là view vào buffer chụp)
+                recorded = frame.raw.copy() if recorder is not None else None
                 
                 # Phân tích bằng AI model hiện tại
-                board = self.game_state.update_from_grid(grid, full_image=img)
+                recognize_start = time.perf_counter()
+                desyncs = self.game_state.tracking_stats['desync']
+                board = self.game_state.update_from_grid(grid, full_image=frame.raw)
+                frame.timings['recognize'] = time.perf_counter() - recognize_start
+                self.record_stage_times(frame.timings)
+                self.check_frame(frame, board, desyncs)
                 
                 if board is None:
-                    print("❌ Không thể phân tích game!")
+                    if recorder is not None:
+                        recorder.record(recorded, None, timings=frame.timings,
+                                        stats={'move': self.move_count}, copy=False)
+                    logger.error("❌ Không thể phân tích game!")
                     break
                 
-                # Auto-learn: Dùng kết quả Gemini để train Tesseract
+                # Auto-learn: Dùng kết quả Gemini để học templates
+                # (mẫu trùng bị bỏ qua, file được ghi theo lô ở thread nền)
                 if auto_learn and self.game_state.ai_model == 'gemini':
+                    template_recognizer = self.game_state.get_template_recognizer()
                     for row in range(GRID_SIZE):
                         for col in range(GRID_SIZE):
                             number = board[row][col]
                             if number > 0:  # Chỉ học các ô có số
                                 cell_img = grid[row][col]
-                                self.game_state.recognizer.save_template(number, cell_img)
-                                learned_count += 1
+                                if template_recognizer.save_template(number, cell_img):
+                                    learned_count += 1
                     
                     if self.move_count % 5 == 0 and learned_count > 0:  # Thông báo mỗi 5 moves
-                        print(f"🎓 Đã học {learned_count} templates cho Tesseract")
+                        logger.info("🎓 Đã học %d templates cho Tesseract", learned_count)
                 
                 # Kiểm tra game over
                 if self.game_state.is_game_over():
+                    if recorder is not None:
+                        recorder.record(recorded, board, timings=frame.timings,
+                                        stats={'move': self.move_count, 'game_over': True}, copy=False)
                     print("\n🎮 Game Over!")
                     break
                 
@@ -226,37 +550,38 @@ class Auto2048:
                 
                 # Tự động điều chỉnh search_depth dựa trên số ô trống
                 old_depth = self.ai_solver.search_depth
-                new_depth = 5  # Mặc định
-                
-                if count_empty < 1:
-                    new_depth = 10
-                elif count_empty < 2:
-                    new_depth = 9
-                elif count_empty < 3:
-                    new_depth = 8
-                elif count_empty < 4:
-                    new_depth = 7
-                elif count_empty < 5:
-                    new_depth = 6
-                else:
-                    new_depth = 5
+                new_depth = self.select_search_depth(board)
                 
                 # Cập nhật nếu thay đổi
                 if new_depth != old_depth:
                     self.ai_solver.set_search_depth(new_depth)
-                    print(f"🧠 Điều chỉnh SEARCH_DEPTH: {old_depth} → {new_depth} (Ô trống: {count_empty})")
+                    logger.info("🧠 Điều chỉnh SEARCH_DEPTH: %d → %d (Ô trống: %d)", old_depth, new_depth, count_empty)
                 
-                print(f"📊 Điểm: {current_score} | Ô lớn nhất: {max_tile} | Ô trống: {count_empty} | Nước đi: {self.move_count} | Depth: {self.ai_solver.search_depth}")
+                logger.info("📊 Điểm: %d | Ô lớn nhất: %d | Ô trống: %d | Nước đi: %d | Depth: %d",
+                            current_score, max_tile, count_empty, self.move_count, self.ai_solver.search_depth)
                 
                 # Tìm nước đi tốt nhất
+                solve_start = time.perf_counter()
                 best_move = self.ai_solver.get_best_move(board)
+                frame.timings['solve'] = time.perf_counter() - solve_start
+                self.record_stage_times({'solve': frame.timings['solve']})
+                
+                if recorder is not None:
+                    recorder.record(recorded, board, best_move, timings=frame.timings, stats={
+                        'move': self.move_count, 'depth': self.ai_solver.search_depth,
+                        'score': current_score, 'max_tile': max_tile, 'empty': count_empty,
+                    }, copy=False)
                 
                 # Thực hiện nước đi
-                if not self.make_move(best_move):
+                move_timings = {}
+                if not self.make_move(best_move, board, move_timings):
                     break
                 
-                # Chờ một chút để game xử lý
-                time.sleep(0.05)
+                if self.metrics is not None:
+                    self.metrics.observe_move({**frame.timings, **move_timings}, nodes=self.ai_solver.nodes,
+                                              depth=self.ai_solver.search_depth, move=best_move)
+                if self.debug_frames is not None:
+                    self.debug_frames.check_move(sum(frame.timings.values()) + sum(move_timings.values()))
         
         except KeyboardInterrupt:
             print("\n\n⏹️  Đã dừng bởi người dùng")
@@ -266,24 +591,170 @@ class Auto2048:
         
         finally:
             self.is_running = False
+            self.run_seconds = time.perf_counter() - run_start
+            if self.threaded:
+                self.screen_capture.stop()
+            if recorder is not None:
+                recorder.close()
+                print(f"📼 Đã ghi {recorder.iterations} vòng lặp: {recorder.path}")
+            if self.metrics is not None:
+                self.metrics.flush()
+            if self.game_state.gemini_recognizer:
+                self.game_state.gemini_recognizer.close()
+            if auto_learn and self.game_state.template_recognizer:
+                self.game_state.template_recognizer.flush_templates()
             self.print_summary()
             
             if auto_learn and learned_count > 0:
                 print(f"\n🎓 TỔNG KẾT AUTO-LEARN:")
                 print(f"   Đã học {learned_count} templates")
-                print(f"   Templates đã lưu vào thư mục 'templates/'")
+                print(f"   Templates đã lưu vào 'templates/store_v1.npy'")
                 print(f"   💡 Bây giờ có thể chuyển sang Tesseract (option 7 → 3)")
     
+    def run_pipelined(self, max_moves=None, record=RECORD_SESSIONS):
+        """
+        Chạy auto bằng pipeline asyncio (pipeline.py): chụp/nhận diện, tìm kiếm,
+        gửi phím và log chạy thành các stage song song
+        
+        Args:
+            max_moves (int): Số nước đi tối đa (None = không giới hạn)
+            record (bool): Ghi lại phiên để replay offline
+        """
+        self.is_running = True
+        self.move_count = 0
+        self.settle_times = []
+        self.stage_times = {}
+        self.missed_moves = dict.fromkeys(self.missed_moves, 0)
+        self.recovery_times = []
+        self.pipeline_stats = None
+        run_start = time.perf_counter()
+        
+        recorder = self.start_recorder() if record else None
+        runner = PipelinedRunner(self, max_moves, recorder, metrics=self.metrics)
+        
+        if self.threaded:
+            self.screen_capture.start()
+        
+        try:
+            self.pipeline_stats = runner.run()
+            print(f"\n{self.pipeline_stats['stop_reason']}")
+        
+        except KeyboardInterrupt:
+            print("\n\n⏹️  Đã dừng bởi người dùng")
+            self.pipeline_stats = runner.get_stats()
+        
+        except Exception as e:
+            print(f"\n❌ Lỗi: {e}")
+            self.pipeline_stats = runner.get_stats()
+        
+        finally:
+            self.is_running = False
+            self.run_seconds = time.perf_counter() - run_start
+            if self.threaded:
+                self.screen_capture.stop()
+            if recorder is not None:
+                recorder.close()
+                print(f"📼 Đã ghi {recorder.iterations} vòng lặp: {recorder.path}")
+            if self.metrics is not None:
+                self.metrics.flush()
+            if self.game_state.gemini_recognizer:
+                self.game_state.gemini_recognizer.close()
+            self.print_summary()
+    
     def print_summary(self):
         """
         In ra thống kê sau khi chạy
         """
+        flush_logs()
         print("\n" + "="*60)
         print("📊 THỐNG KÊ")
         print("="*60)
         print(f"Tổng số nước đi: {self.move_count}")
         print(f"Điểm cao nhất: {self.best_score}")
         print(f"Ô lớn nhất: {self.game_state.get_max_tile()}")
+        if self.stage_times:
+            detail = " | ".join(f"{stage} {total / count * 1000:.1f}ms"
+                                for stage, (total, count) in self.stage_times.items())
+            print(f"Thời gian từng bước (trung bình/frame): {detail}")
+        if self.run_seconds > 0:
+            # Tỉ lệ thời gian chạy mà mỗi bước chiếm (vòng lặp tuần tự: tổng các bước <= 100%)
+            busy = {stage: total for stage, (total, _) in self.stage_times.items()}
+            if self.settle_times:
+                busy['settle'] = sum(self.settle_times)
+            utilization = " | ".join(f"{stage} {seconds / self.run_seconds * 100:.0f}%"
+                                     for stage, seconds in busy.items())
+            print(f"Tốc độ: {self.move_count / self.run_seconds * 60:.0f} nước/phút | bận: {utilization}")
+        if self.metrics is not None and self.metrics.moves:
+            percentiles = " | ".join(f"{stage} {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}ms"
+                                     for stage, stats in self.metrics.summary().items())
+            print(f"p50/p95 ({self.metrics.window} nước gần nhất): {percentiles}")
+        if self.pipeline_stats:
+            stats = self.pipeline_stats
+            utilization = " | ".join(f"{stage} {ratio * 100:.0f}%" for stage, ratio in stats['utilization'].items())
+            speculation = stats['speculation']
+            print(f"Pipeline: bận {utilization}")
+            print(f"Tìm kiếm trước: {speculation['hits']} trúng | {speculation['misses']} trượt | "
+                  f"{speculation['searched']} board đã tính | bỏ {stats['dropped_logs']} log")
+        if self.settle_times:
+            avg_settle = sum(self.settle_times) / len(self.settle_times)
+            print(f"Chờ animation trung bình: {avg_settle * 1000:.0f}ms "
+                  f"(tối đa {max(self.settle_times) * 1000:.0f}ms)")
+        if self.missed_moves['missed']:
+            missed = self.missed_moves
+            recovery = (f" | phục hồi trung bình {sum(self.recovery_times) / len(self.recovery_times) * 1000:.0f}ms"
+                        if self.recovery_times else "")
+            print(f"Phím bị rơi: {missed['missed']} lần | gửi lại {missed['resent']} | "
+                  f"phục hồi {missed['recovered']} | không phục hồi {missed['unrecovered']} | "
+                  f"không xác nhận được {missed['unconfirmed']}{recovery}")
+        if self.game_controller.adaptive_delay is not None and self.game_controller.adaptive_delay.probes:
+            delay_stats = self.game_controller.adaptive_delay.get_stats()
+            applied = "" if SETTLE_DETECTION else f"move_delay {delay_stats['delay_ms']:.0f}ms | "
+            print(f"Game phản hồi: {applied}phản hồi p50/p95 {delay_stats['response_p50_ms']:.0f}/"
+                  f"{delay_stats['response_p95_ms']:.0f}ms | animation {delay_stats['animation_p50_ms']:.0f}/"
+                  f"{delay_stats['animation_p95_ms']:.0f}ms | {delay_stats['probes']} lần đo, "
+                  f"tăng {delay_stats['backoffs']} lần")
+        input_stats = self.game_controller.get_input_stats()
+        if input_stats and input_stats['keys_sent']:
+            print(f"Gửi phím ({self.game_controller.backend.name}): {input_stats['keys_sent']} lần | "
+                  f"{input_stats['avg_latency_ms']:.2f}ms/lần (tối đa {input_stats['max_latency_ms']:.2f}ms)")
+        if self.threaded:
+            capture_stats = self.screen_capture.get_stats()
+            print(f"Chụp nền: {capture_stats['frames_captured']} frame | "
+                  f"chụp {capture_stats['avg_capture_ms']:.1f}ms | "
+                  f"tuổi frame {capture_stats['avg_frame_age_ms']:.1f}ms "
+                  f"(tối đa {capture_stats['max_frame_age_ms']:.1f}ms)")
+        if self.debug_frames is not None:
+            debug_stats = self.debug_frames.get_stats()
+            anomalies = ", ".join(f"{reason} {count}" for reason, count in debug_stats['anomalies'].items()) or "không"
+            print(f"Frame debug: ghi {debug_stats['written']}/{debug_stats['frames']} frame "
+                  f"({debug_stats['mb_used']:.1f}MB) | bất thường: {anomalies} | bỏ {debug_stats['dropped']}")
+        if self.game_state.gemini_recognizer:
+            cache_stats = self.game_state.gemini_recognizer.get_cache_stats()
+            if cache_stats:
+                print(f"Gemini cache: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} "
+                      f"hit ({cache_stats['hit_rate'] * 100:.0f}%) | "
+                      f"tiết kiệm ~{cache_stats['saved_seconds']:.1f}s gọi API")
+            payload_stats = self.game_state.gemini_recognizer.get_payload_stats()
+            if payload_stats['calls']:
+                print(f"Gemini API: {payload_stats['calls']} lần gọi | ảnh {payload_stats['avg_kb']:.1f}KB | "
+                      f"{payload_stats['avg_latency_ms']:.0f}ms/lần")
+        for name, health in self.game_state.chain.get_stats().items():
+            if health['successes'] or health['failures'] or health['state'] == 'unavailable':
+                latency = f"{health['latency_ms']:.0f}ms" if health['latency_ms'] is not None else "-"
+                print(f"Recognizer {name}: {health['state']} | {health['successes']} ok, "
+                      f"{health['failures']} lỗi | {latency}")
+        for name, recognizer in self.game_state.chain.instances.items():
+            if getattr(recognizer, 'out_of_process', False):
+                worker_stats = recognizer.get_stats()
+                print(f"Worker {name}: {worker_stats['requests']} lần | "
+                      f"{worker_stats['avg_ms']:.0f}ms/lần | khởi động lại {worker_stats['restarts']} lần")
+        if self.game_state.mode == 'cascade':
+            cascade = " → ".join(f"{name} {count} ô" for name, count in self.game_state.cascade_stats.items())
+            print(f"Cascade: {cascade}")
+        if self.game_state.tracking:
+            stats = self.game_state.tracking_stats
+            print(f"Tracking: {stats['tracked']} lần chỉ nhận diện ô spawn | "
+                  f"{stats['full']} lần nhận diện toàn bộ ({stats['desync']} desync)")
         print("="*60)
     
     def run_calibration(self):
@@ -322,12 +793,8 @@ class Auto2048:
         self.screen_capture.save_debug_image(img, "calibration_capture.png")
         print("💾 Đã lưu ảnh gốc: calibration_capture.png (kiểm tra xem vùng chụp có đúng không)")
         
-        # Tiền xử lý
-        processed = self.screen_capture.preprocess_image(img)
-        
         # Chia thành lưới
-        grid = self.screen_capture.split_into_grid(processed, GRID_SIZE)
-        grid_original = self.screen_capture.split_into_grid(img, GRID_SIZE)
+        grid_original = self.split_grid(img)
         
         print("\n🎓 Bắt đầu calibration...\n")
         
@@ -392,8 +859,8 @@ class Auto2048:
                     calibration_board[row][col] = str(number)
                     
                     # Lưu template - kiểm tra AI model đang dùng
-                    if self.game_state.ai_model == 'template' and self.game_state.template_recognizer:
-                        self.game_state.template_recognizer.save_template(number, cell_img)
+                    if self.game_state.ai_model == 'template' and self.game_state.get_template_recognizer():
+                        self.game_state.get_template_recognizer().save_template(number, cell_img)
                         learned_count += 1
                         print(f"   ✅ Đã học số {number}")
                     elif self.game_state.ai_model == 'gemini':
@@ -407,6 +874,10 @@ class Auto2048:
                     continue
                 break
             
+            # Ghi ngay các mẫu vừa học ra đĩa
+            if learned_count > 0:
+                self.game_state.template_recognizer.flush_templates()
+            
             # Hiển thị ma trận cuối cùng
             print_calibration_board()
             
@@ -463,16 +934,15 @@ class Auto2048:
                 print("\n📸 Đang chụp màn hình...")
                 img = self.screen_capture.capture()
                 
-                # Tiền xử lý
-                processed = self.screen_capture.preprocess_image(img)
-                
                 # Chia thành lưới
-                grid = self.screen_capture.split_into_grid(processed, GRID_SIZE)
-                grid_original = self.screen_capture.split_into_grid(img, GRID_SIZE)
+                grid_original = self.split_grid(img)
                 
                 # Nhận diện
                 print("🔍 Đang nhận diện các số...")
                 board = self.game_state.update_from_grid(grid_original)
+                if board is None:
+                    print("❌ Không có AI model nào nhận diện được - hiển thị board cũ")
+                    board = self.game_state.board
                 
                 # Hiển thị kết quả
                 print("\n" + "="*60)
@@ -567,7 +1037,7 @@ class Auto2048:
                 
                 # Tìm và thực hiện nước đi
                 best_move = self.ai_solver.get_best_move(board)
-                self.make_move(best_move)
+                self.make_move(best_move, board)
         
         except KeyboardInterrupt:
             print("\n\n⏹️  Đã dừng")
@@ -596,6 +1066,7 @@ def main():
     
     # Menu
     while True:
+        flush_logs()
         print("\n" + "="*60)
         print("\nMENU")
         print("="*60)
@@ -666,6 +1137,7 @@ def main():
                 # Cập nhật ngay lập tức
                 print("🔄 Đang cập nhật AI model...")
                 auto.game_state = GameState(GRID_SIZE, ai_model=new_model)
+                auto.game_state.start_warm_up()
                 print(f"✅ Đã chuyển sang {new_model.upper()}!")
                 print("💡 Có thể sử dụng ngay mà không cần restart")
         
@@ -0,0 +1,272 @@
+"""
+Module metrics - đo thời gian từng bước của mỗi nước đi và xuất ra file
+Mỗi nước đi: capture, tiền xử lý (bgr), nhận diện, tìm kiếm (số node, độ sâu),
+gửi phím và các lần chờ (settle, move_delay). Mỗi bước có một histogram
+(bucket cộng dồn + cửa sổ trượt các nước gần nhất để tính p50/p95/p99).
+
+Xuất ra:
+    - JSON lines: mỗi nước đi một dòng (METRICS_JSONL_FILE)
+    - File Prometheus (METRICS_PROM_FILE) cho textfile collector của node_exporter,
+      ghi lại định kỳ - gom metrics của nhiều bot theo nhãn instance
+"""
+
+import bisect
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from config import (METRICS_JSONL_FILE, METRICS_PROM_FILE, METRICS_FLUSH_INTERVAL,
+                    METRICS_WINDOW, METRICS_INSTANCE)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+# Bước tiền xử lý lười của Frame - gộp thành bước 'preprocess'
+PREPROCESS_STAGES = ('bgr',)
+
+# Bucket (giây) - từ chụp màn hình (~1ms) đến Gemini (vài giây)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RollingHistogram:
+    """
+    Histogram với bucket cộng dồn (cho Prometheus) và cửa sổ trượt
+    các giá trị gần nhất (cho percentile)
+    """
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=METRICS_WINDOW):
+        """
+        Args:
+            buckets (tuple): Cận trên của các bucket (tăng dần)
+            window (int): Số giá trị gần nhất giữ lại để tính percentile
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Bucket cuối: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+    
+    def percentile(self, p):
+        """
+        Percentile trên cửa sổ trượt
+        
+        Args:
+            p (float): 0-100
+        
+        Returns:
+            float: Giá trị, 0.0 nếu chưa có
+        """
+        ordered = sorted(self.recent)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+    
+    def cumulative(self):
+        """
+        Số giá trị <= mỗi cận (định dạng bucket của Prometheus)
+        
+        Returns:
+            list: [(cận, số giá trị)] kết thúc bằng ('+Inf', count)
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MoveMetrics:
+    """
+    Thu thập thời gian từng bước của mỗi nước đi
+    observe_move chỉ cập nhật histogram và ghi 1 dòng vào buffer - file Prometheus
+    được ghi lại mỗi flush_interval giây
+    """
+    
+    def __init__(self, jsonl_file=METRICS_JSONL_FILE, prom_file=METRICS_PROM_FILE,
+                 flush_interval=METRICS_FLUSH_INTERVAL, window=METRICS_WINDOW,
+                 instance=METRICS_INSTANCE, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            jsonl_file (str): File JSON lines (None = không ghi)
+            prom_file (str): File Prometheus (None = không ghi)
+            flush_interval (float): Khoảng cách giữa 2 lần ghi file Prometheus (giây)
+            window (int): Số nước đi gần nhất để tính percentile
+            instance (str): Nhãn instance (None = tên máy)
+            buckets (tuple): Bucket của histogram thời gian (giây)
+        """
+        self.prom_file = Path(prom_file) if prom_file else None
+        self.flush_interval = flush_interval
+        self.window = window
+        self.instance = instance or socket.gethostname()
+        self.buckets = buckets
+        
+        self.histograms = {}  # {bước: RollingHistogram}
+        self.moves = 0
+        self.nodes = 0
+        self.last_depth = 0
+        self.last_nodes = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.perf_counter()
+        
+        self._jsonl = None
+        if jsonl_file:
+            Path(jsonl_file).parent.mkdir(parents=True, exist_ok=True)
+            self._jsonl = open(jsonl_file, 'a', encoding='utf-8')
+        if self.prom_file is not None:
+            self.prom_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    def observe_move(self, timings, nodes=None, depth=None, move=None):
+        """
+        Ghi nhận một nước đi
+        
+        Args:
+            timings (dict): {bước: giây} - các bước tiền xử lý của Frame được gộp thành 'preprocess'
+            nodes (int): Số node tìm kiếm (None = không tìm kiếm, vd. dùng kết quả tìm trước)
+            depth (int): Độ sâu tìm kiếm
+            move (str): Nước đi
+        """
+        stages = {}
+        for name, seconds in timings.items():
+            stage = 'preprocess' if name in PREPROCESS_STAGES else name
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        stages['total'] = sum(stages.values())
+        
+        with self._lock:
+            self.moves += 1
+            for stage, seconds in stages.items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = RollingHistogram(self.buckets, self.window)
+                histogram.observe(seconds)
+            if nodes is not None:
+                self.nodes += nodes
+                self.last_nodes = nodes
+            if depth is not None:
+                self.last_depth = depth
+            
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps({
+                    't': round(time.time(), 3),
+                    'instance': self.instance,
+                    'move': self.moves,
+                    'direction': move,
+                    'depth': depth,
+                    'nodes': nodes,
+                    'ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+                }) + '\n')
+        
+        if time.perf_counter() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def summary(self):
+        """
+        Percentile từng bước trên cửa sổ trượt
+        
+        Returns:
+            dict: {bước: {'p50_ms', 'p95_ms', 'p99_ms', 'count'}}
+        """
+        with self._lock:
+            return {stage: {
+                'p50_ms': histogram.percentile(50) * 1000,
+                'p95_ms': histogram.percentile(95) * 1000,
+                'p99_ms': histogram.percentile(99) * 1000,
+                'count': histogram.count,
+            } for stage, histogram in self.histograms.items()}
+    
+    def render_prometheus(self):
+        """
+        Metrics theo định dạng text của Prometheus
+        
+        Returns:
+            str: Nội dung file .prom
+        """
+        instance = self.instance.replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            "# HELP auto2048_stage_seconds Thời gian từng bước của mỗi nước đi",
+            "# TYPE auto2048_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                labels = f'instance="{instance}",stage="{stage}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'auto2048_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'auto2048_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'auto2048_stage_seconds_count{{{labels}}} {histogram.count}')
+            
+            lines += [
+                f"# HELP auto2048_stage_recent_seconds Percentile của {self.window} nước đi gần nhất",
+                "# TYPE auto2048_stage_recent_seconds gauge",
+            ]
+            for stage, histogram in self.histograms.items():
+                for quantile in (50, 95, 99):
+                    lines.append(f'auto2048_stage_recent_seconds{{instance="{instance}",stage="{stage}",'
+                                 f'quantile="{quantile / 100}"}} {histogram.percentile(quantile):.6f}')
+            
+            lines += [
+                "# HELP auto2048_moves_total Số nước đi đã thực hiện",
+                "# TYPE auto2048_moves_total counter",
+                f'auto2048_moves_total{{instance="{instance}"}} {self.moves}',
+                "# HELP auto2048_search_nodes_total Số node Expectimax đã duyệt",
+                "# TYPE auto2048_search_nodes_total counter",
+                f'auto2048_search_nodes_total{{instance="{instance}"}} {self.nodes}',
+                "# HELP auto2048_search_depth Độ sâu tìm kiếm của nước đi gần nhất",
+                "# TYPE auto2048_search_depth gauge",
+                f'auto2048_search_depth{{instance="{instance}"}} {self.last_depth}',
+                "# HELP auto2048_search_nodes Số node của lần tìm kiếm gần nhất",
+                "# TYPE auto2048_search_nodes gauge",
+                f'auto2048_search_nodes{{instance="{instance}"}} {self.last_nodes}',
+            ]
+        return "\n".join(lines) + "\n"
+    
+    def flush(self):
+        """
+        Flush JSON lines và ghi lại file Prometheus (ghi file tạm rồi đổi tên -
+        collector không bao giờ đọc phải file ghi dở)
+        """
+        self._last_flush = time.perf_counter()
+        try:
+            if self._jsonl is not None:
+                with self._lock:
+                    self._jsonl.flush()
+            if self.prom_file is not None:
+                temp_file = self.prom_file.with_name(f"{self.prom_file.name}.{os.getpid()}.tmp")
+                temp_file.write_text(self.render_prometheus(), encoding='utf-8')
+                os.replace(temp_file, self.prom_file)
+        except OSError as e:
+            logger.error("❌ Lỗi ghi metrics: %s", e)
+    
+    def close(self):
+        """
+        Ghi lần cuối và đóng file JSON lines
+        """
+        self.flush()
+        if self._jsonl is not None:
+            with self._lock:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+# Xem nhanh file JSON lines: python metrics.py [metrics/moves.jsonl]
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else METRICS_JSONL_FILE
+    metrics = MoveMetrics(jsonl_file=None, prom_file=None)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            metrics.observe_move({stage: ms / 1000 for stage, ms in record['ms'].items() if stage != 'total'},
+                                 record.get('nodes'), record.get('depth'), record.get('direction'))
+    
+    print(f"📈 {path}: {metrics.moves} nước đi | {metrics.nodes} node tìm kiếm")
+    for stage, stats in metrics.summary().items():
+        print(f"   {stage}: p50 {stats['p50_ms']:.1f}ms | p95 {stats['p95_ms']:.1f}ms | p99 {stats['p99_ms']:.1f}ms")
@@ -3,10 +3,53 @@ Module nhận diện số sử dụng PaddleOCR
 PaddleOCR là OCR mạnh mẽ, hỗ trợ nhiều ngôn ngữ, nhanh và chính xác
 """
 
+import logging
+import time
+from collections import deque
+import paddleocr
 from paddleocr import PaddleOCR
 import cv2
 import numpy as np
-from config import DEBUG_MODE
+from config import OCR_CONFIDENCE_THRESHOLD, PADDLE_BATCHED, PADDLE_WARMUP
+from log import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    # PaddleOCR 3.x: model recognition riêng (không detection) - nhận diện cả batch một lần
+    from paddleocr import TextRecognition
+except ImportError:
+    TextRecognition = None
+
+# Tham số khởi tạo PaddleOCR khác nhau giữa bản 2.x và 3.x
+try:
+    PADDLE_MAJOR = int(str(getattr(paddleocr, '__version__', '3')).split('.')[0])
+except ValueError:
+    PADDLE_MAJOR = 3
+
+
+def create_ocr():
+    """
+    Khởi tạo PaddleOCR theo phiên bản đã cài
+    Tắt phân loại góc/hướng: số trong game luôn thẳng đứng
+    
+    Returns:
+        PaddleOCR: Đối tượng OCR (lang='en' - chỉ cần số)
+    """
+    if PADDLE_MAJOR >= 3:
+        try:
+            return PaddleOCR(
+                use_doc_orientation_classify=False,
+                use_doc_unwarping=False,
+                use_textline_orientation=False,
+                lang='en'
+            )
+        except TypeError:
+            # Bản 3.x cũ/bản build không nhận các tham số này - dùng constructor 2.x
+            pass
+    
+    # PaddleOCR 2.x
+    return PaddleOCR(use_angle_cls=False, lang='en')
 
 
 class PaddleRecognizer:
@@ -14,25 +57,75 @@ class PaddleRecognizer:
     Class nhận diện số từ ô game bằng PaddleOCR
     """
     
-    def __init__(self):
+    def __init__(self, batched=PADDLE_BATCHED, warmup=PADDLE_WARMUP):
         """
         Khởi tạo PaddleOCR recognizer
+        
+        Args:
+            batched (bool): Nhận diện tất cả ô trong 1 lần gọi model recognition
+            warmup (bool): Chạy thử model ngay khi khởi tạo
         """
+        self.rec_model = None
+        self.last_confidences = None  # Độ tin cậy từng ô của board gần nhất
+        # Thời gian mỗi board gần nhất (giây)
+        self.board_latencies = {'batched': deque(maxlen=1000), 'per_cell': deque(maxlen=1000)}
+        
         try:
-            # Khởi tạo PaddleOCR với config tối ưu
-            # use_angle_cls=True: Tự động xoay ảnh nếu cần
-            # lang='en': Ngôn ngữ tiếng Anh (cho số)
-            self.ocr = PaddleOCR(
-                use_angle_cls=True,
-                lang='en'
-            )
+            # Khởi tạo PaddleOCR với config tối ưu (tham số theo phiên bản 2.x/3.x)
+            self.ocr = create_ocr()
+            
+            if batched and TextRecognition is not None:
+                self.rec_model = TextRecognition()
+            elif batched:
+                logger.warning("⚠️  PaddleOCR không có TextRecognition (cần bản 3.x), dùng OCR từng ô")
+            
             self.enabled = True
-            if DEBUG_MODE:
-                print("✅ PaddleOCR đã sẵn sàng")
+            logger.debug("✅ PaddleOCR đã sẵn sàng (nhận diện %s)", "batch" if self.rec_model is not None else "từng ô")
                 
         except Exception as e:
-            print(f"❌ Lỗi khởi tạo PaddleOCR: {e}")
+            logger.error("❌ Lỗi khởi tạo PaddleOCR: %s", e)
             self.enabled = False
+        
+        if self.enabled and warmup:
+            self.warmup()
+    
+    def warmup(self):
+        """
+        Chạy thử model với một ô giả (lần chạy đầu khởi tạo kernel/bộ nhớ, rất chậm)
+        
+        Returns:
+            float: Thời gian warm-up (giây)
+        """
+        dummy = np.full((100, 100, 3), 200, dtype=np.uint8)
+        cv2.putText(dummy, "2", (30, 70), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+        
+        start = time.perf_counter()
+        try:
+            if self.rec_model is not None:
+                list(self.rec_model.predict(input=[dummy, dummy], batch_size=2))
+            else:
+                self.ocr.ocr(self._preprocess_cell(dummy))
+        except Exception as e:
+            logger.debug("⚠️  Lỗi warm-up PaddleOCR: %s", e)
+        elapsed = time.perf_counter() - start
+        
+        logger.debug("🔥 Warm-up PaddleOCR: %.0fms", elapsed * 1000)
+        return elapsed
+    
+    def _parse_number(self, text, confidence):
+        """
+        Chuyển text OCR thành số của game
+        
+        Returns:
+            int: Số 1-11, 0 nếu không hợp lệ hoặc độ tin cậy thấp
+        """
+        text = str(text).strip().replace(' ', '').replace('.', '').replace(',', '')
+        if text.isdigit():
+            number = int(text)
+            # Game này số từ 1-11
+            if 1 <= number <= 11 and confidence > OCR_CONFIDENCE_THRESHOLD:
+                return number
+        return 0
     
     def recognize_number(self, cell_img):
         """
@@ -44,16 +137,28 @@ class PaddleRecognizer:
         Returns:
             int: Số nhận diện được (0 nếu ô trống hoặc lỗi)
         """
+        return self.recognize_cell_with_confidence(cell_img)[0]
+    
+    def recognize_cell_with_confidence(self, cell_img):
+        """
+        Nhận diện số từ một ô (OCR đầy đủ) kèm độ tin cậy
+        
+        Args:
+            cell_img: Ảnh ô game (numpy array)
+            
+        Returns:
+            tuple: (số nhận diện được, độ tin cậy 0-1 = rec_score của PaddleOCR)
+        """
         if not self.enabled:
-            return 0
+            return 0, 0.0
         
         if cell_img is None or cell_img.size == 0:
-            return 0
+            return 0, 0.0
         
         try:
             # Kiểm tra ô trống
             if self._is_empty_cell(cell_img):
-                return 0
+                return 0, self._empty_confidence(cell_img)
             
             # Tiền xử lý ảnh
             processed = self._preprocess_cell(cell_img)
@@ -61,49 +166,61 @@ class PaddleRecognizer:
             # Nhận diện với PaddleOCR
             result = self.ocr.ocr(processed)
             
-            # Xử lý kết quả - PaddleOCR 3.x trả về OCRResult object
+            # Xử lý kết quả - PaddleOCR 3.x trả về OCRResult object, 2.x trả về list
             if result and len(result) > 0:
                 ocr_result = result[0]
                 
-                # Lấy dữ liệu từ OCRResult object
                 try:
-                    # OCRResult có thuộc tính json chứa kết quả
-                    if hasattr(ocr_result, 'json'):
-                        json_data = ocr_result.json
-                        res_data = json_data.get('res', {})
-                        
-                        rec_texts = res_data.get('rec_texts', [])
-                        rec_scores = res_data.get('rec_scores', [])
-                        
-                        if DEBUG_MODE:
-                            print(f"   📝 OCR found {len(rec_texts)} texts: {rec_texts}")
-                            print(f"   📊 Scores: {rec_scores}")
+                    rec_texts, rec_scores = self._extract_texts(ocr_result)
+                    if rec_texts:
+                        logger.debug("   📝 OCR found %s texts: %s", len(rec_texts), rec_texts)
+                        logger.debug("   📊 Scores: %s", rec_scores)
                         
                         # Duyệt qua các text đã nhận diện
                         for i, text in enumerate(rec_texts):
                             confidence = rec_scores[i] if i < len(rec_scores) else 0
-                            
-                            # Lọc kết quả
-                            text = str(text).strip().replace(' ', '').replace('.', '').replace(',', '')
-                            
-                            if text.isdigit():
-                                number = int(text)
-                                # Game này số từ 1-9
-                                if 1 <= number <= 9 and confidence > 0.5:
-                                    if DEBUG_MODE:
-                                        print(f"   🎯 PaddleOCR: {number} (confidence: {confidence:.2f})")
-                                    return number
+                            number = self._parse_number(text, confidence)
+                            if number:
+                                logger.debug("   🎯 PaddleOCR: %s (confidence: %.2f)", number, confidence)
+                                return number, float(confidence)
                     
                 except Exception as e:
-                    if DEBUG_MODE:
-                        print(f"   ⚠️  Lỗi parse OCRResult: {e}")
+                    logger.debug("   ⚠️  Lỗi parse OCRResult: %s", e)
             
-            return 0
+            return 0, 0.0
             
         except Exception as e:
-            if DEBUG_MODE:
-                print(f"   ❌ Lỗi PaddleOCR: {e}")
-            return 0
+            logger.debug("   ❌ Lỗi PaddleOCR: %s", e)
+            return 0, 0.0
+    
+    def _extract_texts(self, ocr_result):
+        """
+        Lấy danh sách text và độ tin cậy từ kết quả ocr() của một ảnh
+        
+        Args:
+            ocr_result: OCRResult (PaddleOCR 3.x) hoặc list [[box, (text, score)], ...] (2.x)
+            
+        Returns:
+            tuple: (danh sách text, danh sách độ tin cậy)
+        """
+        # OCRResult có thuộc tính json chứa kết quả
+        if hasattr(ocr_result, 'json'):
+            res_data = ocr_result.json.get('res', {})
+            return res_data.get('rec_texts', []), res_data.get('rec_scores', [])
+        
+        # PaddleOCR 2.x: None nếu không tìm thấy text
+        if not ocr_result:
+            return [], []
+        lines = [line[1] for line in ocr_result]
+        return [text for text, _ in lines], [score for _, score in lines]
+    
+    def _empty_confidence(self, cell_img):
+        """
+        Độ tin cậy ô trống (ô càng đồng nhất càng chắc chắn trống, 0.5-1)
+        """
+        if cell_img.ndim == 3 and cell_img.shape[2] == 4:
+            cell_img = cell_img[:, :, :3]
+        return 1.0 - float(np.std(cell_img)) / 30.0
     
     def _is_empty_cell(self, cell_img):
         """
@@ -115,6 +232,10 @@ class PaddleRecognizer:
         Returns:
             bool: True nếu ô trống
         """
+        # Bỏ kênh alpha nếu ô là view BGRA
+        if cell_img.ndim == 3 and cell_img.shape[2] == 4:
+            cell_img = cell_img[:, :, :3]
+        
         # Tính độ lệch chuẩn - ô trống có độ lệch thấp
         std = np.std(cell_img)
         mean = np.mean(cell_img)
@@ -141,8 +262,8 @@ class PaddleRecognizer:
             # Grayscale -> BGR
             cell_img = cv2.cvtColor(cell_img, cv2.COLOR_GRAY2BGR)
         elif len(cell_img.shape) == 3 and cell_img.shape[2] == 4:
-            # RGBA -> BGR
-            cell_img = cv2.cvtColor(cell_img, cv2.COLOR_RGBA2BGR)
+            # BGRA -> BGR
+            cell_img = cv2.cvtColor(cell_img, cv2.COLOR_BGRA2BGR)
         
         # Tăng độ tương phản
         lab = cv2.cvtColor(cell_img, cv2.COLOR_BGR2LAB)
@@ -158,47 +279,162 @@ class PaddleRecognizer:
         resized = cv2.resize(enhanced, (width * scale_factor, height * scale_factor), 
                             interpolation=cv2.INTER_CUBIC)
         
-        if DEBUG_MODE:
-            print(f"   📐 Preprocessed: {resized.shape}")
+        logger.debug("   📐 Preprocessed: %s", resized.shape)
         
         return resized
     
-    def recognize_board(self, grid_cells):
+    def recognize_cells_batched(self, cells):
+        """
+        Nhận diện nhiều ô trong MỘT lần gọi model recognition (bỏ qua ô trống)
+        Không cần CLAHE/phóng to: model tự resize ảnh về chiều cao chuẩn
+        
+        Args:
+            cells (list): Danh sách ảnh ô
+            
+        Returns:
+            tuple: (số nhận diện được cho từng ô (0 nếu trống hoặc lỗi), độ tin cậy từng ô)
+        """
+        numbers = [0] * len(cells)
+        scores = [0.0] * len(cells)
+        indices = []
+        images = []
+        for idx, cell_img in enumerate(cells):
+            if cell_img is None or cell_img.size == 0:
+                continue
+            if self._is_empty_cell(cell_img):
+                scores[idx] = self._empty_confidence(cell_img)
+                continue
+            if cell_img.ndim == 2:
+                cell_img = cv2.cvtColor(cell_img, cv2.COLOR_GRAY2BGR)
+            elif cell_img.shape[2] == 4:
+                cell_img = cv2.cvtColor(cell_img, cv2.COLOR_BGRA2BGR)
+            indices.append(idx)
+            images.append(np.ascontiguousarray(cell_img))
+        
+        if not images:
+            return numbers, scores
+        
+        try:
+            results = self.rec_model.predict(input=images, batch_size=len(images))
+            for idx, result in zip(indices, results):
+                res_data = result.json.get('res', {})
+                score = float(res_data.get('rec_score', 0))
+                numbers[idx] = self._parse_number(res_data.get('rec_text', ''), score)
+                scores[idx] = score if numbers[idx] else 0.0  # Đọc được text nhưng không phải số hợp lệ
+        except Exception as e:
+            logger.debug("   ❌ Lỗi PaddleOCR batch: %s", e)
+            for idx in indices:
+                scores[idx] = 0.0
+        
+        return numbers, scores
+    
+    def recognize_cells_with_confidence(self, cells):
+        """
+        Nhận diện danh sách ô bất kỳ (vd. chỉ các ô mơ hồ trong cascade)
+        
+        Returns:
+            list: [(số, độ tin cậy), ...] theo thứ tự cells
+        """
+        if self.rec_model is not None:
+            return list(zip(*self.recognize_cells_batched(cells)))
+        return [self.recognize_cell_with_confidence(cell_img) for cell_img in cells]
+    
+    def recognize_board(self, grid_cells, batched=None):
         """
         Nhận diện toàn bộ bảng từ các ô đã tách
         
         Args:
             grid_cells: List 16 ô (4x4) đã tách từ grid
+            batched (bool): Ép dùng/không dùng batch (None = theo cấu hình lúc khởi tạo)
             
         Returns:
             list: Ma trận 4x4 các số nhận diện được
         """
+        return self.recognize_board_with_confidence(grid_cells, batched)[0]
+    
+    def recognize_board_with_confidence(self, grid_cells, batched=None):
+        """
+        Nhận diện toàn bộ bảng kèm độ tin cậy từng ô
+        
+        Args:
+            grid_cells: List 16 ô (4x4) đã tách từ grid
+            batched (bool): Ép dùng/không dùng batch (None = theo cấu hình lúc khởi tạo)
+            
+        Returns:
+            tuple: (ma trận 4x4 các số, ma trận 4x4 độ tin cậy 0-1)
+        """
         if len(grid_cells) != 16:
-            if DEBUG_MODE:
-                print(f"⚠️  Số ô không đúng: {len(grid_cells)}, cần 16 ô")
-            return [[0]*4 for _ in range(4)]
-        
-        board = []
-        for i in range(4):
-            row = []
-            for j in range(4):
-                cell_idx = i * 4 + j
-                number = self.recognize_number(grid_cells[cell_idx])
-                row.append(number)
-            board.append(row)
-        
-        if DEBUG_MODE:
-            print("\n📊 Board nhận diện được (PaddleOCR):")
-            for row in board:
-                print(f"   {row}")
-        
-        return board
+            logger.debug("⚠️  Số ô không đúng: %s, cần 16 ô", len(grid_cells))
+            return [[0]*4 for _ in range(4)], [[0.0]*4 for _ in range(4)]
+        
+        if batched is None:
+            batched = self.rec_model is not None
+        
+        start = time.perf_counter()
+        if batched and self.rec_model is not None:
+            numbers, scores = self.recognize_cells_batched(grid_cells)
+            mode = 'batched'
+        else:
+            results = [self.recognize_cell_with_confidence(cell_img) for cell_img in grid_cells]
+            numbers = [number for number, _ in results]
+            scores = [score for _, score in results]
+            mode = 'per_cell'
+        elapsed = time.perf_counter() - start
+        self.board_latencies[mode].append(elapsed)
+        
+        board = [numbers[i * 4:(i + 1) * 4] for i in range(4)]
+        self.last_confidences = [scores[i * 4:(i + 1) * 4] for i in range(4)]
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📊 Board nhận diện được (PaddleOCR, %s, %.0fms):\n%s",
+                         mode, elapsed * 1000, "\n".join(f"   {row}" for row in board))
+        
+        return board, self.last_confidences
+    
+    def benchmark_board(self, grid_cells, repeats=5):
+        """
+        So sánh thời gian nhận diện một board: batch vs gọi OCR từng ô
+        
+        Args:
+            grid_cells: List 16 ô
+            repeats (int): Số lần chạy mỗi cách
+            
+        Returns:
+            dict: {'batched': ms trung bình, 'per_cell': ms trung bình, 'same_board': bool}
+        """
+        results = {}
+        boards = {}
+        for mode in ('batched', 'per_cell'):
+            if mode == 'batched' and self.rec_model is None:
+                continue
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                boards[mode] = self.recognize_board(grid_cells, batched=(mode == 'batched'))
+                times.append(time.perf_counter() - start)
+            results[mode] = sum(times) / len(times) * 1000
+        
+        results['same_board'] = len(boards) == 2 and boards['batched'] == boards['per_cell']
+        return results
 
 
 if __name__ == "__main__":
+    import sys
+    from screen_capture import ScreenCapture
+    
     print("🧪 Testing PaddleRecognizer...")
     recognizer = PaddleRecognizer()
     if recognizer.enabled:
         print("✅ PaddleOCR hoạt động tốt!")
+        
+        # python paddle_recognizer.py <ảnh lưới>: đo thời gian batch vs từng ô
+        if len(sys.argv) > 1:
+            img = cv2.imread(sys.argv[1])
+            cells = ScreenCapture().split_into_grid(img)
+            grid_cells = [cells[row][col] for row in range(4) for col in range(4)]
+            result = recognizer.benchmark_board(grid_cells)
+            print(f"⏱️  Batch: {result.get('batched', 0):.0f}ms/board | "
+                  f"Từng ô: {result['per_cell']:.0f}ms/board | "
+                  f"Cùng kết quả: {result['same_board']}")
     else:
         print("❌ PaddleOCR không khả dụng")
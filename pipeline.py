@@ -0,0 +1,408 @@
+"""
+Module vòng lặp auto dạng pipeline (asyncio)
+Các bước của run_auto chạy thành stage nối với nhau bằng hàng đợi giới hạn:
+    
+    perceive (chụp + nhận diện) -> decide (chọn độ sâu + tìm kiếm) -> act (gửi phím + chờ ổn định)
+       ^                                                                  |
+       +------------------------------------------------------------------+
+    log (in trạng thái) chạy riêng, không nằm trên đường găng
+
+Trong lúc act gửi phím và chờ animation, thread solver tìm kiếm trước (speculative)
+cho các board có thể xuất hiện tiếp theo (afterstate + 1 ô spawn). Frame mới khớp
+với board đã tính thì có nước đi ngay, không phải chờ tìm kiếm.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ai_solver import AISolver
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_LOG_QUEUE_SIZE, PIPELINE_SPECULATIVE
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+def board_key(board):
+    """
+    Khóa hashable của board (dùng cho cache tìm kiếm trước)
+    """
+    return tuple(tuple(row) for row in board)
+
+
+class SearchAborted(Exception):
+    """
+    Tìm kiếm trước bị hủy (board thực tế đã có)
+    """
+
+
+class SpeculativeSolver(AISolver):
+    """
+    AISolver cho tìm kiếm trước: dừng ngay (ở node tiếp theo) khi abort() được gọi
+    từ thread khác, để lần tìm kiếm thật không phải chờ nó chạy xong.
+    pause() tạm dừng ở node tiếp theo để không tranh GIL với bước nhận diện
+    """
+    
+    def __init__(self, solver):
+        """
+        Args:
+            solver (AISolver): Solver chính (lấy spawn_value)
+        """
+        super().__init__(solver.search_depth, solver.spawn_value)
+        self.generation = 0     # Tăng mỗi lần abort - lần tìm kiếm của thế hệ cũ tự dừng
+        self._running = 0
+        self._allowed = threading.Event()
+        self._allowed.set()
+    
+    def pause(self):
+        self._allowed.clear()
+    
+    def resume(self):
+        self._allowed.set()
+    
+    def abort(self):
+        self.generation += 1
+        self._allowed.set()
+    
+    def search(self, board, depth, generation):
+        """
+        Tìm nước đi tốt nhất nếu thế hệ chưa bị hủy
+        
+        Raises:
+            SearchAborted: abort() được gọi trước hoặc trong lúc tìm kiếm
+        """
+        if generation != self.generation:
+            raise SearchAborted()
+        self._running = generation
+        self.search_depth = depth
+        return self.get_best_move(board)
+    
+    def expectimax(self, board, depth, is_max_player):
+        if not self._allowed.is_set():
+            self._allowed.wait()
+        if self._running != self.generation:
+            raise SearchAborted()
+        return super().expectimax(board, depth, is_max_player)
+
+
+class PipelinedRunner:
+    """
+    Điều phối vòng lặp auto bằng asyncio
+    
+    Chụp màn hình, gửi phím và chờ animation chạy trên 1 thread I/O (mss/pyautogui
+    không dùng chung giữa các thread), tìm kiếm (thật và tìm trước) chạy trên 1 thread solver riêng
+    """
+    
+    STAGES = ('perceive', 'solve', 'speculate', 'act', 'log')
+    
+    def __init__(self, auto, max_moves=None, recorder=None, speculative=PIPELINE_SPECULATIVE,
+                 queue_size=PIPELINE_QUEUE_SIZE, log_queue_size=PIPELINE_LOG_QUEUE_SIZE, metrics=None):
+        """
+        Args:
+            auto (Auto2048): Tool chứa screen_capture, game_state, ai_solver, game_controller
+            max_moves (int): Số nước đi tối đa (None = không giới hạn)
+            recorder (SessionRecorder): Ghi phiên (None = không ghi)
+            speculative (bool): Tìm kiếm trước trong lúc gửi phím/chờ animation
+            queue_size (int): Kích thước hàng đợi giữa các stage
+            log_queue_size (int): Kích thước hàng đợi log (đầy thì bỏ log)
+            metrics (MoveMetrics): Ghi thời gian từng bước của mỗi nước đi (None = không ghi)
+        """
+        self.auto = auto
+        self.max_moves = max_moves
+        self.recorder = recorder
+        self.metrics = metrics
+        self.speculative = speculative
+        self.queue_size = queue_size
+        self.log_queue_size = log_queue_size
+        
+        self.busy = {stage: 0.0 for stage in self.STAGES}  # Thời gian bận của từng stage (giây)
+        self.speculation = {'hits': 0, 'misses': 0, 'searched': 0, 'aborted': 0}
+        self.dropped_logs = 0
+        self.stop_reason = None
+        self.elapsed = 0.0
+    
+    def run(self):
+        """
+        Chạy pipeline đến khi game over, hết số nước đi hoặc lỗi
+        
+        Returns:
+            dict: Thống kê (xem get_stats)
+        """
+        return asyncio.run(self._run())
+    
+    async def _run(self):
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-io")
+        self._solver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-solver")
+        self._boards = asyncio.Queue(self.queue_size)
+        self._moves = asyncio.Queue(self.queue_size)
+        self._settled = asyncio.Queue(self.queue_size)
+        self._logs = asyncio.Queue(self.log_queue_size)
+        self._speculated = {}           # {board: nước đi} đã tìm kiếm trước
+        self._in_flight = None          # (board, future) đang tìm kiếm trước
+        self._speculation_task = None
+        self._speculative_solver = SpeculativeSolver(self.auto.ai_solver)
+        self._depth = self.auto.ai_solver.search_depth
+        
+        start = time.perf_counter()
+        log_task = asyncio.create_task(self._log())
+        stages = [asyncio.create_task(stage()) for stage in (self._perceive, self._decide, self._act)]
+        self._settled.put_nowait(True)  # Frame đầu tiên không cần chờ nước đi nào
+        
+        try:
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Ném lại lỗi của stage (nếu có)
+        finally:
+            self._cancel_speculation()
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            self.elapsed = time.perf_counter() - start
+            await self._logs.put(None)
+            await log_task
+            self._io.shutdown(wait=True)
+            self._solver.shutdown(wait=True, cancel_futures=True)
+        
+        return self.get_stats()
+    
+    def _emit(self, message):
+        """
+        Đưa log vào hàng đợi - không bao giờ chặn stage gọi (đầy thì bỏ)
+        """
+        try:
+            self._logs.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped_logs += 1
+    
+    async def _perceive(self):
+        """
+        Stage chụp + nhận diện: chạy mỗi khi màn hình đã ổn định sau nước đi trước
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._settled.get()
+            # Tìm kiếm trước nhường CPU cho nhận diện (chạy tiếp nếu board khớp)
+            self._speculative_solver.pause()
+            start = time.perf_counter()
+            frame, board, recorded = await loop.run_in_executor(self._io, self._recognize)
+            self.busy['perceive'] += time.perf_counter() - start
+            if board is None:
+                if self.recorder is not None:
+                    self.recorder.record(recorded, None, timings=frame.timings,
+                                         stats={'move': self.auto.move_count}, copy=False)
+                self.stop_reason = "❌ Không thể phân tích game!"
+                return
+            await self._boards.put((frame, board, recorded))
+    
+    def _recognize(self):
+        """
+        Chụp và nhận diện một frame (thread I/O)
+        
+        Returns:
+            tuple: (Frame, board hoặc None, bản copy ảnh để ghi phiên hoặc None)
+        """
+        auto = self.auto
+        # Slot của frame được ghim trong ring buffer - nhận diện lâu cũng không bị ghi đè
+        frame = auto.screen_capture.capture_frame()
+        grid = auto.split_grid(frame.raw, frame)
+        # Ảnh ghi phiên được copy trước khi nhận diện
+        recorded = frame.raw.copy() if self.recorder is not None else None
+        recognize_start = time.perf_counter()
+        desyncs = auto.game_state.tracking_stats['desync']
+        board = auto.game_state.update_from_grid(grid, full_image=frame.raw)
+        frame.timings['recognize'] = time.perf_counter() - recognize_start
+        auto.check_frame(frame, board, desyncs)
+        return frame, board, recorded
+    
+    async def _decide(self):
+        """
+        Stage chọn độ sâu + tìm kiếm (dùng kết quả tìm kiếm trước nếu có)
+        """
+        auto = self.auto
+        while True:
+            frame, board, recorded = await self._boards.get()
+            auto.record_stage_times(frame.timings)
+            
+            if auto.game_state.is_game_over():
+                if self.recorder is not None:
+                    self.recorder.record(recorded, board, timings=frame.timings,
+                                         stats={'move': auto.move_count, 'game_over': True}, copy=False)
+                self.stop_reason = "🎮 Game Over!"
+                return
+            
+            current_score = auto.game_state.get_score()
+            max_tile = auto.game_state.get_max_tile()
+            auto.best_score = max(auto.best_score, current_score)
+            count_empty = sum(1 for row in board for cell in row if cell == 0)
+            
+            depth = auto.select_search_depth(board)
+            if depth != self._depth:
+                self._emit(f"🧠 Điều chỉnh SEARCH_DEPTH: {self._depth} → {depth} (Ô trống: {count_empty})")
+                self._depth = depth
+            self._emit(f"📊 Điểm: {current_score} | Ô lớn nhất: {max_tile} | Ô trống: {count_empty} | "
+                       f"Nước đi: {auto.move_count} | Depth: {depth}")
+            
+            solve_start = time.perf_counter()
+            best_move, nodes = await self._search(board, depth)
+            frame.timings['solve'] = time.perf_counter() - solve_start
+            auto.record_stage_times({'solve': frame.timings['solve']})
+            self.busy['solve'] += frame.timings['solve']
+            
+            if self.recorder is not None:
+                self.recorder.record(recorded, board, best_move, timings=frame.timings, stats={
+                    'move': auto.move_count, 'depth': depth,
+                    'score': current_score, 'max_tile': max_tile, 'empty': count_empty,
+                }, copy=False)
+            
+            if best_move is None:
+                self.stop_reason = "⚠️  Không tìm thấy nước đi hợp lệ!"
+                return
+            await self._moves.put((board, best_move, frame, depth, nodes))
+    
+    def _solve(self, board, depth):
+        """
+        Tìm nước đi tốt nhất (chỉ chạy trên thread solver - search_depth không bị tranh chấp)
+        """
+        self.auto.ai_solver.set_search_depth(depth)
+        return self.auto.ai_solver.get_best_move(board)
+    
+    async def _search(self, board, depth):
+        """
+        Nước đi cho board: lấy từ kết quả tìm kiếm trước, chờ lần tìm kiếm trước
+        đang chạy cho đúng board này, hoặc tìm kiếm mới
+        
+        Returns:
+            tuple: (nước đi, số node tìm kiếm - None nếu dùng kết quả tìm kiếm trước)
+        """
+        key = board_key(board)
+        nodes = None
+        speculated = bool(self._speculated) or self._in_flight is not None
+        
+        if key in self._speculated:
+            self.speculation['hits'] += 1
+            best_move = self._speculated[key]
+        elif self._in_flight is not None and self._in_flight[0] == key:
+            self.speculation['hits'] += 1
+            self._speculative_solver.resume()
+            best_move = await self._in_flight[1]
+        else:
+            if speculated:
+                self.speculation['misses'] += 1
+            self._cancel_speculation()
+            loop = asyncio.get_running_loop()
+            best_move = await loop.run_in_executor(self._solver, self._solve, board, depth)
+            nodes = self.auto.ai_solver.nodes
+        
+        self._cancel_speculation()
+        self._speculated = {}
+        return best_move, nodes
+    
+    async def _speculate(self, afterstate):
+        """
+        Tìm kiếm trước cho các board có thể xuất hiện sau nước đi (mỗi ô trống + ô spawn)
+        đến khi board thực tế có (bị hủy)
+        """
+        loop = asyncio.get_running_loop()
+        solver = self._speculative_solver
+        generation = solver.generation
+        solver.resume()
+        for row, col in solver.get_empty_cells(afterstate):
+            candidate = [line[:] for line in afterstate]
+            candidate[row][col] = solver.spawn_value
+            key = board_key(candidate)
+            
+            start = time.perf_counter()
+            future = loop.run_in_executor(self._solver, solver.search, candidate,
+                                          self.auto.select_search_depth(candidate), generation)
+            self._in_flight = (key, future)
+            try:
+                best_move = await future
+            except SearchAborted:
+                self.speculation['aborted'] += 1
+                return
+            finally:
+                self._in_flight = None
+                self.busy['speculate'] += time.perf_counter() - start
+            self._speculated[key] = best_move
+            self.speculation['searched'] += 1
+    
+    def _cancel_speculation(self):
+        """
+        Dừng tìm kiếm trước (lần đang chạy trên thread solver dừng ở node tiếp theo)
+        """
+        self._speculative_solver.abort()
+        if self._speculation_task is not None:
+            self._speculation_task.cancel()
+            self._speculation_task = None
+    
+    async def _act(self):
+        """
+        Stage gửi phím + chờ animation; tìm kiếm trước chạy song song trên thread solver
+        """
+        auto = self.auto
+        loop = asyncio.get_running_loop()
+        while True:
+            board, direction, frame, depth, nodes = await self._moves.get()
+            afterstate = auto.ai_solver.move(board, direction)
+            if self.speculative:
+                self._speculation_task = asyncio.create_task(self._speculate(afterstate))
+            
+            start = time.perf_counter()
+            success, changed, move_timings = await loop.run_in_executor(self._io, auto.send_and_settle, direction, board)
+            self.busy['act'] += time.perf_counter() - start
+            
+            if not success:
+                auto.game_state.set_predicted_board(None)
+                self.stop_reason = "❌ Không gửi được phím"
+                return
+            if not changed:
+                # Gửi lại vẫn không đổi - nhận diện lại toàn bộ
+                auto.game_state.set_predicted_board(None)
+                self._emit(f"⚠️  Game không phản hồi nước đi {direction} - nhận diện lại toàn bộ")
+                await self._settled.put(True)
+                continue
+            
+            auto.move_count += 1
+            if self.metrics is not None:
+                self.metrics.observe_move({**frame.timings, **move_timings}, nodes=nodes, depth=depth, move=direction)
+            if auto.debug_frames is not None:
+                auto.debug_frames.check_move(sum(frame.timings.values()) + sum(move_timings.values()))
+            # Dự đoán board sau nước đi - lần nhận diện sau chỉ cần tìm ô spawn
+            auto.game_state.set_predicted_board(afterstate)
+            self._emit(f"✅ Nước đi #{auto.move_count}: {direction}")
+            
+            if self.max_moves and auto.move_count >= self.max_moves:
+                self.stop_reason = f"✅ Đã đạt số nước đi tối đa: {self.max_moves}"
+                return
+            await self._settled.put(True)
+    
+    async def _log(self):
+        """
+        Stage in log - chạy ngoài đường găng, các stage khác chỉ đưa chuỗi vào hàng đợi
+        """
+        while True:
+            message = await self._logs.get()
+            if message is None:
+                return
+            start = time.perf_counter()
+            logger.info("%s", message)
+            self.busy['log'] += time.perf_counter() - start
+    
+    def get_stats(self):
+        """
+        Thống kê pipeline
+        
+        Returns:
+            dict: moves, seconds, moves_per_minute, utilization {stage: tỉ lệ thời gian bận},
+                  speculation {hits, misses, searched}, dropped_logs, stop_reason
+        """
+        elapsed = self.elapsed or 1e-9
+        return {
+            'moves': self.auto.move_count,
+            'seconds': self.elapsed,
+            'moves_per_minute': self.auto.move_count / elapsed * 60,
+            'utilization': {stage: busy / elapsed for stage, busy in self.busy.items()},
+            'speculation': dict(self.speculation),
+            'dropped_logs': self.dropped_logs,
+            'stop_reason': self.stop_reason,
+        }
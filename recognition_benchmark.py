@@ -0,0 +1,317 @@
+"""
+Module benchmark nhận diện trên corpus có nhãn
+Đo từng backend (template, classifier, paddle, gemini) trên cùng bộ ảnh:
+độ chính xác board/ô, ma trận nhầm lẫn từng giá trị ô, độ trễ p50/p95 mỗi board
+và độ tin cậy có khớp thực tế không. Kết quả ghi ra JSON để so sánh giữa các lần chạy
+    
+    python recognition_benchmark.py corpus/ [--backends template,classifier]
+                                            [--output bench.json] [--compare baseline.json]
+"""
+
+import json
+import sys
+import time
+from config import GRID_SIZE, AUTO_GRID_DETECTION
+from log import get_logger
+
+BENCHMARK_BACKENDS = ['template', 'classifier', 'paddle', 'gemini']
+
+# Các khoảng độ tin cậy để kiểm tra độ tin cậy có khớp tỉ lệ đúng thực tế không
+CONFIDENCE_BINS = [(0.0, 0.5), (0.5, 0.8), (0.8, 1.01)]
+
+logger = get_logger(__name__)
+
+
+def percentile(values, p):
+    """
+    Phân vị p (0-100) theo nearest-rank
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def prepare_samples(samples, grid_size=GRID_SIZE, detect=AUTO_GRID_DETECTION):
+    """
+    Chia sẵn ảnh corpus thành các ô giống lúc chạy thật (không tính vào thời gian nhận diện)
+    
+    Args:
+        samples (list): Danh sách (tên, ảnh, board đúng) từ frame_corpus.load_corpus
+        grid_size (int): Kích thước lưới
+        detect (bool): Tìm lưới và chỉ lấy phần bên trong ô (như GridTracker)
+    
+    Returns:
+        list: Danh sách (tên, ảnh, 16 ô theo thứ tự hàng, board đúng)
+    """
+    from frame_corpus import split_cells
+    from grid_detector import detect_grid
+    
+    prepared = []
+    for name, img, truth in samples:
+        layout = detect_grid(img, grid_size) if detect else None
+        if layout is not None:
+            cells = [cell for row in layout.split(img) for cell in row]
+        else:
+            cells = split_cells(img, grid_size)
+        prepared.append((name, img, cells, truth))
+    return prepared
+
+
+def create_gemini_standin(cell_error_rate=0.0, latency_median=0.05, rate_per_minute=None, seed=1,
+                          **server_kwargs):
+    """
+    GeminiRecognizer chạy trên MockGeminiServer: đi qua toàn bộ đường Gemini
+    (cắt/nén ảnh, client async, parse JSON) nhưng trả về board đúng của mẫu đang đo
+    
+    Args:
+        cell_error_rate (float): Tỉ lệ ô bị trả sai (mô phỏng model nhận nhầm)
+        latency_median (float): Độ trễ trung vị của server giả lập (giây)
+        rate_per_minute (float): Giới hạn tốc độ của client (None = không giới hạn,
+                                 chỉ đo độ trễ mỗi board chứ không đo quota)
+        seed (int): Seed để tái lập
+        **server_kwargs: Tham số khác cho MockGeminiServer (failure_rate, malformed_rate...)
+    
+    Returns:
+        tuple: (recognizer, hàm on_sample(truth) đặt board đúng cho request tiếp theo)
+    """
+    import random
+    from gemini_async import AsyncGeminiClient
+    from gemini_mock import MockGeminiServer
+    from gemini_recognizer import GeminiRecognizer
+    
+    current = {'board': None}
+    rng = random.Random(seed)
+    
+    def board_provider(contents):
+        truth = current['board'] or [[0] * GRID_SIZE for _ in range(GRID_SIZE)]
+        return [[rng.choice([v for v in range(12) if v != value]) if rng.random() < cell_error_rate else value
+                 for value in row] for row in truth]
+    
+    server_kwargs.setdefault('failure_rate', 0.0)
+    server_kwargs.setdefault('malformed_rate', 0.0)
+    server_kwargs.setdefault('quota_per_minute', None)
+    server = MockGeminiServer(board_provider=board_provider, latency_median=latency_median,
+                              seed=seed, **server_kwargs)
+    recognizer = GeminiRecognizer(use_cache=False, model=server)
+    if rate_per_minute is None:
+        recognizer.client = AsyncGeminiClient(server, rate_per_minute=60000, burst=100)
+    
+    def on_sample(truth):
+        current['board'] = truth
+    
+    return recognizer, on_sample
+
+
+def create_backend(name):
+    """
+    Tạo recognizer để benchmark (trong tiến trình hiện tại - đo chính recognizer)
+    
+    Returns:
+        tuple: (recognizer, on_sample hoặc None), recognizer None nếu không khả dụng
+    """
+    if name == 'gemini':
+        return create_gemini_standin()
+    
+    from recognizer_registry import get_recognizer_class
+    recognizer = get_recognizer_class(name)()
+    available = recognizer.is_available() if hasattr(recognizer, 'is_available') else \
+        getattr(recognizer, 'enabled', True)
+    return (recognizer if available else None), None
+
+
+def benchmark_recognizer(recognizer, samples, on_sample=None, board_input='cells', warmup=1):
+    """
+    Chạy một recognizer trên toàn bộ corpus
+    
+    Args:
+        recognizer: Recognizer có recognize_board_with_confidence()
+        samples (list): Danh sách từ prepare_samples()
+        on_sample (callable): Gọi với board đúng trước mỗi mẫu (cho Gemini giả lập)
+        board_input (str): 'cells' - truyền các ô, 'image' - truyền ảnh lưới (Gemini)
+        warmup (int): Số mẫu chạy trước không tính (load model, cache lần đầu)
+    
+    Returns:
+        dict: board_accuracy, cell_accuracy, p50_ms, p95_ms, mean_ms, failures,
+              confusion {giá trị đúng: {giá trị nhận diện: số ô}}, confidence (theo khoảng)
+    """
+    for name, img, cells, truth in samples[:warmup]:
+        if on_sample:
+            on_sample(truth)
+        recognizer.recognize_board_with_confidence(img if board_input == 'image' else cells)
+    
+    latencies = []
+    correct_boards = correct_cells = total_cells = failures = 0
+    confusion = {}
+    bins = [[0, 0] for _ in CONFIDENCE_BINS]  # [số ô đúng, tổng số ô] mỗi khoảng
+    
+    for name, img, cells, truth in samples:
+        if on_sample:
+            on_sample(truth)
+        
+        start = time.perf_counter()
+        board, confidences = recognizer.recognize_board_with_confidence(img if board_input == 'image' else cells)
+        latencies.append(time.perf_counter() - start)
+        
+        if board is None:
+            failures += 1
+            board = [[None] * len(row) for row in truth]
+            confidences = [[0.0] * len(row) for row in truth]
+        
+        if board == truth:
+            correct_boards += 1
+        
+        for row in range(len(truth)):
+            for col in range(len(truth[row])):
+                expected, predicted = truth[row][col], board[row][col]
+                ok = predicted == expected
+                correct_cells += ok
+                total_cells += 1
+                
+                counts = confusion.setdefault(str(expected), {})
+                counts[str(predicted)] = counts.get(str(predicted), 0) + 1
+                
+                confidence = confidences[row][col] if confidences else 0.0
+                for i, (low, high) in enumerate(CONFIDENCE_BINS):
+                    if low <= confidence < high:
+                        bins[i][0] += ok
+                        bins[i][1] += 1
+                        break
+        
+        if board != truth:
+            logger.debug("   ❌ %s: %s", name, board)
+    
+    count = max(len(samples), 1)
+    return {
+        'samples': len(samples),
+        'board_accuracy': correct_boards / count,
+        'cell_accuracy': correct_cells / max(total_cells, 1),
+        'failures': failures,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'mean_ms': sum(latencies) / count * 1000,
+        'confusion': confusion,
+        'confidence': [{'range': [low, min(high, 1.0)], 'cells': total, 'accuracy': ok / total if total else None}
+                       for (low, high), (ok, total) in zip(CONFIDENCE_BINS, bins)],
+    }
+
+
+def run_benchmark(corpus_dir, backends=BENCHMARK_BACKENDS, grid_size=GRID_SIZE):
+    """
+    Benchmark các backend trên corpus
+    
+    Args:
+        corpus_dir (str): Thư mục corpus (frame_corpus)
+        backends (list): Tên các backend cần đo
+        grid_size (int): Kích thước lưới
+    
+    Returns:
+        dict: {'corpus', 'samples', 'timestamp', 'backends': {tên: kết quả hoặc {'skipped': lý do}}}
+    """
+    from frame_corpus import load_corpus
+    
+    samples = prepare_samples(load_corpus(corpus_dir), grid_size)
+    report = {'corpus': str(corpus_dir), 'samples': len(samples),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'backends': {}}
+    
+    for name in backends:
+        try:
+            recognizer, on_sample = create_backend(name)
+        except Exception as e:
+            report['backends'][name] = {'skipped': f"{type(e).__name__}: {e}"}
+            continue
+        if recognizer is None:
+            report['backends'][name] = {'skipped': "không khả dụng"}
+            continue
+        
+        result = benchmark_recognizer(recognizer, samples, on_sample,
+                                      board_input='image' if name == 'gemini' else 'cells')
+        if name == 'gemini':
+            result['standin'] = True  # Đo đường xử lý, không phải độ chính xác của model thật
+        report['backends'][name] = result
+    
+    return report
+
+
+def compare_reports(baseline, current, accuracy_tolerance=0.0, latency_tolerance=0.25):
+    """
+    So sánh với kết quả cũ để phát hiện regression
+    
+    Args:
+        baseline (dict): Kết quả run_benchmark() lần trước
+        current (dict): Kết quả hiện tại
+        accuracy_tolerance (float): Mức giảm độ chính xác ô cho phép
+        latency_tolerance (float): Tỉ lệ tăng p95 cho phép (0.25 = +25%)
+    
+    Returns:
+        list: Các thông báo regression (rỗng nếu không có)
+    """
+    regressions = []
+    for name, result in current['backends'].items():
+        old = baseline.get('backends', {}).get(name)
+        if not old or 'skipped' in old or 'skipped' in result:
+            continue
+        if result['cell_accuracy'] < old['cell_accuracy'] - accuracy_tolerance:
+            regressions.append(f"{name}: độ chính xác ô {old['cell_accuracy'] * 100:.1f}% -> "
+                               f"{result['cell_accuracy'] * 100:.1f}%")
+        if result['p95_ms'] > old['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+    return regressions
+
+
+def top_confusions(confusion, limit=5):
+    """
+    Các cặp nhận nhầm nhiều nhất
+    
+    Returns:
+        list: [(giá trị đúng, giá trị nhận diện, số ô), ...]
+    """
+    pairs = [(expected, predicted, count) for expected, counts in confusion.items()
+             for predicted, count in counts.items() if predicted != expected]
+    return sorted(pairs, key=lambda pair: -pair[2])[:limit]
+
+
+# Chạy benchmark
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Cách dùng: python recognition_benchmark.py <corpus_dir> [--backends a,b] "
+              "[--output file.json] [--compare baseline.json]")
+        sys.exit(1)
+    
+    args = sys.argv[2:]
+    options = {args[i]: args[i + 1] for i in range(0, len(args) - 1, 2)}
+    backends = options['--backends'].split(',') if '--backends' in options else BENCHMARK_BACKENDS
+    
+    print(f"🧪 Benchmark nhận diện trên corpus {sys.argv[1]}...")
+    report = run_benchmark(sys.argv[1], backends)
+    print(f"   {report['samples']} mẫu")
+    
+    for name, result in report['backends'].items():
+        if 'skipped' in result:
+            print(f"   ⏭️  {name}: bỏ qua ({result['skipped']})")
+            continue
+        note = " (giả lập)" if result.get('standin') else ""
+        print(f"   {name}{note}: board {result['board_accuracy'] * 100:5.1f}% | "
+              f"ô {result['cell_accuracy'] * 100:5.1f}% | p50 {result['p50_ms']:.1f}ms | "
+              f"p95 {result['p95_ms']:.1f}ms | lỗi {result['failures']}")
+        for expected, predicted, count in top_confusions(result['confusion']):
+            print(f"      nhầm {expected} -> {predicted}: {count} ô")
+        for bucket in result['confidence']:
+            if bucket['cells']:
+                low, high = bucket['range']
+                print(f"      độ tin cậy {low:.1f}-{high:.1f}: {bucket['cells']} ô, "
+                      f"đúng {bucket['accuracy'] * 100:.1f}%")
+    
+    if '--output' in options:
+        with open(options['--output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Đã lưu kết quả: {options['--output']}")
+    
+    if '--compare' in options:
+        with open(options['--compare'], 'r') as f:
+            regressions = compare_reports(json.load(f), report)
+        for message in regressions:
+            print(f"   ⚠️  Regression - {message}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Không có regression so với baseline")
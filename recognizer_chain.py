@@ -0,0 +1,248 @@
+"""
+Module chuỗi recognizer có theo dõi sức khỏe (health-aware fallback chain)
+Mỗi backend có circuit breaker riêng: backend đang lỗi bị bỏ qua ngay,
+sau một thời gian được thử lại một lần (half-open) trước khi dùng lại
+"""
+
+import threading
+import time
+from config import (CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+                    RECOGNIZER_SLOW_THRESHOLD)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker 3 trạng thái:
+        closed    - bình thường, cho phép gọi
+        open      - lỗi liên tiếp quá ngưỡng, chặn gọi đến hết reset_timeout
+        half_open - hết reset_timeout, cho phép MỘT lần thử (probe)
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        """
+        Khởi tạo circuit breaker
+        
+        Args:
+            failure_threshold (int): Số lỗi liên tiếp để mở mạch
+            reset_timeout (float): Thời gian mở mạch trước khi thử lại (giây)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+    
+    def allow(self):
+        """
+        Có được phép gọi backend không (chuyển open -> half_open khi hết timeout)
+        
+        Returns:
+            bool: True nếu được gọi
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+        return True
+    
+    def record_success(self):
+        """
+        Ghi nhận gọi thành công - đóng mạch
+        """
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+    
+    def record_failure(self):
+        """
+        Ghi nhận gọi thất bại - mở mạch nếu quá ngưỡng hoặc probe half-open thất bại
+        """
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class BackendHealth:
+    """
+    Sức khỏe của một backend: độ trễ trung bình trượt (EWMA), số lần thành công/thất bại
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latency = None  # EWMA độ trễ (giây), None = chưa đo
+        self.successes = 0
+        self.failures = 0
+    
+    def record(self, ok, latency):
+        """
+        Ghi nhận một lần gọi
+        
+        Args:
+            ok (bool): Thành công hay không
+            latency (float): Thời gian gọi (giây)
+        """
+        self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        if ok:
+            self.successes += 1
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+
+
+class RecognizerChain:
+    """
+    Chuỗi recognizer: backend ưu tiên chạy trước, các backend dự phòng sắp theo độ trễ đo được
+    Backend được khởi tạo lười (chỉ khi cần dùng lần đầu)
+    """
+    
+    def __init__(self, factories, preferred=None, slow_threshold=RECOGNIZER_SLOW_THRESHOLD):
+        """
+        Khởi tạo chuỗi recognizer
+        
+        Args:
+            factories (dict): {tên backend: hàm tạo recognizer (trả về None nếu không khả dụng)}
+            preferred (str): Backend người dùng chọn (chạy trước nếu khỏe)
+            slow_threshold (dict): {tên backend: độ trễ tối đa (giây)} - chậm hơn coi là lỗi
+        """
+        self.factories = dict(factories)
+        self.preferred = preferred
+        self.slow_threshold = slow_threshold or {}
+        self.instances = {}   # {tên: recognizer đã khởi tạo}
+        self._create_lock = threading.Lock()  # Warm-up nền và vòng lặp chính có thể cùng tạo
+        self.unavailable = set()
+        self.health = {name: BackendHealth(name) for name in self.factories}
+    
+    def get(self, name):
+        """
+        Lấy recognizer theo tên (khởi tạo nếu chưa có)
+        
+        Returns:
+            object: Recognizer, hoặc None nếu không khả dụng
+        """
+        if name in self.instances:
+            return self.instances[name]
+        
+        with self._create_lock:
+            return self._create(name)
+    
+    def _create(self, name):
+        if name in self.instances:
+            return self.instances[name]
+        if name in self.unavailable or name not in self.factories:
+            return None
+        
+        try:
+            recognizer = self.factories[name]()
+        except Exception as e:
+            logger.error("❌ Không khởi tạo được backend %s: %s", name, e)
+            recognizer = None
+        
+        if recognizer is None:
+            self.unavailable.add(name)
+            return None
+        
+        self.instances[name] = recognizer
+        return recognizer
+    
+    def ordered_backends(self):
+        """
+        Thứ tự thử backend: backend ưu tiên trước, còn lại theo độ trễ tăng dần
+        (backend chưa đo độ trễ xếp sau backend đã đo)
+        
+        Returns:
+            list: Tên các backend không bị mạch mở và còn khả dụng
+        """
+        def sort_key(name):
+            health = self.health[name]
+            latency = health.latency if health.latency is not None else float('inf')
+            return (0 if name == self.preferred else 1, latency)
+        
+        return [name for name in sorted(self.factories, key=sort_key)
+                if name not in self.unavailable]
+    
+    def run(self, call):
+        """
+        Chạy lần lượt các backend khỏe đến khi có kết quả
+        
+        Args:
+            call (callable): Hàm (tên, recognizer) -> kết quả hoặc None nếu thất bại
+        
+        Returns:
+            tuple: (tên backend, kết quả) hoặc (None, None) nếu tất cả thất bại
+        """
+        for name in self.ordered_backends():
+            result = self.call(name, call)
+            if result is not None:
+                return name, result
+        
+        return None, None
+    
+    def call(self, name, call):
+        """
+        Gọi MỘT backend qua circuit breaker của nó và ghi nhận sức khỏe
+        
+        Args:
+            name (str): Tên backend
+            call (callable): Hàm (tên, recognizer) -> kết quả hoặc None nếu thất bại
+        
+        Returns:
+            Kết quả, hoặc None nếu backend đang bị ngắt/không khả dụng/thất bại
+        """
+        health = self.health.get(name)
+        if health is None or not health.breaker.allow():
+            return None
+        
+        recognizer = self.get(name)
+        if recognizer is None:
+            return None
+        
+        # Backend còn đang khởi động (vd. worker đang load model) - bỏ qua lượt này,
+        # không ghi nhận là lỗi để mạch không bị mở ngay lúc bắt đầu
+        is_ready = getattr(recognizer, 'is_ready', None)
+        if is_ready is not None and not is_ready():
+            return None
+        
+        start = time.perf_counter()
+        try:
+            result = call(name, recognizer)
+        except Exception as e:
+            logger.debug("⚠️  Backend %s lỗi: %s", name, e)
+            result = None
+        latency = time.perf_counter() - start
+        
+        limit = self.slow_threshold.get(name)
+        ok = result is not None and (limit is None or latency <= limit)
+        health.record(ok, latency)
+        
+        if health.breaker.state == CircuitBreaker.OPEN:
+            logger.debug("🔌 Ngắt backend %s trong %.0fs (%d lỗi liên tiếp)",
+                         name, health.breaker.reset_timeout, health.breaker.consecutive_failures)
+        
+        return result
+    
+    def get_stats(self):
+        """
+        Thống kê sức khỏe từng backend
+        
+        Returns:
+            dict: {tên: {state, latency_ms, successes, failures}}
+        """
+        return {
+            name: {
+                'state': 'unavailable' if name in self.unavailable else health.breaker.state,
+                'latency_ms': health.latency * 1000 if health.latency is not None else None,
+                'successes': health.successes,
+                'failures': health.failures,
+            }
+            for name, health in self.health.items()
+        }
@@ -0,0 +1,173 @@
+"""
+Module registry các recognizer
+Chỉ import và khởi tạo backend khi thật sự được chọn: google.generativeai,
+paddleocr... không bị load lúc khởi động nếu không dùng
+"""
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from config import RECOGNIZER_WORKER_BACKENDS
+from log import get_logger
+
+logger = get_logger(__name__)
+
+# {tên backend: (module, class)}
+RECOGNIZERS = {
+    'gemini': ('gemini_recognizer', 'GeminiRecognizer'),
+    'template': ('template_recognizer', 'TemplateRecognizer'),
+    'paddle': ('paddle_recognizer', 'PaddleRecognizer'),
+    'classifier': ('tiny_classifier', 'TinyClassifierRecognizer'),
+}
+
+
+def get_recognizer_class(name):
+    """
+    Import module của backend (lần đầu gọi) và trả về class recognizer
+    
+    Args:
+        name (str): Tên backend
+    
+    Returns:
+        type: Class recognizer
+    
+    Raises:
+        KeyError: Backend không có trong registry
+        ImportError: Thiếu thư viện của backend
+    """
+    module_name, class_name = RECOGNIZERS[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def create_recognizer(name, grid_size=4):
+    """
+    Tạo recognizer theo tên (trong tiến trình con nếu backend có trong RECOGNIZER_WORKER_BACKENDS)
+    
+    Args:
+        name (str): Tên backend
+        grid_size (int): Kích thước lưới (cho worker)
+    
+    Returns:
+        object: Recognizer, hoặc None nếu backend không khả dụng
+    """
+    if name in RECOGNIZER_WORKER_BACKENDS:
+        from recognizer_worker import RecognizerWorker
+        return RecognizerWorker(name, grid_size)
+    
+    recognizer = get_recognizer_class(name)()
+    if hasattr(recognizer, 'is_available'):
+        available = recognizer.is_available()
+    else:
+        available = getattr(recognizer, 'enabled', True)
+    return recognizer if available else None
+
+
+# Board giữa ván dùng để đo nhận diện đầu tiên (số mũ: 1 = ô 2, 7 = ô 128)
+STARTUP_BOARD = [[1, 2, 3, 4], [0, 1, 5, 6], [0, 0, 2, 7], [0, 0, 0, 1]]
+
+# Đo trong tiến trình Python mới: import -> khởi tạo -> nhận diện + tính nước đi đầu tiên
+# (thời gian đọc ảnh board mẫu không được tính). Nhận diện sai board mẫu hoặc không tìm được
+# nước đi -> tiến trình thoát lỗi (không báo thời gian của một lần đo không có tìm kiếm)
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import numpy as np
+from game_state import GameState
+from ai_solver import AISolver
+timings = {'import': time.perf_counter() - start}
+
+game_state = GameState(4, ai_model=%(backend)r)
+solver = AISolver()
+timings['init'] = time.perf_counter() - start
+
+load_start = time.perf_counter()
+with np.load(%(image_file)r) as data:
+    grid_image, boxes = data['image'], data['boxes']
+start += time.perf_counter() - load_start
+cells = [[grid_image[y:y + h, x:x + w] for x, y, w, h in boxes[r * 4:(r + 1) * 4]] for r in range(4)]
+board = game_state.update_from_grid(cells, full_image=grid_image)
+timings['first_recognition'] = time.perf_counter() - start
+if board != %(board)r:
+    sys.exit(f"Nhận diện sai board mẫu: {board}")
+
+move = solver.get_best_move(board)
+timings['first_move'] = time.perf_counter() - start
+if move is None:
+    sys.exit("Không tìm được nước đi cho board mẫu")
+
+timings['heavy_modules'] = sorted(m for m in ('google.generativeai', 'paddleocr') if m in sys.modules)
+print("STARTUP_TIMINGS " + json.dumps(timings))
+"""
+
+
+def render_startup_image(path, board=STARTUP_BOARD):
+    """
+    Vẽ ảnh board mẫu từ templates (như ảnh game thật) và lưu ra file .npz
+    cùng khung (x, y, w, h) của từng ô theo thứ tự hàng
+    
+    Args:
+        path (str): File .npz đích
+        board (list): Board 4x4 (số mũ)
+    """
+    import numpy as np
+    from synthetic_game import SyntheticRenderer
+    renderer = SyntheticRenderer(seed=0)
+    size = renderer.cell_size
+    boxes = np.array([(x, y, size, size) for y, x in renderer.slots])
+    np.savez(path, image=renderer.render(board), boxes=boxes)
+
+
+def benchmark_startup(backend='template', runs=3):
+    """
+    Đo thời gian khởi động nguội (cold start) đến nước đi đầu tiên
+    Mỗi lần chạy là một tiến trình Python mới (không có module nào đã được cache)
+    
+    Args:
+        backend (str): Backend nhận diện
+        runs (int): Số lần đo
+    
+    Returns:
+        list: Các dict thời gian tích lũy (giây): import, init, first_recognition, first_move
+    
+    Raises:
+        RuntimeError: Một lần đo lỗi (nhận diện sai board mẫu, không có nước đi, backend lỗi)
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        image_file = os.path.join(directory, "startup_board.npz")
+        render_startup_image(image_file)
+        probe = _STARTUP_PROBE % {'backend': backend, 'image_file': image_file, 'board': STARTUP_BOARD}
+        
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            for line in output.stdout.splitlines():
+                if line.startswith("STARTUP_TIMINGS "):
+                    results.append(json.loads(line[len("STARTUP_TIMINGS "):]))
+                    break
+            else:
+                error = output.stderr.strip().splitlines()[-1:] or ["không có kết quả"]
+                raise RuntimeError(f"Lần đo khởi động lỗi ({backend}): {error[0]}")
+    return results
+
+
+# Đo thời gian khởi động
+if __name__ == "__main__":
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'template'
+    print(f"🧪 Benchmark khởi động nguội (backend: {backend})...")
+    
+    results = benchmark_startup(backend)
+    for i, timings in enumerate(results, 1):
+        heavy = ", ".join(timings['heavy_modules']) or "không"
+        print(f"   Lần {i}: import {timings['import'] * 1000:.0f}ms | "
+              f"khởi tạo {timings['init'] * 1000:.0f}ms | "
+              f"nhận diện đầu {timings['first_recognition'] * 1000:.0f}ms | "
+              f"nước đi đầu {timings['first_move'] * 1000:.0f}ms | module nặng: {heavy}")
+    
+    if results:
+        best = min(timings['first_move'] for timings in results)
+        print(f"✅ Khởi động đến nước đi đầu tiên: {best * 1000:.0f}ms (tốt nhất)")
@@ -0,0 +1,327 @@
+"""
+Module chạy recognizer nặng (vd. PaddleOCR) trong tiến trình con
+Các ô (đã cắt theo layout lưới ở tiến trình chính) được chuyển qua
+multiprocessing.shared_memory (không pickle mảng pixel),
+chỉ metadata nhỏ và board/độ tin cậy đi qua Pipe. Tiến trình con chết thì
+được khởi động lại, vòng lặp chính vẫn tiếp tục (chuỗi recognizer dùng dự phòng)
+"""
+
+import atexit
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from config import SCREEN_REGION, WORKER_REQUEST_TIMEOUT, WORKER_MAX_RESTARTS
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _worker_main(name, conn):
+    """
+    Vòng lặp của tiến trình con: nhận yêu cầu, đọc ảnh từ shared memory, trả kết quả
+
+    Yêu cầu: ('board' | 'cells', tên shared memory, [shape từng ô], dtype) - các ô nằm liên tiếp
+    Trả về:  ('ok', (board, độ tin cậy) hoặc [(số, độ tin cậy), ...], thời gian xử lý)
+             hoặc ('error', thông báo)
+    """
+    try:
+        # Import backend tại đây - tiến trình chính không phải import thư viện nặng
+        from recognizer_registry import get_recognizer_class
+        recognizer = get_recognizer_class(name)()
+        ok = getattr(recognizer, 'enabled', True)
+    except Exception as e:
+        conn.send(('error', f"Không khởi tạo được {name}: {e}"))
+        return
+    conn.send(('ready', ok))
+
+    attached = {}  # {tên shared memory: SharedMemory}
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+
+            kind, shm_name, shapes, dtype = request
+            try:
+                if shm_name not in attached:
+                    for shm in attached.values():
+                        shm.close()
+                    attached = {shm_name: shared_memory.SharedMemory(name=shm_name)}
+                cells = []
+                offset = 0
+                for shape in shapes:
+                    cell = np.ndarray(shape, dtype=dtype, buffer=attached[shm_name].buf, offset=offset)
+                    offset += cell.nbytes
+                    cells.append(cell)
+
+                start = time.perf_counter()
+                if kind == 'board':
+                    result = recognizer.recognize_board_with_confidence(cells)
+                else:
+                    result = recognizer.recognize_cells_with_confidence(cells)
+                del cells, cell  # Nhả view trước khi shared memory có thể bị đóng
+                conn.send(('ok', result, time.perf_counter() - start))
+
+            except Exception as e:
+                conn.send(('error', str(e)))
+    finally:
+        for shm in attached.values():
+            shm.close()
+
+
+class RecognizerWorker:
+    """
+    Proxy cho một recognizer chạy trong tiến trình con
+    Có recognize_board()/recognize_number() như recognizer thường
+    """
+
+    out_of_process = True
+
+    def __init__(self, backend, grid_size=4, request_timeout=WORKER_REQUEST_TIMEOUT,
+                 max_restarts=WORKER_MAX_RESTARTS):
+        """
+        Khởi tạo và chạy tiến trình con (không chờ model load xong)
+
+        Args:
+            backend (str): Tên backend ('paddle', 'template')
+            grid_size (int): Kích thước lưới
+            request_timeout (float): Thời gian chờ kết quả tối đa (giây), quá thì khởi động lại
+            max_restarts (int): Số lần khởi động lại tối đa
+        """
+        self.backend = backend
+        self.grid_size = grid_size
+        self.request_timeout = request_timeout
+        self.max_restarts = max_restarts
+        self.enabled = True
+
+        # 'spawn': tiến trình con sạch, không kế thừa thread chụp màn hình/mss của tiến trình chính
+        self._context = mp.get_context('spawn')
+        self._process = None
+        self._conn = None
+        self._ready = False
+        self._shm = None
+        self._shm_view = None
+
+        # Thống kê
+        self.restarts = 0
+        self.requests = 0
+        self.worker_seconds = 0.0
+        self.last_confidences = None
+
+        self._allocate(SCREEN_REGION['width'] * SCREEN_REGION['height'] * 4)
+        self._start()
+        atexit.register(self.close)
+
+    def _allocate(self, size):
+        """
+        Tạo (lại) vùng shared memory đủ lớn cho một frame
+        """
+        self._release_shm()
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm_view = np.ndarray((size,), dtype=np.uint8, buffer=self._shm.buf)
+
+    def _release_shm(self):
+        if self._shm is not None:
+            self._shm_view = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _start(self):
+        """
+        Chạy tiến trình con
+        """
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_worker_main,
+                                              args=(self.backend, child_conn),
+                                              name=f"recognizer-{self.backend}", daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._ready = False
+
+    def _restart(self, reason):
+        """
+        Dừng tiến trình con bị treo/chết và chạy lại (nếu chưa quá số lần cho phép)
+        """
+        logger.warning("⚠️  Worker %s lỗi (%s), khởi động lại...", self.backend, reason)
+        self._stop_process()
+        if self.restarts >= self.max_restarts:
+            logger.error("❌ Worker %s khởi động lại quá %d lần, tắt backend", self.backend, self.max_restarts)
+            self.enabled = False
+            return
+        self.restarts += 1
+        self._start()
+
+    def _stop_process(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._conn.close()
+        self._process = None
+
+    def _check_ready(self, timeout=0.0):
+        """
+        Kiểm tra tiến trình con đã load model xong chưa (không chặn mặc định)
+        """
+        if self._ready:
+            return True
+        if not self._process.is_alive():
+            self._restart("tiến trình con đã thoát")
+            return False
+        if self._conn.poll(timeout):
+            status, payload = self._conn.recv()
+            if status == 'ready' and payload:
+                self._ready = True
+                logger.debug("✅ Worker %s đã sẵn sàng (pid %s)", self.backend, self._process.pid)
+            else:
+                logger.error("❌ Worker %s không khả dụng: %s", self.backend, payload)
+                self._stop_process()
+                self.enabled = False
+        return self._ready
+
+    def wait_ready(self, timeout=60.0):
+        """
+        Chờ tiến trình con load model xong
+
+        Returns:
+            bool: True nếu sẵn sàng
+        """
+        return self.enabled and self._check_ready(timeout)
+
+    def is_ready(self):
+        """
+        Worker đã load model xong chưa (không chờ)
+
+        Returns:
+            bool: False khi còn đang khởi động - chuỗi recognizer bỏ qua, không tính là lỗi
+        """
+        return self.enabled and self._check_ready()
+
+    def _request(self, kind, cells):
+        """
+        Ghi các ô liên tiếp vào shared memory và chờ kết quả
+
+        Args:
+            kind (str): 'board' (đủ các ô theo thứ tự hàng) hoặc 'cells'
+            cells (list): Ảnh các ô (view cũng được - được copy vào shared memory)
+
+        Returns:
+            Kết quả (board hoặc danh sách số), None nếu worker chưa sẵn sàng/lỗi/quá thời gian
+        """
+        if not self.enabled or not cells or not self._check_ready():
+            return None
+
+        dtype = cells[0].dtype
+        total = sum(cell.nbytes for cell in cells)
+        if total > self._shm.size:
+            self._allocate(total)
+        offset = 0
+        for cell in cells:
+            target = self._shm_view[offset:offset + cell.nbytes].view(dtype).reshape(cell.shape)
+            np.copyto(target, cell)
+            offset += cell.nbytes
+
+        try:
+            self._conn.send((kind, self._shm.name, [cell.shape for cell in cells], dtype.str))
+            if not self._conn.poll(self.request_timeout):
+                self._restart(f"quá {self.request_timeout}s")
+                return None
+            response = self._conn.recv()
+        except (EOFError, OSError) as e:
+            self._restart(str(e) or type(e).__name__)
+            return None
+
+        if response[0] != 'ok':
+            logger.debug("⚠️  Worker %s: %s", self.backend, response[1])
+            return None
+
+        _, result, seconds = response
+        self.requests += 1
+        self.worker_seconds += seconds
+        return result
+
+    def recognize_board(self, grid_cells):
+        """
+        Nhận diện board từ các ô đã cắt theo layout lưới (như recognizer thường)
+
+        Args:
+            grid_cells (list): 16 ô (list 1D theo thứ tự hàng)
+
+        Returns:
+            list: Board 4x4, None nếu thất bại
+        """
+        return self.recognize_board_with_confidence(grid_cells)[0]
+
+    def recognize_board_with_confidence(self, grid_cells):
+        """
+        Nhận diện board kèm độ tin cậy từng ô
+
+        Returns:
+            tuple: (board 4x4, độ tin cậy 4x4), (None, None) nếu thất bại
+        """
+        result = self._request('board', list(grid_cells))
+        if result is None:
+            return None, None
+        self.last_confidences = result[1]
+        return result
+
+    def recognize_number(self, cell_img):
+        """
+        Nhận diện một ô
+
+        Returns:
+            int: Số nhận diện được (0 nếu thất bại)
+        """
+        return self.recognize_cell_with_confidence(cell_img)[0]
+
+    def recognize_cell_with_confidence(self, cell_img):
+        """
+        Nhận diện một ô kèm độ tin cậy
+
+        Returns:
+            tuple: (số, độ tin cậy), (0, 0.0) nếu thất bại
+        """
+        results = self.recognize_cells_with_confidence([cell_img])
+        return results[0] if results else (0, 0.0)
+
+    def recognize_cells_with_confidence(self, cells):
+        """
+        Nhận diện danh sách ô (một request cho tất cả)
+
+        Returns:
+            list: [(số, độ tin cậy), ...] theo thứ tự cells, None nếu worker lỗi/hết thời gian
+                (để chuỗi recognizer ghi nhận lỗi và thử backend tiếp theo)
+        """
+        return self._request('cells', list(cells))
+
+    def get_stats(self):
+        """
+        Thống kê worker
+
+        Returns:
+            dict: requests, avg_ms (thời gian xử lý trong worker), restarts
+        """
+        return {
+            'requests': self.requests,
+            'avg_ms': self.worker_seconds / self.requests * 1000 if self.requests else 0.0,
+            'restarts': self.restarts,
+        }
+
+    def close(self):
+        """
+        Dừng tiến trình con và giải phóng shared memory
+        """
+        self._stop_process()
+        self._release_shm()
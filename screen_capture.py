@@ -4,10 +4,18 @@ Chức năng: Chụp vùng game và chuẩn bị ảnh để nhận diện
 """
 
 import mss
+import time
 import numpy as np
 from PIL import Image
 import cv2
-from config import SCREEN_REGION, DEBUG_MODE
+from frame import Frame
+from config import (SCREEN_REGION, SETTLE_TIMEOUT, SETTLE_RESPONSE_TIMEOUT,
+                    SETTLE_POLL_INTERVAL, SETTLE_STABLE_FRAMES, SETTLE_THRESHOLD,
+                    SETTLE_DOWNSAMPLE, CAPTURE_BACKEND, THREADED_CAPTURE, GRID_SIZE,
+                    MISSED_MOVE_THRESHOLD)
+from log import get_logger
+
+logger = get_logger(__name__)
 
 
 class ScreenCapture:
@@ -15,6 +23,8 @@ class ScreenCapture:
     Class để chụp màn hình và xử lý ảnh
     """
     
+    last_response_time = None  # Gửi phím -> màn hình bắt đầu đổi (giây) của lần chờ gần nhất
+    
     def __init__(self, region=None):
         """
         Khởi tạo screen capture
@@ -42,11 +52,176 @@ class ScreenCapture:
         # Chuyển từ BGRA sang BGR (loại bỏ alpha channel)
         img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
         
-        if DEBUG_MODE:
-            print(f"📸 Đã chụp màn hình: {img.shape}")
+        logger.debug("📸 Đã chụp màn hình: %s", img.shape)
         
         return img
     
+    def capture_frame(self):
+        """
+        Chụp màn hình vùng game, không copy, không chuyển màu
+        
+        Returns:
+            Frame: Frame BGRA trỏ thẳng vào buffer của mss (chuyển màu lười)
+        """
+        start = time.perf_counter()
+        screenshot = self.sct.grab(self.region)
+        frame = Frame.from_screenshot(screenshot, capture_time=time.perf_counter() - start)
+        
+        logger.debug("📸 Đã chụp frame (zero-copy): %s", frame.shape)
+        
+        return frame
+    
+    def mark_input(self):
+        """
+        Ghi nhận ngay trước khi gửi phím (chụp đồng bộ luôn là ảnh mới - không cần làm gì)
+        """
+    
+    def snapshot(self, downsample=SETTLE_DOWNSAMPLE):
+        """
+        Chụp nhanh một ảnh thu nhỏ của vùng game (dùng để so sánh frame)
+        
+        Args:
+            downsample (int): Lấy 1 pixel mỗi N pixel theo mỗi chiều
+            
+        Returns:
+            numpy.ndarray: Ảnh BGR thu nhỏ (int16 để trừ không bị tràn số)
+        """
+        screenshot = self.sct.grab(self.region)
+        img = np.asarray(screenshot)
+        return img[::downsample, ::downsample, :3].astype(np.int16)
+    
+    def _settle_sample(self):
+        """
+        Lấy một mẫu cho vòng lặp settle detection (mặc định: chụp mới)
+        
+        Returns:
+            numpy.ndarray: Ảnh thu nhỏ
+        """
+        return self.snapshot()
+    
+    def frame_difference(self, frame_a, frame_b):
+        """
+        Sai khác trung bình giữa 2 ảnh thu nhỏ
+        
+        Returns:
+            float: Sai khác trung bình (0-255), inf nếu khác kích thước
+        """
+        if frame_a is None or frame_b is None or frame_a.shape != frame_b.shape:
+            return float('inf')
+        return float(np.mean(np.abs(frame_a - frame_b)))
+    
+    def cell_difference(self, frame_a, frame_b, boxes=None, grid_size=GRID_SIZE):
+        """
+        Sai khác lớn nhất giữa các ô của 2 ảnh thu nhỏ - một nước đi hợp lệ có khi chỉ
+        đổi 1-2 ô nên trung bình cả ảnh quá nhỏ, còn ô đã đổi thì sai khác rất rõ
+        
+        Args:
+            frame_a (numpy.ndarray): Ảnh thu nhỏ
+            frame_b (numpy.ndarray): Ảnh thu nhỏ
+            boxes (list): Khung (x, y, w, h) của từng ô trên ảnh thu nhỏ (None = chia đều)
+            grid_size (int): Kích thước lưới khi chia đều
+            
+        Returns:
+            float: Sai khác trung bình của ô thay đổi nhiều nhất (0-255), inf nếu khác kích thước
+        """
+        if frame_a is None or frame_b is None or frame_a.shape != frame_b.shape:
+            return float('inf')
+        diff = np.abs(frame_a - frame_b).mean(axis=2)
+        if boxes is None:
+            height, width = diff.shape
+            cell_h, cell_w = height // grid_size, width // grid_size
+            if cell_h == 0 or cell_w == 0:
+                return float(diff.mean())
+            cells = diff[:cell_h * grid_size, :cell_w * grid_size].reshape(grid_size, cell_h, grid_size, cell_w)
+            return float(cells.mean(axis=(1, 3)).max())
+        return max(float(diff[y:y + h, x:x + w].mean()) for x, y, w, h in boxes)
+    
+    def wait_for_change(self, reference, timeout=SETTLE_RESPONSE_TIMEOUT,
+                        poll_interval=SETTLE_POLL_INTERVAL, threshold=MISSED_MOVE_THRESHOLD, boxes=None):
+        """
+        Chờ màn hình thay đổi so với reference (game đã phản hồi phím):
+        chỉ cần một ô bất kỳ đổi là coi như game đã phản hồi
+        
+        Args:
+            reference (numpy.ndarray): Ảnh thu nhỏ trước nước đi (từ snapshot)
+            timeout (float): Thời gian chờ tối đa (giây)
+            poll_interval (float): Khoảng cách giữa 2 lần chụp (giây)
+            threshold (float): Sai khác trung bình tối thiểu của một ô để coi là đã thay đổi
+            boxes (list): Khung từng ô trên ảnh thu nhỏ (None = chia đều vùng chụp)
+            
+        Returns:
+            tuple: (changed, elapsed) - changed=False nếu hết timeout mà không ô nào thay đổi
+        """
+        start = time.perf_counter()
+        while True:
+            changed = self.cell_difference(self._settle_sample(), reference, boxes) > threshold
+            elapsed = time.perf_counter() - start
+            if changed or elapsed >= timeout:
+                self.last_response_time = elapsed if changed else None
+                return changed, elapsed
+            time.sleep(poll_interval)
+    
+    def wait_until_settled(self, reference=None, timeout=SETTLE_TIMEOUT,
+                           response_timeout=SETTLE_RESPONSE_TIMEOUT,
+                           poll_interval=SETTLE_POLL_INTERVAL,
+                           stable_frames=SETTLE_STABLE_FRAMES,
+                           threshold=SETTLE_THRESHOLD):
+        """
+        Chờ đến khi animation kết thúc (các frame liên tiếp không đổi)
+        
+        Nếu có reference (ảnh trước khi gửi phím), trước tiên chờ màn hình thay đổi
+        so với reference để không nhầm "chưa kịp phản hồi" thành "đã ổn định".
+        
+        Args:
+            reference (numpy.ndarray): Ảnh thu nhỏ trước nước đi (từ snapshot), có thể None
+            timeout (float): Thời gian chờ tối đa (giây)
+            response_timeout (float): Thời gian chờ tối đa để màn hình bắt đầu thay đổi
+            poll_interval (float): Khoảng cách giữa 2 lần chụp (giây)
+            stable_frames (int): Số lần so sánh liên tiếp không đổi cần thiết
+            threshold (float): Ngưỡng sai khác để coi là không đổi
+            
+        Returns:
+            tuple: (settled, elapsed) - settled=False nếu hết timeout
+            (thời gian đến khi màn hình bắt đầu đổi lưu ở last_response_time, None nếu không đo được)
+        """
+        start = time.perf_counter()
+        deadline = start + timeout
+        changed = reference is None
+        self.last_response_time = None
+        previous = reference
+        stable_count = 0
+        
+        while True:
+            current = self._settle_sample()
+            now = time.perf_counter()
+            
+            if not changed:
+                if self.frame_difference(current, reference) > threshold:
+                    changed = True
+                    self.last_response_time = now - start
+                elif now - start >= response_timeout:
+                    # Màn hình không phản hồi - coi như đã ổn định ở trạng thái cũ
+                    changed = True
+            
+            if changed and previous is not None:
+                if self.frame_difference(current, previous) <= threshold:
+                    stable_count += 1
+                    if stable_count >= stable_frames:
+                        elapsed = now - start
+                        logger.debug("⏱️  Màn hình ổn định sau %.0fms", elapsed * 1000)
+                        return True, elapsed
+                else:
+                    stable_count = 0
+            
+            previous = current
+            
+            if now >= deadline:
+                elapsed = now - start
+                logger.debug("⚠️  Hết thời gian chờ ổn định (%.0fms)", elapsed * 1000)
+                return False, elapsed
+            
+            time.sleep(poll_interval)
+    
     def preprocess_image(self, img):
         """
         Tiền xử lý ảnh để chuẩn bị cho việc nhận diện
@@ -67,8 +242,7 @@ class ScreenCapture:
         # Áp dụng Gaussian blur để giảm nhiễu
         blurred = cv2.GaussianBlur(thresh, (5, 5), 0)
         
-        if DEBUG_MODE:
-            print("🔧 Đã tiền xử lý ảnh")
+        logger.debug("🔧 Đã tiền xử lý ảnh")
         
         return blurred
     
@@ -103,8 +277,7 @@ class ScreenCapture:
             
             grid.append(row_cells)
         
-        if DEBUG_MODE:
-            print(f"✂️  Đã chia ảnh thành lưới {grid_size}x{grid_size}")
+        logger.debug("✂️  Đã chia ảnh thành lưới %sx%s", grid_size, grid_size)
         
         return grid
     
@@ -117,7 +290,7 @@ class ScreenCapture:
             filename (str): Tên file
         """
         cv2.imwrite(filename, img)
-        print(f"💾 Đã lưu ảnh debug: {filename}")
+        logger.info("💾 Đã lưu ảnh debug: %s", filename)
     
     def update_region(self, new_region):
         """
@@ -127,7 +300,79 @@ class ScreenCapture:
             new_region (dict): Vùng mới
         """
         self.region = new_region
-        print(f"🔄 Đã cập nhật vùng chụp: {new_region}")
+        logger.info("🔄 Đã cập nhật vùng chụp: %s", new_region)
+
+
+def create_capture_backend(name=CAPTURE_BACKEND, simulator=None, threaded=THREADED_CAPTURE):
+    """
+    Tạo capture backend theo tên
+    
+    Args:
+        name (str): 'mss' (màn hình thật) hoặc 'synthetic' (vẽ từ game giả lập)
+        simulator (GameSimulator): Game giả lập (backend 'synthetic')
+        threaded (bool): Chụp mss trong thread nền (ThreadedCapture)
+    
+    Returns:
+        ScreenCapture: Đối tượng chụp
+    """
+    if name == 'synthetic':
+        from synthetic_game import SyntheticCapture
+        return SyntheticCapture(simulator)
+    if name != 'mss':
+        raise ValueError(f"Capture backend không hợp lệ: {name}")
+    if threaded:
+        # Producer chụp nền vào ring buffer, capture() trả về frame có sẵn
+        from capture_thread import ThreadedCapture
+        return ThreadedCapture()
+    return ScreenCapture()
+
+
+def benchmark_capture_paths(capture, iterations=50):
+    """
+    So sánh đường cũ (np.array + cvtColor + preprocess_image) với đường zero-copy
+    
+    Args:
+        capture (ScreenCapture): Đối tượng chụp màn hình
+        iterations (int): Số lần lặp
+        
+    Returns:
+        dict: Thời gian trung bình (ms) của từng bước trên mỗi đường
+    """
+    legacy = {'grab': 0.0, 'to_numpy': 0.0, 'cvtColor': 0.0, 'preprocess': 0.0}
+    zero_copy = {'grab': 0.0, 'wrap': 0.0, 'cells': 0.0}
+    
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        screenshot = capture.sct.grab(capture.region)
+        t1 = time.perf_counter()
+        img = np.array(screenshot)
+        t2 = time.perf_counter()
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        t3 = time.perf_counter()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        cv2.GaussianBlur(thresh, (5, 5), 0)
+        t4 = time.perf_counter()
+        legacy['grab'] += t1 - t0
+        legacy['to_numpy'] += t2 - t1
+        legacy['cvtColor'] += t3 - t2
+        legacy['preprocess'] += t4 - t3
+        
+        t0 = time.perf_counter()
+        screenshot = capture.sct.grab(capture.region)
+        t1 = time.perf_counter()
+        frame = Frame.from_screenshot(screenshot)
+        t2 = time.perf_counter()
+        frame.cells()
+        t3 = time.perf_counter()
+        zero_copy['grab'] += t1 - t0
+        zero_copy['wrap'] += t2 - t1
+        zero_copy['cells'] += t3 - t2
+    
+    return {
+        'legacy': {k: v / iterations * 1000 for k, v in legacy.items()},
+        'zero_copy': {k: v / iterations * 1000 for k, v in zero_copy.items()},
+    }
 
 
 # Hàm tiện ích để test module
@@ -150,4 +395,10 @@ if __name__ == "__main__":
     capture.save_debug_image(img, "test_capture.png")
     capture.save_debug_image(processed, "test_processed.png")
     
+    # So sánh thời gian từng bước: đường cũ vs zero-copy
+    print("\n⏱️  Benchmark đường chụp (ms/frame):")
+    for path, stages in benchmark_capture_paths(capture).items():
+        detail = " | ".join(f"{name} {ms:.2f}" for name, ms in stages.items())
+        print(f"   {path}: {detail} | tổng {sum(stages.values()):.2f}")
+    
     print("✅ Test hoàn thành!")
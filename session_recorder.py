@@ -0,0 +1,309 @@
+"""
+Module ghi lại phiên chạy auto và phát lại (replay) không cần màn hình/bàn phím
+Mỗi vòng lặp của run_auto được ghi thành một chunk: ảnh chụp (PNG, không mất dữ liệu),
+board nhận diện được, nước đi của solver, thống kê và thời gian từng bước.
+Replay đưa lại các frame đã ghi qua ScreenCapture -> GameState -> AISolver
+với tốc độ tối đa để tìm lại lỗi nhận diện và regression hiệu năng offline
+
+Định dạng file (.rec):
+    MAGIC | chunk | chunk | ...
+    chunk = kind (4 byte) | độ dài meta (uint32) | độ dài ảnh (uint32) | meta JSON | ảnh PNG
+"""
+
+import json
+import queue
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import cv2
+from config import GRID_SIZE, AUTO_GRID_DETECTION, RECORDING_DIR, RECOGNITION_MODE
+from log import get_logger
+from frame import Frame
+from screen_capture import ScreenCapture
+
+logger = get_logger(__name__)
+
+MAGIC = b'2048REC1'
+_CHUNK_HEADER = struct.Struct('<4sII')
+
+
+class SessionRecorder:
+    """
+    Ghi phiên chạy ra file chunk - nén PNG và ghi file ở thread nền,
+    vòng lặp chính chỉ copy frame (frame là view vào buffer chụp)
+    """
+    
+    def __init__(self, path=None, session_info=None):
+        """
+        Mở file ghi
+        
+        Args:
+            path (str): File ghi (None = RECORDING_DIR/session_<thời gian>.rec)
+            session_info (dict): Thông tin phiên (vùng chụp, AI model...) ghi ở chunk đầu
+        """
+        if path is None:
+            path = Path(RECORDING_DIR) / time.strftime("session_%Y%m%d_%H%M%S.rec")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.iterations = 0
+        self.bytes_written = 0
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC)
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="session-recorder", daemon=True)
+        self._writer.start()
+        
+        info = dict(session_info or {})
+        info.setdefault('started', time.strftime('%Y-%m-%dT%H:%M:%S'))
+        info.setdefault('grid_size', GRID_SIZE)
+        self._queue.put((b'HEAD', info, None))
+    
+    def record(self, frame_img, board, move=None, stats=None, timings=None, copy=True):
+        """
+        Ghi một vòng lặp (cả vòng lặp nhận diện lỗi và frame game over)
+        
+        Args:
+            frame_img (numpy.ndarray): Ảnh chụp (BGRA/BGR) - được copy ngay
+            board (list): Board nhận diện được (None = nhận diện lỗi)
+            move (str): Nước đi solver chọn (None = không đi)
+            stats (dict): Thống kê solver/game (depth, điểm...)
+            timings (dict): Thời gian từng bước (giây)
+            copy (bool): False nếu frame_img đã là bản copy riêng (chụp trước khi nhận diện)
+        """
+        meta = {
+            'i': self.iterations,
+            't': time.time(),
+            'board': board,
+            'move': move,
+            'stats': stats or {},
+            'timings': timings or {},
+        }
+        self.iterations += 1
+        self._queue.put((b'ITER', meta, np.array(frame_img, copy=True) if copy else frame_img))
+    
+    def _writer_loop(self):
+        """
+        Thread ghi: nén ảnh và ghi chunk theo thứ tự
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, meta, img = item
+            try:
+                blob = b''
+                if img is not None:
+                    ok, encoded = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                    blob = encoded.tobytes() if ok else b''
+                data = json.dumps(meta).encode('utf-8')
+                self._file.write(_CHUNK_HEADER.pack(kind, len(data), len(blob)))
+                self._file.write(data)
+                self._file.write(blob)
+                self._file.flush()  # Phiên bị dừng đột ngột vẫn đọc được phần đã ghi
+                self.bytes_written += _CHUNK_HEADER.size + len(data) + len(blob)
+            except Exception as e:
+                logger.error("❌ Lỗi ghi phiên: %s", e)
+    
+    def close(self):
+        """
+        Ghi nốt các chunk đang chờ và đóng file
+        """
+        if self._file.closed:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        logger.debug("💾 Đã ghi %s vòng lặp vào %s (%.1fMB)",
+                     self.iterations, self.path, self.bytes_written / 1024 / 1024)
+
+
+def read_session(path):
+    """
+    Đọc file phiên
+    
+    Args:
+        path (str): File .rec
+    
+    Returns:
+        tuple: (thông tin phiên, danh sách vòng lặp {'i', 'board', 'move', 'stats', 'timings', 'frame'})
+    """
+    info = {}
+    iterations = []
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} không phải file phiên (.rec)")
+        
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if len(header) < _CHUNK_HEADER.size:
+                break
+            kind, meta_len, blob_len = _CHUNK_HEADER.unpack(header)
+            data = f.read(meta_len)
+            blob = f.read(blob_len)
+            if len(data) < meta_len or len(blob) < blob_len:
+                break  # Chunk cuối bị cắt (phiên dừng đột ngột)
+            
+            meta = json.loads(data.decode('utf-8'))
+            if kind == b'HEAD':
+                info = meta
+            elif kind == b'ITER':
+                meta['frame'] = cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_UNCHANGED) if blob else None
+                iterations.append(meta)
+    
+    return info, iterations
+
+
+class ReplayCapture(ScreenCapture):
+    """
+    ScreenCapture phát lại các frame đã ghi (không chụp màn hình)
+    """
+    
+    def __init__(self, frames, region=None):
+        """
+        Args:
+            frames (list): Danh sách ảnh theo thứ tự
+            region (dict): Vùng chụp lúc ghi (chỉ để hiển thị)
+        """
+        self.region = region or {'top': 0, 'left': 0, 'width': 0, 'height': 0}
+        self.sct = None
+        self.frames = frames
+        self.position = 0
+    
+    def capture_frame(self):
+        """
+        Frame tiếp theo đã ghi
+        
+        Returns:
+            Frame: Frame BGRA, None nếu đã hết
+        """
+        if self.position >= len(self.frames):
+            return None
+        raw = self.frames[self.position]
+        self.position += 1
+        if raw.ndim == 3 and raw.shape[2] == 3:
+            raw = cv2.cvtColor(raw, cv2.COLOR_BGR2BGRA)
+        return Frame(raw)
+    
+    def capture(self):
+        frame = self.capture_frame()
+        return None if frame is None else frame.bgr
+    
+    def update_region(self, new_region):
+        self.region = new_region
+
+
+def replay_session(path, ai_model=None, recorded_depth=True):
+    """
+    Phát lại phiên đã ghi qua GameState và AISolver (không màn hình, không bàn phím)
+    
+    Nước đi đã ghi được dùng để dự đoán board tiếp theo (tracking) nên
+    replay luôn đồng bộ với các frame đã ghi, kể cả khi solver chọn khác
+    
+    Args:
+        path (str): File .rec
+        ai_model (str): Backend nhận diện (None = backend lúc ghi)
+        recorded_depth (bool): Dùng độ sâu tìm kiếm đã ghi (để so sánh nước đi)
+    
+    Returns:
+        dict: iterations, board_mismatches [(i, board đã ghi, board replay)],
+              move_mismatches [(i, nước đã ghi, nước replay)],
+              replay_ms / recorded_ms {bước: trung bình}, seconds
+    """
+    from ai_solver import AISolver
+    from game_state import GameState
+    from grid_detector import GridTracker
+    
+    info, iterations = read_session(path)
+    grid_size = info.get('grid_size', GRID_SIZE)
+    capture = ReplayCapture([it['frame'] for it in iterations], info.get('region'))
+    tracker = GridTracker(capture, grid_size, capture_margin=None, cache_file=None,
+                          search_screen=False) if AUTO_GRID_DETECTION else None
+    game_state = GameState(grid_size, ai_model=ai_model or info.get('ai_model', 'template'),
+                           mode=info.get('mode', RECOGNITION_MODE))
+    ai_solver = AISolver()
+    if 'spawn_value' in info:
+        ai_solver.set_spawn_value(info['spawn_value'])
+    
+    board_mismatches = []
+    move_mismatches = []
+    replay_times = {}
+    recorded_times = {}
+    start = time.perf_counter()
+    
+    for recorded in iterations:
+        frame = capture.capture_frame()
+        if frame is None:
+            break
+        
+        grid = tracker.cells(frame.raw) if tracker is not None else None
+        if grid is None:
+            grid = frame.cells(grid_size)
+        
+        recognize_start = time.perf_counter()
+        board = game_state.update_from_grid(grid, full_image=frame.raw)
+        timings = {'recognize': time.perf_counter() - recognize_start}
+        if board != recorded['board']:
+            board_mismatches.append((recorded['i'], recorded['board'], board))
+        
+        if recorded_depth and 'depth' in recorded['stats']:
+            ai_solver.set_search_depth(recorded['stats']['depth'])
+        solve_start = time.perf_counter()
+        move = ai_solver.get_best_move(board) if board is not None else None
+        timings['solve'] = time.perf_counter() - solve_start
+        if move != recorded['move']:
+            move_mismatches.append((recorded['i'], recorded['move'], move))
+        
+        # Đi theo nước đã ghi để frame tiếp theo khớp với dự đoán
+        if recorded['move'] and board is not None:
+            game_state.set_predicted_board(ai_solver.move(board, recorded['move']))
+        else:
+            game_state.set_predicted_board(None)
+        
+        for target, source in ((replay_times, timings), (recorded_times, recorded['timings'])):
+            for stage, seconds in source.items():
+                total = target.setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+    
+    average = lambda times: {stage: total / count * 1000 for stage, (total, count) in times.items()}
+    return {
+        'iterations': len(iterations),
+        'board_mismatches': board_mismatches,
+        'move_mismatches': move_mismatches,
+        'replay_ms': average(replay_times),
+        'recorded_ms': average(recorded_times),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# CLI: info / replay
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('info', 'replay'):
+        print("Cách dùng: python session_recorder.py info <file.rec> | replay <file.rec> [ai_model]")
+        sys.exit(1)
+    
+    if sys.argv[1] == 'info':
+        info, iterations = read_session(sys.argv[2])
+        print(f"📼 {sys.argv[2]}: {len(iterations)} vòng lặp | {info}")
+        for it in iterations:
+            timings = " | ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in it['timings'].items())
+            print(f"   #{it['i']}: {it['move']} | {it['stats']} | {timings}")
+    
+    else:
+        print(f"▶️  Replay {sys.argv[2]}...")
+        result = replay_session(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"   {result['iterations']} vòng lặp trong {result['seconds']:.2f}s")
+        for stage, ms in result['replay_ms'].items():
+            recorded = result['recorded_ms'].get(stage)
+            recorded = f" (lúc ghi {recorded:.1f}ms)" if recorded is not None else ""
+            print(f"   {stage}: {ms:.1f}ms{recorded}")
+        for i, recorded_board, board in result['board_mismatches']:
+            print(f"   ❌ #{i}: board khác - ghi {recorded_board} | replay {board}")
+        for i, recorded_move, move in result['move_mismatches']:
+            print(f"   ⚠️  #{i}: nước đi khác - ghi {recorded_move} | replay {move}")
+        if not result['board_mismatches'] and not result['move_mismatches']:
+            print("✅ Replay khớp hoàn toàn với phiên đã ghi")
@@ -0,0 +1,371 @@
+"""
+Module game giả lập (headless) - chạy toàn bộ vòng lặp bot không cần màn hình/bàn phím
+GameSimulator chơi game theo đúng luật của AISolver.move, SyntheticRenderer vẽ board
+từ templates đã lưu, SyntheticCapture/SyntheticInput thay cho mss/pyautogui.
+Dùng để benchmark throughput và độ trễ của cả bot trên CI:
+    
+    python synthetic_game.py [số nước đi] [ai_model] [độ sâu]
+"""
+
+import random
+import sys
+import time
+import numpy as np
+import cv2
+from config import (GRID_SIZE, SETTLE_DOWNSAMPLE, SYNTHETIC_DROP_RATE, SYNTHETIC_RESPONSE_TIME,
+                    SYNTHETIC_ANIMATION_TIME)
+from log import get_logger
+from frame import Frame
+from screen_capture import ScreenCapture
+
+logger = get_logger(__name__)
+
+# Màu nền lưới/khe hở và ô trống (BGR) - ô trống đồng nhất, tối như nền của template
+SYNTHETIC_GAP_COLOR = (160, 173, 187)
+SYNTHETIC_EMPTY_COLOR = (38, 42, 29)
+
+
+class GameSimulator:
+    """
+    Game 2048 giả lập: luật ghép từ AISolver.move, spawn ô giá trị spawn_value
+    """
+    
+    def __init__(self, grid_size=GRID_SIZE, spawn_value=1, seed=None):
+        """
+        Args:
+            grid_size (int): Kích thước lưới
+            spawn_value (int): Giá trị ô mới spawn sau mỗi nước đi
+            seed (int): Seed (để tái lập ván chơi)
+        """
+        from ai_solver import AISolver
+        
+        self.grid_size = grid_size
+        self.spawn_value = spawn_value
+        self.random = random.Random(seed)
+        self.rules = AISolver(search_depth=1, spawn_value=spawn_value)
+        self.board = None
+        self.previous_board = None  # Board trước nước đi gần nhất (cho animation)
+        self.moved_at = 0.0         # Thời điểm (perf_counter) của nước đi gần nhất
+        self.last_direction = None
+        self.moves = 0
+        self.invalid_moves = 0
+        self.reset()
+    
+    def reset(self):
+        """
+        Ván mới: board trống với 2 ô spawn
+        """
+        self.board = [[0] * self.grid_size for _ in range(self.grid_size)]
+        self.moves = 0
+        self.invalid_moves = 0
+        self._spawn()
+        self._spawn()
+    
+    def _spawn(self):
+        empty = self.rules.get_empty_cells(self.board)
+        if empty:
+            row, col = self.random.choice(empty)
+            self.board[row][col] = self.spawn_value
+    
+    def apply(self, direction):
+        """
+        Thực hiện nước đi (spawn ô mới nếu board thay đổi)
+        
+        Returns:
+            bool: True nếu nước đi hợp lệ
+        """
+        new_board = self.rules.move(self.board, direction)
+        if new_board == self.board:
+            self.invalid_moves += 1
+            return False
+        self.previous_board = self.board
+        self.moved_at = time.perf_counter()
+        self.last_direction = direction
+        self.board = new_board
+        self._spawn()
+        self.moves += 1
+        return True
+    
+    def is_game_over(self):
+        return self.rules.is_terminal(self.board)
+    
+    def get_board(self):
+        return [row[:] for row in self.board]
+
+
+class SyntheticRenderer:
+    """
+    Vẽ ảnh lưới game từ templates (mỗi ô là một mẫu trong TemplateStore)
+    Giá trị chưa có mẫu được vẽ bằng màu + chữ số
+    """
+    
+    def __init__(self, grid_size=GRID_SIZE, cell_size=100, gap=12, store=None, seed=None):
+        """
+        Args:
+            grid_size (int): Kích thước lưới
+            cell_size (int): Cạnh mỗi ô (pixel)
+            gap (int): Khe hở giữa các ô (pixel)
+            store (TemplateStore): Kho templates (None = templates/)
+            seed (int): Seed chọn mẫu khi một giá trị có nhiều mẫu
+        """
+        if store is None:
+            from template_store import TemplateStore
+            store = TemplateStore("templates")
+        
+        self.grid_size = grid_size
+        self.cell_size = cell_size
+        self.gap = gap
+        self.random = random.Random(seed)
+        
+        side = grid_size * cell_size + (grid_size + 1) * gap
+        self.shape = (side, side, 4)
+        self.background = np.empty(self.shape, dtype=np.uint8)
+        self.background[:] = SYNTHETIC_GAP_COLOR + (255,)
+        
+        # Ô đã resize sẵn (BGRA) - vẽ một frame chỉ là 16 lần copy
+        self.tiles = {0: [self._solid_tile(SYNTHETIC_EMPTY_COLOR)]}
+        for value, exemplars in store.items():
+            self.tiles[value] = [self._to_tile(exemplar) for exemplar in exemplars]
+        
+        self.slots = [(gap + row * (cell_size + gap), gap + col * (cell_size + gap))
+                      for row in range(grid_size) for col in range(grid_size)]
+    
+    def _solid_tile(self, color):
+        tile = np.empty((self.cell_size, self.cell_size, 4), dtype=np.uint8)
+        tile[:] = tuple(color) + (255,)
+        return tile
+    
+    def _to_tile(self, exemplar):
+        tile = cv2.resize(np.asarray(exemplar), (self.cell_size, self.cell_size), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(tile, cv2.COLOR_BGR2BGRA)
+    
+    def _fallback_tile(self, value):
+        """
+        Ô cho giá trị chưa có template: màu theo giá trị + chữ số
+        """
+        hue = (value * 23) % 180
+        color = cv2.cvtColor(np.uint8([[[hue, 160, 200]]]), cv2.COLOR_HSV2BGR)[0, 0].tolist()
+        tile = self._solid_tile(color)
+        cv2.putText(tile, str(value), (self.cell_size // 4, self.cell_size * 2 // 3),
+                    cv2.FONT_HERSHEY_SIMPLEX, self.cell_size / 50, (255, 255, 255, 255), 3)
+        return tile
+    
+    def render(self, board, out=None):
+        """
+        Vẽ board
+        
+        Args:
+            board (list): Board grid_size x grid_size
+            out (numpy.ndarray): Buffer để vẽ vào (None = cấp mới)
+        
+        Returns:
+            numpy.ndarray: Ảnh BGRA
+        """
+        img = self.background.copy() if out is None else out
+        if out is not None:
+            np.copyto(img, self.background)
+        size = self.cell_size
+        for (y, x), value in zip(self.slots, (value for row in board for value in row)):
+            variants = self.tiles.get(value)
+            if variants is None:
+                variants = self.tiles[value] = [self._fallback_tile(value)]
+            tile = variants[0] if len(variants) == 1 else self.random.choice(variants)
+            img[y:y + size, x:x + size] = tile
+        return img
+
+
+class SyntheticCapture(ScreenCapture):
+    """
+    Capture backend vẽ board hiện tại của GameSimulator (không dùng mss)
+    Mặc định không có animation: màn hình ổn định ngay sau mỗi nước đi.
+    response_time/animation_time > 0: giữ board cũ, trượt board cũ theo hướng đi rồi hiện board mới như game thật
+    """
+    
+    def __init__(self, simulator, renderer=None, region=None,
+                 response_time=SYNTHETIC_RESPONSE_TIME, animation_time=SYNTHETIC_ANIMATION_TIME):
+        """
+        Args:
+            simulator (GameSimulator): Game giả lập
+            renderer (SyntheticRenderer): Renderer (None = tạo từ templates/)
+            region (dict): Vùng chụp trên ảnh vẽ (None = cả lưới)
+            response_time (float): Thời gian từ lúc nhận phím đến khi màn hình bắt đầu đổi (giây)
+            animation_time (float): Thời gian chuyển từ board cũ sang board mới (giây)
+        """
+        self.simulator = simulator
+        self.response_time = response_time
+        self.animation_time = animation_time
+        self.renderer = renderer or SyntheticRenderer(simulator.grid_size)
+        height, width = self.renderer.shape[:2]
+        self.region = region or {'top': 0, 'left': 0, 'width': width, 'height': height}
+        self.sct = None
+        self.frames = 0
+    
+    def _grab(self):
+        """
+        Vẽ board hiện tại và cắt theo vùng chụp (tọa độ trên ảnh vẽ)
+        """
+        simulator = self.simulator
+        raw = self.renderer.render(simulator.board)
+        elapsed = time.perf_counter() - simulator.moved_at
+        if simulator.previous_board is not None and elapsed < self.response_time + self.animation_time:
+            raw = self.renderer.render(simulator.previous_board)
+            if elapsed >= self.response_time:
+                # Ô trượt tối đa 1 ô theo hướng đi
+                shift = int((elapsed - self.response_time) / self.animation_time * self.renderer.cell_size)
+                dy, dx = {'UP': (-shift, 0), 'DOWN': (shift, 0),
+                          'LEFT': (0, -shift), 'RIGHT': (0, shift)}[simulator.last_direction]
+                raw = np.roll(raw, (dy, dx), axis=(0, 1))
+        region = self.region
+        return raw[region['top']:region['top'] + region['height'], region['left']:region['left'] + region['width']]
+    
+    def capture_frame(self):
+        start = time.perf_counter()
+        raw = self._grab()
+        self.frames += 1
+        return Frame(raw, capture_time=time.perf_counter() - start)
+    
+    def capture(self):
+        return self.capture_frame().bgr
+    
+    def snapshot(self, downsample=SETTLE_DOWNSAMPLE):
+        return self._grab()[::downsample, ::downsample, :3].astype(np.int16)
+    
+    def wait_until_settled(self, reference=None, **kwargs):
+        if self.response_time or self.animation_time:
+            return super().wait_until_settled(reference, **kwargs)
+        self.last_response_time = 0.0
+        return True, 0.0
+    
+    def update_region(self, new_region):
+        self.region = new_region
+
+
+class SyntheticInput:
+    """
+    Input backend gửi nước đi thẳng vào GameSimulator (không dùng bàn phím)
+    drop_rate > 0: bỏ ngẫu nhiên một phần phím như game thật bỏ lỡ phím
+    """
+    
+    name = 'synthetic'
+    
+    def __init__(self, simulator, drop_rate=SYNTHETIC_DROP_RATE, seed=None):
+        self.simulator = simulator
+        self.drop_rate = drop_rate
+        self.dropped = 0
+        self.random = random.Random(seed)
+    
+    def press(self, key):
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        self.simulator.apply(key.upper())
+    
+    def click(self, x, y):
+        pass
+    
+    def size(self):
+        return self.simulator.grid_size, self.simulator.grid_size
+    
+    def position(self):
+        return 0, 0
+
+
+def run_closed_loop(moves=1000, ai_model='template', search_depth=2, seed=0, restart=True):
+    """
+    Chạy cả vòng lặp bot trên game giả lập: render -> chia ô -> nhận diện -> solver -> input
+    
+    Args:
+        moves (int): Số nước đi
+        ai_model (str): Backend nhận diện
+        search_depth (int): Độ sâu solver (cố định)
+        seed (int): Seed của game giả lập
+        restart (bool): Chơi ván mới khi game over
+    
+    Returns:
+        dict: frames, fps, p50/p95 từng bước (ms), số board nhận diện sai, số ván, ô lớn nhất
+    """
+    from ai_solver import AISolver
+    from game_controller import GameController
+    from game_state import GameState
+    from grid_detector import GridTracker
+    
+    simulator = GameSimulator(seed=seed)
+    capture = SyntheticCapture(simulator)
+    controller = GameController(move_delay=0.0, key_pause=0.0, input_backend=SyntheticInput(simulator))
+    tracker = GridTracker(capture, simulator.grid_size, capture_margin=None, cache_file=None,
+                          search_screen=False)
+    game_state = GameState(simulator.grid_size, ai_model=ai_model)
+    ai_solver = AISolver(search_depth)
+    
+    stages = {'capture': [], 'split': [], 'recognize': [], 'solve': [], 'input': [], 'total': []}
+    misreads = 0
+    games = 1
+    max_tile = 0
+    start = time.perf_counter()
+    
+    for _ in range(moves):
+        frame_start = time.perf_counter()
+        frame = capture.capture_frame()
+        stages['capture'].append(frame.timings['capture'])
+        
+        t = time.perf_counter()
+        grid = tracker.cells(frame.raw) or frame.cells(simulator.grid_size)
+        stages['split'].append(time.perf_counter() - t)
+        
+        t = time.perf_counter()
+        board = game_state.update_from_grid(grid, full_image=frame.raw)
+        stages['recognize'].append(time.perf_counter() - t)
+        if board != simulator.board:
+            misreads += 1
+        
+        t = time.perf_counter()
+        move = ai_solver.get_best_move(board) if board is not None else None
+        stages['solve'].append(time.perf_counter() - t)
+        
+        t = time.perf_counter()
+        if move is None or not controller.send_move(move):
+            game_state.set_predicted_board(None)
+        else:
+            game_state.set_predicted_board(ai_solver.move(board, move))
+        stages['input'].append(time.perf_counter() - t)
+        stages['total'].append(time.perf_counter() - frame_start)
+        
+        max_tile = max(max_tile, max(max(row) for row in simulator.board))
+        if simulator.is_game_over():
+            if not restart:
+                break
+            simulator.reset()
+            game_state.set_predicted_board(None)
+            games += 1
+    
+    elapsed = time.perf_counter() - start
+    frames = len(stages['total'])
+    
+    def percentile(values, p):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000 if ordered else 0.0
+    
+    return {
+        'frames': frames,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'stages': {name: {'p50_ms': percentile(values, 50), 'p95_ms': percentile(values, 95)}
+                   for name, values in stages.items()},
+        'misreads': misreads,
+        'games': games,
+        'max_tile': max_tile,
+    }
+
+
+# Benchmark vòng lặp kín (nên đặt LOG_LEVEL = 'INFO' để không đo thời gian ghi log debug)
+if __name__ == "__main__":
+    moves = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ai_model = sys.argv[2] if len(sys.argv) > 2 else 'template'
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    
+    print(f"🧪 Vòng lặp kín trên game giả lập: {moves} nước, {ai_model}, độ sâu {depth}...")
+    result = run_closed_loop(moves, ai_model, depth)
+    print(f"   {result['frames']} frame | {result['fps']:.0f} frame/s | "
+          f"{result['games']} ván | ô lớn nhất {result['max_tile']} | nhận diện sai {result['misreads']} frame")
+    for name, stage in result['stages'].items():
+        print(f"   {name}: p50 {stage['p50_ms']:.2f}ms | p95 {stage['p95_ms']:.2f}ms")
+    logger.debug("💡 Đặt LOG_LEVEL = 'INFO' trong config.py để đo chính xác hơn")
@@ -3,11 +3,14 @@ Module nhận diện số bằng Template Matching
 Phù hợp cho icon/hình ảnh đá quý trong game
 """
 
+import logging
 import cv2
 import numpy as np
-from pathlib import Path
-import pickle
-from config import DEBUG_MODE
+from config import TEMPLATE_CONFIDENCE_MARGIN
+from log import get_logger
+from template_store import TemplateStore
+
+logger = get_logger(__name__)
 
 
 class TemplateRecognizer:
@@ -20,16 +23,11 @@ class TemplateRecognizer:
         """
         Khởi tạo Template Recognizer
         """
-        self.templates = {}  # {number: template_image}
-        self.templates_dir = Path("templates")
-        self.templates_dir.mkdir(exist_ok=True)
-        
-        # Load templates đã lưu
-        self.load_templates()
+        # Kho templates: nhiều mẫu cho mỗi số, load 1 lần (memory-mapped)
+        self.templates = TemplateStore("templates")  # {number: [exemplar, ...]}
         
         self.enabled = True
-        if DEBUG_MODE:
-            print(f"✅ TemplateRecognizer đã sẵn sàng ({len(self.templates)} templates)")
+        logger.debug("✅ TemplateRecognizer đã sẵn sàng (%s templates)", len(self.templates))
     
     def recognize_number(self, cell_img):
         """
@@ -41,52 +39,87 @@ class TemplateRecognizer:
         Returns:
             int: Số nhận diện được (0 nếu ô trống hoặc lỗi)
         """
+        return self.recognize_cell_with_confidence(cell_img)[0]
+    
+    def recognize_cell_with_confidence(self, cell_img):
+        """
+        Nhận diện số từ một ô kèm độ tin cậy
+        
+        Độ tin cậy = điểm khớp tốt nhất x khoảng cách với số tốt thứ hai
+        (khớp cao nhưng sát số khác, vd. 2 và 3 cùng màu, vẫn là ô mơ hồ)
+        
+        Args:
+            cell_img: Ảnh ô game (numpy array)
+            
+        Returns:
+            tuple: (số nhận diện được, độ tin cậy 0-1); (0, 0.0) nếu không nhận diện được
+        """
         if not self.enabled:
-            return 0
+            return 0, 0.0
         
         if cell_img is None or cell_img.size == 0:
-            return 0
+            return 0, 0.0
         
         # Kiểm tra ô trống
-        if self._is_empty_cell(cell_img):
-            return 0
+        empty_confidence = self._empty_confidence(cell_img)
+        if empty_confidence is not None:
+            return 0, empty_confidence
         
         # Nếu chưa có template, không thể nhận diện
         if not self.templates:
-            if DEBUG_MODE:
-                print("   ⚠️  Chưa có templates! Hãy chạy calibration (option 1)")
-            return 0
+            logger.debug("   ⚠️  Chưa có templates! Hãy chạy calibration (option 1)")
+            return 0, 0.0
         
         try:
             # Tiền xử lý ảnh
             processed = self._preprocess_cell(cell_img)
             
-            best_match = 0
-            best_score = 0
+            # Điểm tốt nhất của từng số (qua tất cả mẫu của số đó)
+            scores = {}
+            for number, exemplars in self.templates.items():
+                scores[number] = max(self._match_template(processed, template) for template in exemplars)
             
-            # So khớp với từng template
-            for number, template in self.templates.items():
-                score = self._match_template(processed, template)
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = number
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            best_match, best_score = ranked[0]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
             
             # Ngưỡng tin cậy (60%)
             if best_score > 0.6:
-                if DEBUG_MODE:
-                    print(f"   🎯 Template: {best_match} (score: {best_score:.2f})")
-                return best_match
+                margin = min(1.0, max(0.0, (best_score - runner_up) / TEMPLATE_CONFIDENCE_MARGIN))
+                confidence = min(1.0, float(best_score)) * margin
+                logger.debug("   🎯 Template: %s (score: %.2f, confidence: %.2f)",
+                             best_match, best_score, confidence)
+                return best_match, confidence
             else:
-                if DEBUG_MODE:
-                    print(f"   ⚠️  Low confidence: {best_score:.2f}")
+                logger.debug("   ⚠️  Low confidence: %.2f", best_score)
             
-            return 0
+            return 0, 0.0
             
         except Exception as e:
-            if DEBUG_MODE:
-                print(f"   ❌ Lỗi Template Matching: {e}")
-            return 0
+            logger.debug("   ❌ Lỗi Template Matching: %s", e)
+            return 0, 0.0
+    
+    def recognize_cells_with_confidence(self, cells):
+        """
+        Nhận diện danh sách ô bất kỳ (vd. chỉ các ô mơ hồ trong cascade)
+        
+        Returns:
+            list: [(số, độ tin cậy), ...] theo thứ tự cells
+        """
+        return [self.recognize_cell_with_confidence(cell_img) for cell_img in cells]
+    
+    def _empty_confidence(self, cell_img):
+        """
+        Độ tin cậy ô trống (ô càng đồng nhất càng chắc chắn trống)
+        
+        Returns:
+            float: Độ tin cậy 0.5-1, None nếu ô không trống
+        """
+        if not self._is_empty_cell(cell_img):
+            return None
+        if cell_img.ndim == 3 and cell_img.shape[2] == 4:
+            cell_img = cell_img[:, :, :3]
+        return 1.0 - float(np.std(cell_img)) / 30.0
     
     def _is_empty_cell(self, cell_img):
         """
@@ -98,6 +131,10 @@ class TemplateRecognizer:
         Returns:
             bool: True nếu ô trống
         """
+        # Bỏ kênh alpha nếu ô là view BGRA (alpha luôn 255 làm lệch mean/std)
+        if cell_img.ndim == 3 and cell_img.shape[2] == 4:
+            cell_img = cell_img[:, :, :3]
+        
         std = np.std(cell_img)
         mean = np.mean(cell_img)
         
@@ -118,7 +155,9 @@ class TemplateRecognizer:
         if len(cell_img.shape) == 2:
             processed = cv2.cvtColor(cell_img, cv2.COLOR_GRAY2BGR)
         elif len(cell_img.shape) == 3 and cell_img.shape[2] == 4:
-            processed = cv2.cvtColor(cell_img, cv2.COLOR_RGBA2BGR)
+            # View BGRA từ frame zero-copy - resize trước, bỏ alpha sau (ít pixel hơn)
+            resized = cv2.resize(cell_img, (100, 100), interpolation=cv2.INTER_AREA)
+            return cv2.cvtColor(resized, cv2.COLOR_BGRA2BGR)
         else:
             processed = cell_img.copy()
         
@@ -178,52 +217,40 @@ class TemplateRecognizer:
     
     def save_template(self, number, cell_img):
         """
-        Lưu template cho một số
+        Thêm một mẫu cho một số (trùng thì bỏ qua, ghi file bất đồng bộ theo lô)
         
         Args:
             number: Số cần lưu (1-11, 11 là max của game)
             cell_img: Ảnh mẫu
+            
+        Returns:
+            bool: True nếu mẫu mới được thêm vào kho
         """
         if number < 1 or number > 11:
-            return
+            return False
         
         try:
             # Tiền xử lý
             processed = self._preprocess_cell(cell_img)
             
-            # Lưu vào memory
-            self.templates[number] = processed
+            added = self.templates.add(number, processed)
             
-            # Lưu ra file
-            template_file = self.templates_dir / f"template_{number}.pkl"
-            with open(template_file, 'wb') as f:
-                pickle.dump(processed, f)
+            if added:
+                logger.debug("   💾 Đã thêm mẫu cho số %s (%d mẫu)", number, len(self.templates.get(number)))
+            else:
+                logger.debug("   ⏭️  Mẫu số %s trùng với mẫu đã có", number)
             
-            if DEBUG_MODE:
-                print(f"   💾 Đã lưu template cho số {number}")
+            return added
             
         except Exception as e:
-            if DEBUG_MODE:
-                print(f"   ❌ Lỗi lưu template: {e}")
+            logger.debug("   ❌ Lỗi lưu template: %s", e)
+            return False
     
-    def load_templates(self):
+    def flush_templates(self):
         """
-        Load templates đã lưu từ file
+        Ghi ngay các mẫu đang chờ ra đĩa (bình thường thread nền tự ghi)
         """
-        try:
-            for template_file in self.templates_dir.glob("template_*.pkl"):
-                number = int(template_file.stem.split('_')[1])
-                
-                with open(template_file, 'rb') as f:
-                    template = pickle.load(f)
-                    self.templates[number] = template
-            
-            if DEBUG_MODE and self.templates:
-                print(f"📚 Đã load {len(self.templates)} templates")
-                
-        except Exception as e:
-            if DEBUG_MODE:
-                print(f"⚠️  Lỗi load templates: {e}")
+        self.templates.flush()
     
     def recognize_board(self, grid_cells):
         """
@@ -235,26 +262,30 @@ class TemplateRecognizer:
         Returns:
             list: Ma trận 4x4 các số nhận diện được
         """
+        return self.recognize_board_with_confidence(grid_cells)[0]
+    
+    def recognize_board_with_confidence(self, grid_cells):
+        """
+        Nhận diện toàn bộ bảng kèm độ tin cậy từng ô
+        
+        Args:
+            grid_cells: List 16 ô (4x4) đã tách từ grid
+            
+        Returns:
+            tuple: (ma trận 4x4 các số, ma trận 4x4 độ tin cậy 0-1)
+        """
         if len(grid_cells) != 16:
-            if DEBUG_MODE:
-                print(f"⚠️  Số ô không đúng: {len(grid_cells)}, cần 16 ô")
-            return [[0]*4 for _ in range(4)]
-        
-        board = []
-        for i in range(4):
-            row = []
-            for j in range(4):
-                cell_idx = i * 4 + j
-                number = self.recognize_number(grid_cells[cell_idx])
-                row.append(number)
-            board.append(row)
-        
-        if DEBUG_MODE:
-            print("\n📊 Board nhận diện được (Template Matching):")
-            for row in board:
-                print(f"   {row}")
-        
-        return board
+            logger.debug("⚠️  Số ô không đúng: %s, cần 16 ô", len(grid_cells))
+            return [[0]*4 for _ in range(4)], [[0.0]*4 for _ in range(4)]
+        
+        results = self.recognize_cells_with_confidence(grid_cells)
+        board = [[results[i * 4 + j][0] for j in range(4)] for i in range(4)]
+        confidences = [[results[i * 4 + j][1] for j in range(4)] for i in range(4)]
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📊 Board nhận diện được (Template Matching):\n%s", "\n".join(f"   {row}" for row in board))
+        
+        return board, confidences
 
 
 if __name__ == "__main__":
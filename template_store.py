@@ -0,0 +1,271 @@
+"""
+Module lưu trữ templates
+Một bundle duy nhất (.npy memory-mapped + index .json) chứa nhiều mẫu (exemplar)
+cho mỗi giá trị, loại bỏ mẫu trùng lặp, giới hạn số mẫu và ghi file bất đồng bộ
+"""
+
+import atexit
+import json
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from config import TEMPLATE_MAX_PER_VALUE, TEMPLATE_DEDUP_THRESHOLD, TEMPLATE_FLUSH_INTERVAL
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+STORE_VERSION = 1
+TEMPLATE_SHAPE = (100, 100, 3)
+
+
+class TemplateStore:
+    """
+    Kho templates: {giá trị: [exemplar, ...]}
+    
+    Trên đĩa:
+        templates/store_v1.npy  - mảng (N, 100, 100, 3) uint8, load bằng mmap (1 lần đọc)
+        templates/store_v1.json - index: version, shape, giá trị và thời điểm thêm của từng mẫu
+    Chỉ ghi file khi kho thật sự thay đổi (add) - chỉ đọc kho không tạo file nào
+    """
+    
+    def __init__(self, directory="templates", max_per_value=TEMPLATE_MAX_PER_VALUE,
+                 dedup_threshold=TEMPLATE_DEDUP_THRESHOLD, flush_interval=TEMPLATE_FLUSH_INTERVAL):
+        """
+        Khởi tạo kho templates
+        
+        Args:
+            directory (str): Thư mục chứa bundle
+            max_per_value (int): Số mẫu tối đa cho mỗi giá trị
+            dedup_threshold (float): Sai khác trung bình (0-255) dưới ngưỡng này coi là trùng
+            flush_interval (float): Gom các thay đổi và ghi file sau N giây
+        """
+        self.directory = Path(directory)
+        self.data_file = self.directory / f"store_v{STORE_VERSION}.npy"
+        self.index_file = self.directory / f"store_v{STORE_VERSION}.json"
+        
+        self.max_per_value = max_per_value
+        self.dedup_threshold = dedup_threshold
+        self.flush_interval = flush_interval
+        
+        self.exemplars = {}  # {value: [numpy.ndarray]}
+        self.added_at = {}   # {value: [timestamp]}
+        self.generation = 0  # Tăng mỗi lần kho thay đổi
+        
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Chỉ một lần ghi file tại một thời điểm (thread ghi / atexit)
+        self._dirty = threading.Event()
+        self._writer = None
+        self._closed = False
+        
+        self.load()
+        atexit.register(self.close)
+    
+    def load(self):
+        """
+        Load bundle (memory-mapped) hoặc chuyển đổi từ các file template_*.pkl cũ
+        """
+        try:
+            if self.data_file.exists() and self.index_file.exists():
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                
+                if index.get('version') != STORE_VERSION:
+                    raise ValueError(f"Phiên bản store không hỗ trợ: {index.get('version')}")
+                
+                data = np.load(self.data_file, mmap_mode='r')
+                for i, value in enumerate(index['values']):
+                    self.exemplars.setdefault(value, []).append(data[i])
+                    self.added_at.setdefault(value, []).append(index['added'][i])
+                
+                logger.debug("📚 Đã load template store: %s mẫu / %s giá trị", len(data), len(self.exemplars))
+            else:
+                self._import_legacy()
+            
+            self.generation += 1
+        
+        except Exception as e:
+            logger.debug("⚠️  Lỗi load template store: %s", e)
+    
+    def _import_legacy(self):
+        """
+        Đọc các file template_{n}.pkl (1 mẫu/giá trị) vào store - bundle chỉ được ghi
+        (gồm cả các mẫu này) ở lần kho thay đổi đầu tiên
+        """
+        legacy_files = sorted(self.directory.glob("template_*.pkl"))
+        for template_file in legacy_files:
+            number = int(template_file.stem.split('_')[1])
+            with open(template_file, 'rb') as f:
+                template = pickle.load(f)
+            self.exemplars.setdefault(number, []).append(np.ascontiguousarray(template))
+            self.added_at.setdefault(number, []).append(template_file.stat().st_mtime)
+        
+        if legacy_files:
+            logger.debug("📦 Đã đọc %s template .pkl vào store", len(legacy_files))
+    
+    def values(self):
+        """
+        Các giá trị đã có mẫu
+        """
+        return sorted(self.exemplars)
+    
+    def get(self, value):
+        """
+        Lấy danh sách mẫu của một giá trị
+        
+        Returns:
+            list: Các ảnh mẫu (100x100x3)
+        """
+        return self.exemplars.get(value, [])
+    
+    def items(self):
+        """
+        Duyệt (giá trị, danh sách mẫu)
+        """
+        return self.exemplars.items()
+    
+    def __len__(self):
+        return sum(len(exemplars) for exemplars in self.exemplars.values())
+    
+    def add(self, value, exemplar):
+        """
+        Thêm một mẫu cho giá trị (bỏ qua nếu trùng, loại bớt nếu vượt giới hạn)
+        
+        Args:
+            value (int): Giá trị ô
+            exemplar (numpy.ndarray): Ảnh mẫu đã tiền xử lý (100x100x3)
+        
+        Returns:
+            bool: True nếu mẫu được thêm vào kho
+        """
+        exemplar = np.ascontiguousarray(exemplar, dtype=np.uint8)
+        if exemplar.shape != TEMPLATE_SHAPE:
+            return False
+        
+        with self._lock:
+            current = self.exemplars.setdefault(value, [])
+            times = self.added_at.setdefault(value, [])
+            
+            # Loại bỏ mẫu gần như giống hệt mẫu đã có
+            sample = exemplar.astype(np.int16)
+            for existing in current:
+                if np.mean(np.abs(sample - existing)) < self.dedup_threshold:
+                    return False
+            
+            current.append(exemplar)
+            times.append(time.time())
+            
+            if len(current) > self.max_per_value:
+                self._evict(value)
+            
+            self.generation += 1
+        
+        self._schedule_flush()
+        return True
+    
+    def _evict(self, value):
+        """
+        Loại mẫu dư thừa nhất (gần mẫu khác nhất) để giữ đa dạng trong giới hạn
+        """
+        current = self.exemplars[value]
+        flat = np.stack([e.reshape(-1) for e in current]).astype(np.float32)
+        # Khoảng cách trung bình giữa từng cặp mẫu
+        distances = np.array([[np.mean(np.abs(a - b)) for b in flat] for a in flat])
+        np.fill_diagonal(distances, np.inf)
+        # Không loại mẫu vừa thêm (cuối danh sách)
+        nearest = distances.min(axis=1)[:-1]
+        victim = int(np.argmin(nearest))
+        
+        del current[victim]
+        del self.added_at[value][victim]
+    
+    def _schedule_flush(self):
+        """
+        Đánh dấu có thay đổi - thread nền sẽ gom lại và ghi sau flush_interval
+        """
+        if self._closed:
+            return
+        self._dirty.set()
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, name="template-store-writer",
+                                            daemon=True)
+            self._writer.start()
+    
+    def _writer_loop(self):
+        """
+        Thread ghi file: gom các lần thêm mẫu trong flush_interval thành một lần ghi
+        """
+        while not self._closed:
+            self._dirty.wait()
+            if self._closed:
+                break
+            time.sleep(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        """
+        Ghi bundle ra đĩa ngay (atomic: ghi file tạm rồi đổi tên)
+        """
+        with self._flush_lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        with self._lock:
+            if not self._dirty.is_set():
+                return
+            self._dirty.clear()
+            
+            values = []
+            added = []
+            arrays = []
+            for value in sorted(self.exemplars):
+                for exemplar, timestamp in zip(self.exemplars[value], self.added_at[value]):
+                    values.append(int(value))
+                    added.append(float(timestamp))
+                    arrays.append(exemplar)
+            
+            data = np.stack(arrays) if arrays else np.empty((0,) + TEMPLATE_SHAPE, dtype=np.uint8)
+        
+        try:
+            self.directory.mkdir(exist_ok=True)
+            tmp_data = self.data_file.with_name(self.data_file.stem + ".tmp.npy")
+            tmp_index = self.index_file.with_suffix(".json.tmp")
+            np.save(tmp_data, data)
+            with open(tmp_index, 'w') as f:
+                json.dump({'version': STORE_VERSION, 'shape': list(TEMPLATE_SHAPE),
+                           'values': values, 'added': added}, f)
+            
+            os.replace(tmp_data, self.data_file)
+            os.replace(tmp_index, self.index_file)
+            
+            logger.debug("💾 Đã ghi template store: %s mẫu", len(values))
+        
+        except Exception as e:
+            logger.error("❌ Lỗi ghi template store: %s", e)
+    
+    def close(self):
+        """
+        Ghi nốt thay đổi còn lại và dừng thread ghi
+        """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._dirty.set()
+        if self._writer is not None:
+            self._writer.join(timeout=self.flush_interval + 5.0)
+
+
+# Hàm tiện ích để test module
+if __name__ == "__main__":
+    print("🧪 Testing TemplateStore module...")
+    
+    store = TemplateStore()
+    for value in store.values():
+        print(f"   Số {value}: {len(store.get(value))} mẫu")
+    print(f"📚 Tổng: {len(store)} mẫu")
+    
+    print("✅ Test hoàn thành!")
@@ -0,0 +1,356 @@
+"""
+Module classifier nhỏ (pure NumPy) cho giá trị ô
+Softmax regression trên đặc trưng ảnh xám thu nhỏ + màu trung bình theo vùng.
+Train từ template store (gồm cả mẫu auto-learn) và corpus có nhãn;
+nhận diện cả board = 1 phép nhân ma trận (16 x D) @ (D x K)
+"""
+
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import cv2
+from config import CLASSIFIER_FILE, CLASSIFIER_AUGMENT, CLASSIFIER_HOLDOUT
+from log import get_logger
+
+FEATURE_SIZE = 12   # Ảnh xám thu nhỏ 12x12
+COLOR_GRID = 4      # Màu trung bình trên lưới 4x4 vùng
+
+logger = get_logger(__name__)
+
+
+def extract_features(cells):
+    """
+    Tính vector đặc trưng cho nhiều ô
+    
+    Args:
+        cells (list): Ảnh ô BGR/BGRA (kích thước bất kỳ)
+    
+    Returns:
+        numpy.ndarray: Mảng (N, D) float32, giá trị 0-1
+    """
+    small = np.empty((len(cells), FEATURE_SIZE, FEATURE_SIZE, 3), dtype=np.uint8)
+    for i, cell_img in enumerate(cells):
+        # Cắt giữa ô về bội số của FEATURE_SIZE: INTER_AREA với hệ số nguyên nhanh hơn ~3 lần
+        height, width = cell_img.shape[:2]
+        crop_h = (height // FEATURE_SIZE) * FEATURE_SIZE or height
+        crop_w = (width // FEATURE_SIZE) * FEATURE_SIZE or width
+        top, left = (height - crop_h) // 2, (width - crop_w) // 2
+        cell_img = cell_img[top:top + crop_h, left:left + crop_w]
+        resized = cv2.resize(cell_img, (FEATURE_SIZE, FEATURE_SIZE), interpolation=cv2.INTER_AREA)
+        if resized.ndim == 2:
+            resized = resized[:, :, None]
+        small[i] = resized[:, :, :3]  # Bỏ alpha (ô BGRA); ảnh xám được lặp ra 3 kênh
+    
+    # Tính cho tất cả ô cùng lúc: xám theo trọng số BT.601 (B, G, R) + màu trung bình theo vùng
+    small = small.astype(np.float32) * (1.0 / 255.0)
+    gray = small @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    step = FEATURE_SIZE // COLOR_GRID
+    color = small.reshape(len(cells), COLOR_GRID, step, COLOR_GRID, step, 3).mean(axis=(2, 4))
+    return np.concatenate([gray.reshape(len(cells), -1), color.reshape(len(cells), -1)], axis=1)
+
+
+def _augment(img, rng, count):
+    """
+    Tạo biến thể của một mẫu: dịch vài pixel, đổi độ sáng, thêm nhiễu
+    (template store chỉ có vài mẫu cho mỗi số)
+    """
+    variants = [img]
+    for _ in range(count):
+        shifted = np.roll(img, (rng.integers(-4, 5), rng.integers(-4, 5)), axis=(0, 1)).astype(np.float32)
+        shifted = shifted * rng.uniform(0.85, 1.15) + rng.normal(0, 6, shifted.shape)
+        variants.append(np.clip(shifted, 0, 255).astype(np.uint8))
+    return variants
+
+
+def collect_training_data(template_dir="templates", corpus_dir=None, augment=CLASSIFIER_AUGMENT, seed=0,
+                          holdout=CLASSIFIER_HOLDOUT):
+    """
+    Gom dữ liệu train từ template store và (tùy chọn) corpus có nhãn
+    
+    Args:
+        template_dir (str): Thư mục template store
+        corpus_dir (str): Thư mục corpus (frame_corpus) - cung cấp thêm ô trống (lớp 0)
+        augment (int): Số biến thể tạo thêm cho mỗi mẫu
+        seed (int): Seed cho augment
+        holdout (float): Tỉ lệ corpus giữ lại cho evaluate (không đưa vào train)
+    
+    Returns:
+        tuple: (cells, labels)
+    """
+    from template_store import TemplateStore
+    
+    rng = np.random.default_rng(seed)
+    cells, labels = [], []
+    
+    store = TemplateStore(template_dir)
+    for value, exemplars in store.items():
+        for exemplar in exemplars:
+            for variant in _augment(np.asarray(exemplar), rng, augment):
+                cells.append(variant)
+                labels.append(value)
+    
+    if corpus_dir:
+        from frame_corpus import load_corpus, split_corpus, split_cells
+        train, _ = split_corpus(load_corpus(corpus_dir), holdout)
+        for _, img, board in train:
+            cells.extend(split_cells(img, len(board)))
+            labels.extend(value for row in board for value in row)
+    
+    return cells, np.array(labels, dtype=np.int64)
+
+
+class TinyClassifier:
+    """
+    Softmax regression: xác suất = softmax(chuẩn hóa(đặc trưng) @ W + b)
+    """
+    
+    def __init__(self):
+        """
+        Khởi tạo model rỗng (gọi fit() hoặc load())
+        """
+        self.classes = None   # Mảng giá trị ô tương ứng từng cột của W
+        self.mean = None
+        self.std = None
+        self.weights = None   # (D, K)
+        self.bias = None      # (K,)
+    
+    def fit(self, features, labels, epochs=400, learning_rate=0.5, l2=1e-3):
+        """
+        Train bằng gradient descent toàn batch (dữ liệu nhỏ, vài trăm mẫu)
+        
+        Args:
+            features (numpy.ndarray): (N, D)
+            labels (numpy.ndarray): (N,) giá trị ô
+            epochs (int): Số vòng lặp
+            learning_rate (float): Tốc độ học
+            l2 (float): Hệ số regularization
+        
+        Returns:
+            float: Độ chính xác trên dữ liệu train
+        """
+        self.classes = np.unique(labels)
+        targets = np.searchsorted(self.classes, labels)
+        onehot = np.eye(len(self.classes), dtype=np.float32)[targets]
+        
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0) + 1e-6
+        x = (features - self.mean) / self.std
+        
+        self.weights = np.zeros((x.shape[1], len(self.classes)), dtype=np.float32)
+        self.bias = np.zeros(len(self.classes), dtype=np.float32)
+        
+        for _ in range(epochs):
+            probs = self._softmax(x @ self.weights + self.bias)
+            grad = (probs - onehot) / len(x)
+            self.weights -= learning_rate * (x.T @ grad + l2 * self.weights)
+            self.bias -= learning_rate * grad.sum(axis=0)
+        
+        return float(np.mean(self.predict(features)[0] == labels))
+    
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+    
+    def predict(self, features):
+        """
+        Dự đoán cho nhiều ô (1 phép nhân ma trận)
+        
+        Returns:
+            tuple: (giá trị (N,), xác suất của giá trị đó (N,))
+        """
+        probs = self._softmax(((features - self.mean) / self.std) @ self.weights + self.bias)
+        best = probs.argmax(axis=1)
+        return self.classes[best], probs[np.arange(len(best)), best]
+    
+    def save(self, path=CLASSIFIER_FILE):
+        """
+        Lưu model ra file .npz
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, classes=self.classes, mean=self.mean, std=self.std,
+                 weights=self.weights, bias=self.bias)
+    
+    @classmethod
+    def load(cls, path=CLASSIFIER_FILE):
+        """
+        Load model từ file .npz
+        
+        Returns:
+            TinyClassifier: Model, hoặc None nếu chưa train
+        """
+        if not Path(path).exists():
+            return None
+        data = np.load(path)
+        model = cls()
+        model.classes = data['classes']
+        model.mean = data['mean']
+        model.std = data['std']
+        model.weights = data['weights']
+        model.bias = data['bias']
+        return model
+
+
+class TinyClassifierRecognizer:
+    """
+    Recognizer dùng TinyClassifier (cùng interface với TemplateRecognizer)
+    """
+    
+    def __init__(self, model_file=CLASSIFIER_FILE):
+        """
+        Load model đã train (chạy 'python tiny_classifier.py train' trước)
+        """
+        self.model = TinyClassifier.load(model_file)
+        self.enabled = self.model is not None
+        if self.enabled:
+            logger.debug("✅ TinyClassifier đã sẵn sàng (%d lớp)", len(self.model.classes))
+        else:
+            logger.debug("⚠️  Chưa có model TinyClassifier! Chạy: python tiny_classifier.py train")
+    
+    def _empty_mask(self, features):
+        """
+        Ô trống: ảnh xám gần như đồng nhất và rất tối/rất sáng (giống TemplateRecognizer)
+        
+        Returns:
+            tuple: (mask ô trống, độ tin cậy ô trống)
+        """
+        gray = features[:, :FEATURE_SIZE * FEATURE_SIZE] * 255.0
+        std = gray.std(axis=1)
+        mean = gray.mean(axis=1)
+        mask = (std < 15) & ((mean < 50) | (mean > 200))
+        return mask, 1.0 - std / 30.0
+    
+    def recognize_cells_with_confidence(self, cells):
+        """
+        Nhận diện danh sách ô
+        
+        Returns:
+            list: [(số, độ tin cậy), ...] theo thứ tự cells
+        """
+        if not self.enabled or not cells:
+            return [(0, 0.0)] * len(cells)
+        
+        features = extract_features(cells)
+        values, probs = self.model.predict(features)
+        empty, empty_confidence = self._empty_mask(features)
+        values = np.where(empty, 0, values)
+        probs = np.where(empty, empty_confidence, probs)
+        return [(int(value), float(prob)) for value, prob in zip(values, probs)]
+    
+    def recognize_cell_with_confidence(self, cell_img):
+        """
+        Nhận diện một ô kèm độ tin cậy (xác suất softmax)
+        """
+        if cell_img is None or cell_img.size == 0:
+            return 0, 0.0
+        return self.recognize_cells_with_confidence([cell_img])[0]
+    
+    def recognize_number(self, cell_img):
+        """
+        Nhận diện một ô
+        
+        Returns:
+            int: Số nhận diện được (0 nếu ô trống)
+        """
+        return self.recognize_cell_with_confidence(cell_img)[0]
+    
+    def recognize_board_with_confidence(self, grid_cells):
+        """
+        Nhận diện toàn bộ bảng kèm độ tin cậy từng ô
+        
+        Returns:
+            tuple: (ma trận 4x4 các số, ma trận 4x4 độ tin cậy 0-1)
+        """
+        results = self.recognize_cells_with_confidence(grid_cells)
+        board = [[results[i * 4 + j][0] for j in range(4)] for i in range(4)]
+        confidences = [[results[i * 4 + j][1] for j in range(4)] for i in range(4)]
+        return board, confidences
+    
+    def recognize_board(self, grid_cells):
+        """
+        Nhận diện toàn bộ bảng
+        
+        Returns:
+            list: Ma trận 4x4 các số
+        """
+        return self.recognize_board_with_confidence(grid_cells)[0]
+
+
+def evaluate(corpus_dir, repeats=3, holdout=CLASSIFIER_HOLDOUT):
+    """
+    So sánh TinyClassifier với Template Matching trên phần held-out của corpus có nhãn
+    (cùng cách chia với collect_training_data - không có mẫu nào đã dùng để train)
+    
+    Args:
+        corpus_dir (str): Thư mục corpus
+        repeats (int): Số lần chạy để đo thời gian
+        holdout (float): Tỉ lệ corpus giữ lại (phải giống lúc train)
+    
+    Returns:
+        dict: {tên: {'accuracy': tỉ lệ ô đúng trên held-out, 'ms_per_board': thời gian trung bình,
+                     'boards': số board held-out, 'corpus': tổng số board}}
+    """
+    from frame_corpus import load_corpus, split_corpus, split_cells
+    from template_recognizer import TemplateRecognizer
+    
+    samples = load_corpus(corpus_dir)
+    _, test = split_corpus(samples, holdout)
+    boards = [(split_cells(img), board) for _, img, board in test]
+    
+    results = {}
+    for name, recognizer in (('classifier', TinyClassifierRecognizer()), ('template', TemplateRecognizer())):
+        if not recognizer.enabled or not boards:
+            continue
+        correct = total = 0
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for cells, truth in boards:
+                predicted = recognizer.recognize_board(cells)
+                correct += sum(p == t for p_row, t_row in zip(predicted, truth) for p, t in zip(p_row, t_row))
+                total += 16
+        elapsed = time.perf_counter() - start
+        results[name] = {'accuracy': correct / total,
+                         'ms_per_board': elapsed / (repeats * len(boards)) * 1000,
+                         'boards': len(boards), 'corpus': len(samples)}
+    return results
+
+
+# CLI: train / eval
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'train'
+    
+    if command == 'train':
+        # python tiny_classifier.py train [corpus_dir]
+        corpus = sys.argv[2] if len(sys.argv) > 2 else None
+        cells, labels = collect_training_data(corpus_dir=corpus)
+        if len(labels) == 0:
+            print("❌ Không có dữ liệu train - hãy chạy calibration trước")
+            sys.exit(1)
+        
+        start = time.perf_counter()
+        model = TinyClassifier()
+        accuracy = model.fit(extract_features(cells), labels)
+        model.save()
+        print(f"✅ Đã train {len(labels)} mẫu / {len(model.classes)} lớp trong "
+              f"{time.perf_counter() - start:.1f}s (train accuracy {accuracy * 100:.1f}%)")
+        print(f"💾 Đã lưu model: {CLASSIFIER_FILE}")
+        
+        if corpus:
+            result = evaluate(corpus, repeats=1).get('classifier')
+            if result:
+                print(f"📊 Held-out: đúng {result['accuracy'] * 100:.1f}% trên "
+                      f"{result['boards']}/{result['corpus']} board")
+    
+    elif command == 'eval' and len(sys.argv) > 2:
+        # python tiny_classifier.py eval <corpus_dir>
+        results = evaluate(sys.argv[2])
+        if not results:
+            print(f"❌ Không có board held-out ({CLASSIFIER_HOLDOUT * 100:.0f}% corpus) để đánh giá")
+        for name, result in results.items():
+            print(f"   {name}: đúng {result['accuracy'] * 100:.1f}% trên held-out "
+                  f"{result['boards']}/{result['corpus']} board | {result['ms_per_board']:.2f}ms/board")
+    
+    else:
+        print("Cách dùng: python tiny_classifier.py train [corpus_dir] | eval <corpus_dir>")